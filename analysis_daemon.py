@@ -0,0 +1,485 @@
+# Resident analysis service: keeps patterns, workers and results warm and answers analyze requests over HTTP
+###########################################
+
+import os  # For file and directory operations
+import sys
+import json  # For requests and responses
+import time  # For request timing
+import socket  # For the Unix socket client
+import signal  # For stopping on SIGTERM
+import asyncio  # For serving many connections at once
+import argparse  # For command line options
+import tempfile  # For uploaded logs
+import http.client  # For the thin client
+from http import HTTPStatus  # For status lines
+from collections import OrderedDict  # For the in-memory result cache
+from contextlib import asynccontextmanager  # For admitting requests
+from concurrent.futures import ProcessPoolExecutor  # For scanning in warm worker processes
+from concurrent.futures.process import BrokenProcessPool  # For replacing the pool when a worker dies
+from urllib.parse import urlsplit, parse_qs, urlencode  # For request targets
+import yaml  # For reading config file
+import consts  # For constants
+from log_analysis import LogAnalysis, ReasonLimits  # Log analysis tools
+from analysis_result import AnalysisResult, render_report  # For rendering the requested format
+from result_cache import ResultCache  # For reusing results of unchanged logs
+from failure_groups import group_by_from_config  # For grouping every failure block
+import pattern_profiles  # For the configured pattern profiles
+
+CONTENT_TYPES = {
+    "text": "text/plain; charset=utf-8",
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "junit": "application/xml",
+}
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class RequestError(Exception):
+    """A request the daemon answers with an error status instead of a result."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _analyze_in_worker(log_path: str, reason_limits: ReasonLimits, group_by: str):
+    """Worker entry point: analyzes one log serially and returns its result as a dictionary."""
+    mm = LogAnalysis.open_log(log_path)
+    try:
+        return LogAnalysis.analyze(mm, log_path, 1, reason_limits, group_by).to_dict()
+    finally:
+        mm.close()
+
+
+class AnalysisDaemon:
+    """
+    Answers analyze requests for log paths or uploaded log bytes. Scans run in a pool of worker processes that
+    compiled the pattern profiles once, at most max_concurrent at a time, and at most max_queue more wait for one;
+    requests beyond that are turned away with 503 right away instead of piling up. Results of unchanged logs come
+    from memory or the result cache.
+    """
+
+    def __init__(self, config=None, max_concurrent: int = consts.DAEMON_DEFAULT_MAX_CONCURRENT,
+                 max_queue: int = consts.DAEMON_DEFAULT_MAX_QUEUE,
+                 max_upload_mb: float = consts.DAEMON_DEFAULT_MAX_UPLOAD_MB):
+        self.config = config or {}
+        self.reason_limits = ReasonLimits.from_config(self.config)
+        self.group_by = group_by_from_config(self.config)
+        self.result_cache = ResultCache.from_config(self.config)
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_upload_bytes = int(max_upload_mb * 1024 * 1024)
+        self.memory_cache = OrderedDict()
+        self.executor = None
+        self.slots = None
+        # Admitted requests, waiting or running, and the running ones
+        self.pending = 0
+        self.running = 0
+        self.counters = {'requests': 0, 'analyzed': 0, 'memory_hits': 0, 'cache_hits': 0, 'rejected': 0,
+                         'errors': 0, 'worker_restarts': 0}
+
+    @classmethod
+    def from_config(cls, config):
+        """Builds the daemon described by the daemon section of the config."""
+        daemon_config = (config or {}).get('daemon', {}) or {}
+        return cls(config, daemon_config.get('max_concurrent', consts.DAEMON_DEFAULT_MAX_CONCURRENT),
+                   daemon_config.get('max_queue', consts.DAEMON_DEFAULT_MAX_QUEUE),
+                   daemon_config.get('max_upload_mb', consts.DAEMON_DEFAULT_MAX_UPLOAD_MB))
+
+    def _start_executor(self):
+        """Starts the worker processes and returns the futures that finish once each has compiled the patterns."""
+        self.executor = ProcessPoolExecutor(max_workers=self.max_concurrent,
+                                            initializer=pattern_profiles.load_profiles, initargs=(self.config,))
+        return [self.executor.submit(pattern_profiles.fingerprint) for _ in range(self.max_concurrent)]
+
+    def start_workers(self):
+        """Starts the worker processes and waits until every one has compiled the patterns."""
+        for future in self._start_executor():
+            future.result()
+        self.slots = asyncio.Semaphore(self.max_concurrent)
+
+    async def _restart_workers(self, broken_executor):
+        """
+        Replaces a pool one of whose workers died (killed or out of memory), since a broken pool fails every
+        later request. The requests that saw it break at the same time restart it once.
+        """
+        if self.executor is not broken_executor:
+            return
+        broken_executor.shutdown(wait=False, cancel_futures=True)
+        self.counters['worker_restarts'] += 1
+        await asyncio.gather(*(asyncio.wrap_future(future) for future in self._start_executor()))
+
+    def stop_workers(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def _check_queue(self):
+        """Raises a 503 RequestError when every worker is busy and the queue is full."""
+        if self.pending >= self.max_concurrent + self.max_queue:
+            self.counters['rejected'] += 1
+            raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, "The analysis queue is full, retry later")
+
+    @asynccontextmanager
+    async def admitted(self):
+        """Admits one analysis into the queue, or raises a 503 RequestError when the queue is full."""
+        self._check_queue()
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def _run_in_worker(self, log_path: str, group_by: str):
+        async with self.slots:
+            self.running += 1
+            executor = self.executor
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    executor, _analyze_in_worker, log_path, self.reason_limits, group_by)
+            except BrokenProcessPool:
+                # The worker died, which is the daemon's problem, so the log can be sent again once it restarted
+                await self._restart_workers(executor)
+                raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, "An analysis worker stopped, retry later")
+            except Exception as e:
+                # An empty, unreadable or corrupt log is the client's problem, not the daemon's
+                raise RequestError(HTTPStatus.UNPROCESSABLE_ENTITY, str(e) or type(e).__name__)
+            finally:
+                self.running -= 1
+        self.counters['analyzed'] += 1
+        return result
+
+    def _remember(self, key, result):
+        self.memory_cache[key] = result
+        self.memory_cache.move_to_end(key)
+        while len(self.memory_cache) > consts.DAEMON_MEMORY_CACHE_ENTRIES:
+            self.memory_cache.popitem(last=False)
+
+    async def analyze_path(self, log_path: str, group_by: str):
+        """Returns the result dictionary of a log on disk, from memory, the result cache or a fresh scan."""
+        loop = asyncio.get_running_loop()
+        try:
+            stat = os.stat(log_path)
+        except OSError as e:
+            raise RequestError(HTTPStatus.NOT_FOUND, str(e))
+        # Patterns and reason limits are fixed for the daemon's lifetime, so the file and grouping identify results
+        key = (os.path.abspath(log_path), stat.st_size, stat.st_mtime_ns, group_by)
+        if key in self.memory_cache:
+            self.memory_cache.move_to_end(key)
+            self.counters['memory_hits'] += 1
+            return self.memory_cache[key]
+
+        # Cached results were grouped as configured, so other groupings are always scanned
+        use_result_cache = self.result_cache is not None and group_by == self.group_by
+        if use_result_cache:
+            entry = await loop.run_in_executor(None, self.result_cache.get, log_path)
+            if entry is not None:
+                self.counters['cache_hits'] += 1
+                self._remember(key, entry['result'])
+                return entry['result']
+
+        async with self.admitted():
+            result = await self._run_in_worker(log_path, group_by)
+        self._remember(key, result)
+        if use_result_cache:
+            await loop.run_in_executor(None, self.result_cache.put, log_path, AnalysisResult.from_dict(result))
+        return result
+
+    async def analyze_upload(self, reader: asyncio.StreamReader, content_length: int, name: str, group_by: str):
+        """Streams an uploaded log into a temporary file, analyzes it and deletes it."""
+        if content_length > self.max_upload_bytes:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                               f"Uploads are limited to {self.max_upload_bytes} bytes")
+        # Checked before the body is stored, so a full queue costs no disk and no scan
+        try:
+            self._check_queue()
+        except RequestError:
+            # Still read the body, clients that are sending it would otherwise never see the 503
+            remaining = content_length
+            while remaining and (data := await reader.read(min(remaining, UPLOAD_CHUNK_BYTES))):
+                remaining -= len(data)
+            raise
+        async with self.admitted():
+            # The name keeps its extension, which is all the reports show of an upload
+            with tempfile.NamedTemporaryFile(prefix=consts.DAEMON_UPLOAD_PREFIX, suffix="-" + os.path.basename(name),
+                                             delete=False) as upload:
+                try:
+                    remaining = content_length
+                    while remaining:
+                        data = await reader.read(min(remaining, UPLOAD_CHUNK_BYTES))
+                        if not data:
+                            raise RequestError(HTTPStatus.BAD_REQUEST, "The upload ended early")
+                        upload.write(data)
+                        remaining -= len(data)
+                    upload.close()
+                    result = await self._run_in_worker(upload.name, group_by)
+                finally:
+                    upload.close()
+                    os.remove(upload.name)
+        result['log_path'] = name
+        return result
+
+    def stats(self):
+        return dict(self.counters, pending=self.pending, running=self.running,
+                    workers=self.max_concurrent, max_queue=self.max_queue, cached_results=len(self.memory_cache))
+
+    async def route(self, method: str, target: str, headers, reader: asyncio.StreamReader):
+        """Answers one request and returns its status, content type, body and failure count."""
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if url.path == "/health":
+            return HTTPStatus.OK, CONTENT_TYPES["json"], json.dumps(dict(self.stats(), status="ok")), None
+        if url.path != "/analyze":
+            raise RequestError(HTTPStatus.NOT_FOUND, f"No such endpoint {url.path}, use /analyze or /health")
+        if method != "POST":
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "Send logs to /analyze with POST")
+        if 'content-length' not in headers:
+            raise RequestError(HTTPStatus.LENGTH_REQUIRED, "A Content-Length is required")
+        try:
+            content_length = int(headers['content-length'])
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "The Content-Length must be a non-negative number")
+
+        if headers.get('content-type', '').startswith("application/json"):
+            # A log on the daemon's disk: {"path": ..., "format": ..., "group_by": ...}
+            if content_length > consts.DAEMON_MAX_HEADER_BYTES:
+                raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "The request is too large")
+            try:
+                options = dict(query, **json.loads(await reader.readexactly(content_length)))
+                log_path = options['path']
+            except (ValueError, TypeError, KeyError):
+                raise RequestError(HTTPStatus.BAD_REQUEST, 'Expected a JSON object with a "path"')
+        else:
+            options = query
+            log_path = None
+
+        report_format = options.get('format', "json")
+        if report_format not in consts.REPORT_FORMATS:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"Unknown format {report_format}, use one of "
+                                                       f"{', '.join(consts.REPORT_FORMATS)}")
+        group_by = options.get('group_by', self.group_by)
+        if group_by in ("", "none"):
+            group_by = None
+        elif group_by is not None and group_by not in consts.GROUP_SIGNATURES:
+            raise RequestError(HTTPStatus.BAD_REQUEST, consts.UNKNOWN_GROUP_SIGNATURE_MESSAGE.format(group_by))
+
+        if log_path is not None:
+            result = await self.analyze_path(log_path, group_by)
+        else:
+            result = await self.analyze_upload(reader, content_length, options.get('name', "upload.log"), group_by)
+
+        if report_format == "json":
+            return HTTPStatus.OK, CONTENT_TYPES["json"], json.dumps(result), result['failure_count']
+        # Rendering long reports would stall every other connection, so it runs in a thread
+        body = await asyncio.get_running_loop().run_in_executor(None, render_report,
+                                                                AnalysisResult.from_dict(result), report_format)
+        return HTTPStatus.OK, CONTENT_TYPES[report_format], body, result['failure_count']
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Reads one HTTP request, answers it and closes the connection."""
+        started = time.perf_counter()
+        method = target = "-"
+        failure_count = None
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.LimitOverrunError:
+                raise RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "The request head is too large")
+            request_line, *header_lines = head.decode('latin-1').split("\r\n")
+            try:
+                method, target, _ = request_line.split(" ", 2)
+            except ValueError:
+                raise RequestError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            self.counters['requests'] += 1
+            status, content_type, body, failure_count = await self.route(method, target, headers, reader)
+        except asyncio.IncompleteReadError:
+            # The client went away before sending a whole request
+            writer.close()
+            return
+        except RequestError as e:
+            status, content_type, body = e.status, CONTENT_TYPES["json"], json.dumps({'error': str(e)})
+        except Exception as e:
+            self.counters['errors'] += 1
+            status, content_type, body = HTTPStatus.INTERNAL_SERVER_ERROR, CONTENT_TYPES["json"], \
+                json.dumps({'error': str(e)})
+
+        body = body.encode('utf-8')
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}", "Connection: close"]
+        if failure_count is not None:
+            head.append(f"X-Failure-Count: {failure_count}")
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            head.append(f"Retry-After: {consts.DAEMON_RETRY_AFTER_SECONDS}")
+        try:
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+        print(consts.DAEMON_REQUEST_LINE.format(method, target, status.value, time.perf_counter() - started),
+              flush=True)
+
+    async def serve(self, host: str = consts.DAEMON_DEFAULT_HOST, port: int = consts.DAEMON_DEFAULT_PORT,
+                    unix_socket: str = None, ready_callback=None):
+        """Serves on a Unix socket when unix_socket is given, otherwise on host:port, until SIGINT or SIGTERM."""
+        self.start_workers()
+        try:
+            if unix_socket:
+                # A socket left behind by a daemon that did not stop cleanly
+                if os.path.exists(unix_socket):
+                    os.remove(unix_socket)
+                server = await asyncio.start_unix_server(self.handle_connection, unix_socket,
+                                                         limit=consts.DAEMON_MAX_HEADER_BYTES)
+                address = unix_socket
+            else:
+                server = await asyncio.start_server(self.handle_connection, host, port,
+                                                    limit=consts.DAEMON_MAX_HEADER_BYTES)
+                address = "http://{}:{}".format(*server.sockets[0].getsockname()[:2])
+
+            stopped = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(signal_number, stopped.set)
+                except (NotImplementedError, RuntimeError):
+                    # Windows, or not the main thread, where Ctrl+C still raises KeyboardInterrupt
+                    pass
+            print(consts.DAEMON_LISTENING_MESSAGE.format(address, self.max_concurrent, self.max_queue), flush=True)
+            if ready_callback is not None:
+                ready_callback(address)
+            async with server:
+                await stopped.wait()
+        finally:
+            self.stop_workers()
+            if unix_socket and os.path.exists(unix_socket):
+                os.remove(unix_socket)
+        print(consts.DAEMON_STOPPED_MESSAGE.format(self.counters['requests']))
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a Unix socket."""
+
+    def __init__(self, socket_path: str, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request_analysis(address: str, log_path: str, report_format: str = "json", upload: bool = False,
+                     group_by: str = None, timeout: float = None):
+    """
+    Asks the daemon at address (http://host:port or a Unix socket path) to analyze log_path, which it reads
+    itself unless upload is set. Returns the status, the failure count (None on errors) and the response body.
+    """
+    if address.startswith("http://"):
+        url = urlsplit(address)
+        connection = http.client.HTTPConnection(url.hostname, url.port, timeout=timeout)
+    else:
+        connection = _UnixHTTPConnection(address, timeout)
+    options = {'format': report_format}
+    if group_by is not None:
+        options['group_by'] = group_by
+    try:
+        if upload:
+            options['name'] = os.path.basename(log_path)
+            with open(log_path, 'rb') as log:
+                try:
+                    connection.request("POST", "/analyze?" + urlencode(options),
+                                       body=log, headers={'Content-Type': "application/octet-stream",
+                                                          'Content-Length': str(os.path.getsize(log_path))})
+                except BrokenPipeError:
+                    # The daemon answered, with 413, before reading the whole upload
+                    pass
+                response = connection.getresponse()
+        else:
+            connection.request("POST", "/analyze", body=json.dumps(dict(options, path=os.path.abspath(log_path))),
+                               headers={'Content-Type': "application/json"})
+            response = connection.getresponse()
+        body = response.read().decode('utf-8')
+        failure_count = response.getheader('X-Failure-Count')
+        return response.status, int(failure_count) if failure_count is not None else None, body
+    finally:
+        connection.close()
+
+
+def daemon_address_from_config(config) -> str:
+    """Returns the configured Unix socket path, or the http:// address of the configured host and port."""
+    daemon_config = (config or {}).get('daemon', {}) or {}
+    if daemon_config.get('unix_socket'):
+        return daemon_config['unix_socket']
+    return f"http://{daemon_config.get('host') or consts.DAEMON_DEFAULT_HOST}:" \
+           f"{daemon_config.get('port') or consts.DAEMON_DEFAULT_PORT}"
+
+
+def main_run_daemon_version(daemon_config, argv=None) -> int:
+    """Serves analyze requests, or with --analyze sends one to a running daemon and returns the exit code."""
+    parser = argparse.ArgumentParser(description="Serve log analysis over HTTP on localhost or a Unix socket, or "
+                                                 "ask a running daemon to analyze logs with --analyze.")
+    parser.add_argument("--host", help="Address to listen on, 127.0.0.1 by default")
+    parser.add_argument("--port", type=int, help="Port to listen on, 8765 by default")
+    parser.add_argument("--unix-socket", help="Listen on this Unix socket instead of a port")
+    parser.add_argument("--max-concurrent", type=int, help="Analyses running at once, one worker process each")
+    parser.add_argument("--max-queue", type=int, help="Analyses waiting for a worker before 503 is returned")
+    parser.add_argument("--analyze", nargs="+", metavar="LOG", help="Send these logs to a running daemon instead")
+    parser.add_argument("--upload", action="store_true", help="With --analyze, upload the logs instead of sending "
+                                                              "their paths")
+    parser.add_argument("-f", "--format", choices=list(consts.REPORT_FORMATS), default="text",
+                        help="With --analyze, the format of the printed reports")
+    args = parser.parse_args(argv)
+
+    daemon_config = dict(daemon_config or {})
+    daemon_config['daemon'] = dict(daemon_config.get('daemon') or {}, **{
+        name: value for name, value in (('host', args.host), ('port', args.port), ('unix_socket', args.unix_socket),
+                                        ('max_concurrent', args.max_concurrent), ('max_queue', args.max_queue))
+        if value is not None})
+
+    if args.analyze:
+        # Thin client, the exit code follows the headless command line
+        address = daemon_address_from_config(daemon_config)
+        exit_code = consts.HEADLESS_EXIT_OK
+        for log_path in args.analyze:
+            try:
+                status, failure_count, body = request_analysis(address, log_path, args.format, args.upload)
+            except OSError as e:
+                status, failure_count, body = None, None, str(e)
+            if status != HTTPStatus.OK:
+                print(consts.HEADLESS_LOG_ERROR_MESSAGE.format(log_path, body.strip()), file=sys.stderr)
+                exit_code = consts.HEADLESS_EXIT_ERROR
+                continue
+            sys.stdout.write(body)
+            if failure_count and exit_code == consts.HEADLESS_EXIT_OK:
+                exit_code = consts.HEADLESS_EXIT_FAILURES
+        return exit_code
+
+    pattern_profiles.load_profiles(daemon_config)
+    daemon = AnalysisDaemon.from_config(daemon_config)
+    try:
+        asyncio.run(daemon.serve(daemon_config['daemon'].get('host') or consts.DAEMON_DEFAULT_HOST,
+                                 daemon_config['daemon'].get('port') or consts.DAEMON_DEFAULT_PORT,
+                                 daemon_config['daemon'].get('unix_socket')))
+    except KeyboardInterrupt:
+        pass
+    return consts.HEADLESS_EXIT_OK
+
+
+if __name__ == "__main__":
+    try:
+        with open('config.yaml', 'r') as file:
+            config = yaml.safe_load(file)
+    except FileNotFoundError:
+        config = None
+
+    sys.exit(main_run_daemon_version(config))
@@ -0,0 +1,285 @@
+# Structured analysis results and the renderers that turn them into reports
+###########################################
+
+import io  # For rendering into strings
+import os  # For the names of JUnit test suites
+import re  # For removing characters XML cannot hold
+import json  # For the machine readable formats
+import consts  # For constants
+import utilities as utils  # For utils
+from failure_groups import FailureGroup  # For grouped results
+from failure_specs import parse_failure_spec  # For the suite, spec, error and frames of a failure
+
+
+class FailureBlock:
+    """
+    One reported failure: its fail count, reason lines and where it was found in the log. Reasons captured from
+    a log are kept as the raw bytes of their range and only decoded when reason_lines is first read.
+    """
+    __slots__ = ('fail_count', 'offset', 'line_number', 'reason_offset', 'reason_line_number', 'end_offset',
+                 'reason_end_offset', 'decode_errors', '_reason_lines', '_reason_raw', '_reason_head_end',
+                 '_reason_body_start', '_spec')
+    # What to_dict and from_dict carry
+    FIELDS = ('fail_count', 'reason_lines', 'offset', 'line_number', 'reason_offset', 'reason_line_number',
+              'end_offset', 'reason_end_offset')
+
+    def __init__(self, fail_count, reason_lines=None, offset=-1, line_number=0, reason_offset=-1,
+                 reason_line_number=0, end_offset=-1, reason_end_offset=-1):
+        self.fail_count = fail_count
+        self._reason_lines = reason_lines if reason_lines is not None else []
+        self._reason_raw = None
+        # Byte offset and 1-based line number of the failed match
+        self.offset = offset
+        self.line_number = line_number
+        # Byte offset and line number of the first reason line, -1 and 0 when there is none
+        self.reason_offset = reason_offset
+        self.reason_line_number = reason_line_number
+        # Byte offset where scanning resumed after the reason block
+        self.end_offset = end_offset
+        # Byte offset after the last captured reason line
+        self.reason_end_offset = reason_end_offset
+        self.decode_errors = 'strict'
+        self._spec = None
+
+    def capture_reasons(self, buffer, reason_range, decode_errors='strict', base=0):
+        """
+        Keeps the reason block found in buffer without decoding it. reason_range is the (start, head end,
+        body start, end) offsets from _extract_reasons, where the head is the matched part of the first line and
+        the body the lines after it; base is the offset of buffer in the log.
+        """
+        start, head_end, body_start, end = reason_range
+        if start < 0:
+            self._reason_lines = []
+            return
+        self._reason_raw = buffer[start:end]
+        self._reason_head_end = head_end - start
+        self._reason_body_start = body_start - start
+        self._reason_lines = None
+        self.decode_errors = decode_errors
+        self.reason_offset = base + start
+        self.reason_end_offset = base + end
+
+    @property
+    def reason_lines(self):
+        if self._reason_lines is None:
+            raw = self._reason_raw
+            # Only newlines split lines, like the log is read, and each line keeps its own
+            body = raw[self._reason_body_start:].decode('utf-8', self.decode_errors).split("\n")
+            self._reason_lines = [raw[:self._reason_head_end].decode('utf-8', self.decode_errors)]
+            self._reason_lines += [line + "\n" for line in body[:-1]]
+            if body[-1]:
+                self._reason_lines.append(body[-1])
+            self._reason_raw = None
+        return self._reason_lines
+
+    @reason_lines.setter
+    def reason_lines(self, reason_lines):
+        self._reason_lines = reason_lines
+        self._reason_raw = None
+        self._spec = None
+
+    @property
+    def spec(self):
+        """The FailureSpec of the reason lines, parsed when first read."""
+        if self._spec is None:
+            self._spec = parse_failure_spec(self.reason_lines)
+        return self._spec
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+
+class AnalysisResult:
+    """
+    The failure blocks found in one log, in file order. A grouped result has a FailureGroup per block, whose
+    block is the first of its group.
+    """
+    __slots__ = ('log_path', 'blocks', 'report_path', 'groups')
+
+    def __init__(self, log_path=None, blocks=None, report_path=None, groups=None):
+        self.log_path = log_path
+        self.blocks = blocks if blocks is not None else []
+        self.report_path = report_path
+        self.groups = groups
+
+    @property
+    def failure_count(self):
+        return len(self.blocks)
+
+    def filtered(self, ordinals):
+        """Returns a result holding only the blocks at ordinals, with their groups."""
+        blocks = [self.blocks[ordinal] for ordinal in ordinals]
+        groups = [self.groups[ordinal] for ordinal in ordinals] if self.groups is not None else None
+        return AnalysisResult(self.log_path, blocks, self.report_path, groups)
+
+    def to_dict(self):
+        result = {
+            'log_path': self.log_path,
+            'failure_count': self.failure_count,
+            'failures': [block.to_dict() for block in self.blocks],
+        }
+        if self.groups is not None:
+            # In the same order as the failures
+            result['groups'] = [group.to_dict() for group in self.groups]
+        return result
+
+    @classmethod
+    def from_dict(cls, data, report_path=None):
+        blocks = [FailureBlock.from_dict(block) for block in data['failures']]
+        groups = None
+        if 'groups' in data:
+            groups = [FailureGroup.from_dict(group, block) for group, block in zip(data['groups'], blocks)]
+        return cls(data.get('log_path'), blocks, report_path, groups)
+
+
+def write_failure_block_text(file, block: FailureBlock, group: FailureGroup = None):
+    """Writes one failure block with its reason lines in the text report format, and its group's occurrences"""
+    utils.insert_line_separator_in_file(file, True, 2)
+    # Write the fail count to the file
+    file.write(f"{block.fail_count}{consts.FAILED_MESSAGE}\n")
+    if group is not None:
+        file.write(consts.TAB_INDENT + consts.GROUP_OCCURRENCES_MESSAGE.format(
+            group.count, block.line_number, group.last_line_number, group.last_fail_count) + "\n")
+    # Write each reason line to the file with a tab indentation
+    for reason in block.reason_lines:
+        file.write(f"{consts.TAB_INDENT}{reason}\n")
+
+
+def write_text_blocks(blocks, file, groups=None) -> int:
+    """
+    Writes blocks in the text report format as they arrive and returns how many were written. groups, when
+    given, has the group of each block in the same order.
+    """
+    failure_count = 0
+    for block, group in zip(blocks, groups) if groups is not None else ((block, None) for block in blocks):
+        write_failure_block_text(file, block, group)
+        failure_count += 1
+    if not failure_count:
+        utils.write_no_errors_message_to_file(file)
+    return failure_count
+
+
+def write_text_report(result: AnalysisResult, file):
+    """Writes the classic text report."""
+    write_text_blocks(result.blocks, file, result.groups)
+
+
+def write_json_report(result: AnalysisResult, file):
+    """Writes the whole result as a single JSON document."""
+    json.dump(result.to_dict(), file)
+    file.write("\n")
+
+
+def write_ndjson_report(blocks, file, groups=None):
+    """
+    Writes one JSON object per failure block and line, flushing each so readers can stream them. With groups
+    every object also has its group under "group".
+    """
+    for idx, block in enumerate(blocks):
+        block_dict = block.to_dict()
+        if groups is not None:
+            block_dict['group'] = groups[idx].to_dict()
+        file.write(json.dumps(block_dict) + "\n")
+        file.flush()
+
+
+# Control characters (ANSI colors and the like) are not allowed in XML 1.0
+_XML_INVALID_CHARACTERS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def _xml_text(text: str) -> str:
+    # xml.sax imports urllib, so only the JUnit format pays for it
+    from xml.sax.saxutils import escape
+    return escape(_XML_INVALID_CHARACTERS.sub('', text))
+
+
+def _xml_attribute(text: str) -> str:
+    from xml.sax.saxutils import quoteattr
+    return quoteattr(_XML_INVALID_CHARACTERS.sub('', text))
+
+
+def write_junit_header(file):
+    file.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n')
+
+
+def write_junit_footer(file):
+    file.write('</testsuites>\n')
+
+
+def write_junit_testsuite(result: AnalysisResult, file, error: str = None):
+    """
+    Writes the result as one JUnit testsuite named after the log, with a failed testcase per failure block. The
+    testcase is named by the first reason line and its failure message is the first line after it. A log that
+    could not be analyzed is a testsuite with one error.
+    """
+    name = os.path.basename(result.log_path or "log")
+    file.write(f'  <testsuite name={_xml_attribute(name)} tests="{max(1, result.failure_count)}" '
+               f'failures="{result.failure_count}" errors="{1 if error else 0}">\n')
+    if error:
+        file.write(f'    <testcase name={_xml_attribute(name)} classname={_xml_attribute(name)}>'
+                   f'<error message={_xml_attribute(error)}/></testcase>\n')
+    elif not result.blocks:
+        file.write(f'    <testcase name={_xml_attribute(name)} classname={_xml_attribute(name)}/>\n')
+    groups = result.groups if result.groups is not None else [None] * len(result.blocks)
+    for block, group in zip(result.blocks, groups):
+        reason_lines = block.reason_lines
+        spec = reason_lines[0].strip() if reason_lines else f"{block.fail_count}{consts.FAILED_MESSAGE}"
+        message = next((line.strip() for line in reason_lines[1:] if line.strip()), spec)
+        body = "".join(line if line.endswith("\n") else line + "\n" for line in reason_lines)
+        if group is not None:
+            body = consts.GROUP_OCCURRENCES_MESSAGE.format(group.count, block.line_number, group.last_line_number,
+                                                           group.last_fail_count) + "\n" + body
+        file.write(f'    <testcase name={_xml_attribute(spec)} classname={_xml_attribute(name)}>\n'
+                   f'      <failure message={_xml_attribute(message)} type="{block.fail_count} FAILED">'
+                   f'{_xml_text(body)}</failure>\n    </testcase>\n')
+    file.write('  </testsuite>\n')
+
+
+def write_junit_report(result: AnalysisResult, file):
+    """Writes the result as a JUnit XML document, which CI servers show as failed tests."""
+    write_junit_header(file)
+    write_junit_testsuite(result, file)
+    write_junit_footer(file)
+
+
+def render_failure_block(block: FailureBlock) -> str:
+    """Returns one failure block in the text report format."""
+    buffer = io.StringIO()
+    write_failure_block_text(buffer, block)
+    return buffer.getvalue()
+
+
+def render_text(result: AnalysisResult) -> str:
+    """Returns the text report as a string."""
+    buffer = io.StringIO()
+    write_text_report(result, buffer)
+    return buffer.getvalue()
+
+
+def write_report_to_file(result: AnalysisResult, file, report_format: str = "text"):
+    """Writes the result to an open file object in one of consts.REPORT_FORMATS."""
+    if report_format == "json":
+        write_json_report(result, file)
+    elif report_format == "ndjson":
+        write_ndjson_report(result.blocks, file, result.groups)
+    elif report_format == "junit":
+        write_junit_report(result, file)
+    else:
+        write_text_report(result, file)
+
+
+def render_report(result: AnalysisResult, report_format: str = "text") -> str:
+    """Returns the report in one of consts.REPORT_FORMATS as a string."""
+    buffer = io.StringIO()
+    write_report_to_file(result, buffer, report_format)
+    return buffer.getvalue()
+
+
+def write_report(result: AnalysisResult, report_path: str, report_format: str = "text"):
+    """Writes the result to report_path in one of consts.REPORT_FORMATS."""
+    with open(report_path, 'w') as file:
+        write_report_to_file(result, file, report_format)
@@ -0,0 +1,163 @@
+import threading
+import time
+from PyQt5.QtCore import QThread, pyqtSignal
+import consts
+from log_analysis import LogAnalysis
+from analysis_result import render_failure_block
+from instrumentation import timed
+from failure_diff import diff_logs
+from line_index import LineIndex, iter_log_matches
+from failure_specs import FailureSpecIndex
+
+
+class AnalysisWorker(QThread):
+    """Runs LogAnalysis.analyze_log off the GUI thread, reporting progress and failures through signals."""
+    # Percentage of the log scanned so far
+    progress = pyqtSignal(int)
+    # Text of each failure block as soon as it is found
+    failure_found = pyqtSignal(str)
+    # The finished AnalysisResult
+    analysis_finished = pyqtSignal(object)
+    analysis_cancelled = pyqtSignal()
+    analysis_failed = pyqtSignal(str)
+
+    def __init__(self, log_path, create_report_path, workers=1, result_cache=None, report_format="text",
+                 reason_limits=None, group_by=None, instrumentation=None, source_maps=None, parent=None):
+        super().__init__(parent)
+        self.log_path = log_path
+        self.create_report_path = create_report_path
+        self.workers = workers
+        self.result_cache = result_cache
+        self.report_format = report_format
+        self.reason_limits = reason_limits
+        self.group_by = group_by
+        # Started and stopped on the worker thread, which is the one a profiler has to run on
+        self.instrumentation = instrumentation
+        self.source_maps = source_maps
+        self.cancel_event = threading.Event()
+        # Line index of the analyzed log, for jumping from a failure to where it was found
+        self.line_index = None
+        # Suite, spec, error and file index of the found failures, for filtering them in the window
+        self.spec_index = None
+        self._file_size = 0
+        self._last_percent = -1
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        if self.instrumentation is not None:
+            self.instrumentation.start(self.log_path)
+        try:
+            with timed(self.instrumentation, 'open'):
+                mm = LogAnalysis.open_log(self.log_path)
+            try:
+                self._file_size = len(mm)
+                result = LogAnalysis.analyze_log(mm, self.log_path, self.create_report_path, self.workers,
+                                                 self.result_cache, self.report_format, self.cancel_event,
+                                                 self._report_progress, self._report_failure, self.reason_limits,
+                                                 self.group_by, self.instrumentation, self.source_maps)
+            finally:
+                # The GUI keeps running after a failed analysis, so the log must not stay open
+                mm.close()
+            if result is not None:
+                self._load_line_index()
+                with timed(self.instrumentation, 'index'):
+                    self.spec_index = FailureSpecIndex(result.blocks)
+        except Exception as e:
+            self.analysis_failed.emit(str(e))
+            return
+        finally:
+            if self.instrumentation is not None:
+                self.instrumentation.stop()
+
+        if result is None:
+            self.analysis_cancelled.emit()
+        else:
+            self.analysis_finished.emit(result)
+
+    def _load_line_index(self):
+        """Loads or builds the line index while the log is still in the page cache, it is optional."""
+        try:
+            with timed(self.instrumentation, 'index'):
+                self.line_index = LineIndex.for_log(self.log_path)
+        except (OSError, ValueError):
+            self.line_index = None
+
+    def _report_progress(self, scanned_bytes):
+        # Only emit when the percentage changes so the GUI thread is not flooded with signals
+        percent = 100 if not self._file_size else min(100, scanned_bytes * 100 // self._file_size)
+        if percent != self._last_percent:
+            self._last_percent = percent
+            self.progress.emit(percent)
+
+    def _report_failure(self, block):
+        self.failure_found.emit(render_failure_block(block))
+
+
+class DiffWorker(QThread):
+    """Runs failure_diff.diff_logs off the GUI thread, both logs being scanned at the same time."""
+    # The finished FailureDiff
+    diff_finished = pyqtSignal(object)
+    diff_failed = pyqtSignal(str)
+
+    def __init__(self, base_path, head_path, reason_limits=None, group_by=None, config=None, parent=None):
+        super().__init__(parent)
+        self.base_path = base_path
+        self.head_path = head_path
+        self.reason_limits = reason_limits
+        self.group_by = group_by
+        self.config = config
+
+    def run(self):
+        try:
+            diff = diff_logs(self.base_path, self.head_path, self.reason_limits, self.group_by, config=self.config)
+        except Exception as e:
+            self.diff_failed.emit(str(e))
+            return
+        self.diff_finished.emit(diff)
+
+
+class SearchWorker(QThread):
+    """Searches a raw log off the GUI thread, sending the matching lines in batches as they are found."""
+    # [(line number, line text)] found since the last batch
+    matches_found = pyqtSignal(list)
+    # How many lines matched and whether the search stopped at max_results
+    search_finished = pyqtSignal(int, bool)
+    search_failed = pyqtSignal(str)
+
+    def __init__(self, log_path, pattern, max_results=consts.SEARCH_MAX_RESULTS, parent=None):
+        super().__init__(parent)
+        self.log_path = log_path
+        self.pattern = pattern
+        self.max_results = max_results
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        found = 0
+        try:
+            mm = LogAnalysis.open_log(self.log_path)
+            try:
+                batch = []
+                sent = time.perf_counter()
+                for line_number, _, text in iter_log_matches(mm, self.pattern, self.cancel_event, self.max_results):
+                    batch.append((line_number, text))
+                    found += 1
+                    # Batches keep the GUI thread from being flooded with one signal per line
+                    if len(batch) >= consts.SEARCH_BATCH_SIZE or \
+                            time.perf_counter() - sent >= consts.SEARCH_BATCH_SECONDS:
+                        self.matches_found.emit(batch)
+                        batch = []
+                        sent = time.perf_counter()
+                if batch:
+                    self.matches_found.emit(batch)
+            finally:
+                mm.close()
+        except Exception as e:
+            self.search_failed.emit(str(e))
+            return
+        if not self.cancel_event.is_set():
+            self.search_finished.emit(found, found == self.max_results)
@@ -0,0 +1,131 @@
+# Analyzes every log in a directory concurrently and writes one consolidated report
+###########################################
+
+import os  # For file and directory operations
+import sys
+import tempfile  # For the default report location
+import shutil  # For copying per file reports into the batch report
+import time  # For per file wall-clock timing
+from concurrent.futures import ProcessPoolExecutor  # For analyzing files concurrently
+import yaml  # For reading config file
+import consts  # For constants
+import utilities as utils  # For utils
+from log_analysis import LogAnalysis, ReasonLimits, resolve_worker_count  # Log analysis tools
+import pattern_profiles  # For the configured pattern profiles
+from failure_groups import group_by_from_config  # For grouping every failure block
+
+
+def analyze_log_file(log_path: str, report_path: str, reason_limits=None, group_by=None):
+    """Analyzes one log into report_path and returns a result dictionary with the count and timing."""
+    started = time.perf_counter()
+    result = {'log_path': log_path, 'report_path': report_path, 'failures': 0, 'error': None}
+    try:
+        # Compressed logs are streamed instead of memory-mapped
+        mm = LogAnalysis.open_log(log_path)
+        try:
+            result['failures'] = LogAnalysis.extract_failed_test_cases(mm, report_path, reason_limits=reason_limits,
+                                                                       group_by=group_by)
+        finally:
+            # Pool workers live for the whole batch, so a failed log must not keep its file open
+            mm.close()
+    except Exception as e:
+        # Empty or unreadable logs are reported instead of stopping the batch
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def _write_batch_report(report_path: str, results, wall_clock: float):
+    """Writes the totals, a line per file and every per-file report into one merged report."""
+    files_with_failures = sum(1 for result in results if result['failures'])
+    total_failures = sum(result['failures'] for result in results)
+    errors = sum(1 for result in results if result['error'])
+
+    with open(report_path, 'w') as report:
+        utils.insert_line_separator_in_file(report, True, 1)
+        report.write(f"{consts.BATCH_SUMMARY_HEADER}\n")
+        report.write(consts.BATCH_TOTALS_MESSAGE.format(len(results), files_with_failures, total_failures,
+                                                        errors, wall_clock) + "\n")
+        utils.insert_line_separator_in_file(report, True, 1)
+        for result in results:
+            report.write(_format_result_line(result) + "\n")
+
+        # Append every per-file report after its own header
+        for result in results:
+            report.write("\n")
+            utils.insert_line_separator_in_file(report, True, 1)
+            report.write(consts.BATCH_FILE_HEADER.format(os.path.basename(result['log_path'])) + "\n")
+            report.write(_format_result_line(result) + "\n")
+            if not result['error']:
+                with open(result['report_path'], 'r') as file_report:
+                    shutil.copyfileobj(file_report, report)
+
+
+def _format_result_line(result) -> str:
+    error = consts.BATCH_FILE_ERROR.format(result['error']) if result['error'] else ""
+    return consts.BATCH_FILE_LINE.format(os.path.basename(result['log_path']), result['failures'],
+                                         result['seconds'], error)
+
+
+def run_batch(log_directory: str, report_root: str, workers: int = 0, config=None) -> str:
+    """
+    Analyzes every log in log_directory with a process pool and returns the merged report path. Each log is
+    analyzed with its own detected pattern profile, so logs of different runners can share a directory.
+    """
+    files = [f for f in LogAnalysis.get_files_from_dir(log_directory, False)
+             if f not in consts.MACOS_SYSTEM_FILES]
+
+    # Keep the per-file reports and the merged one together in a fresh directory
+    batch_directory = utils.create_unique_filename(report_root, prefix=consts.BATCH_DIRECTORY_PREFIX, suffix="")
+    os.makedirs(batch_directory)
+    log_paths = [os.path.join(log_directory, f) for f in files]
+    report_paths = [os.path.join(batch_directory, f + consts.BATCH_FILE_REPORT_SUFFIX) for f in files]
+
+    started = time.perf_counter()
+    results = []
+    # Workers compile the configured profiles once when they start
+    with ProcessPoolExecutor(max_workers=resolve_worker_count(workers), initializer=pattern_profiles.load_profiles,
+                             initargs=(config,)) as executor:
+        # Results come back in directory order so the merged report is stable between runs
+        for result in executor.map(analyze_log_file, log_paths, report_paths,
+                                   [ReasonLimits.from_config(config)] * len(log_paths),
+                                   [group_by_from_config(config)] * len(log_paths)):
+            print(_format_result_line(result))
+            results.append(result)
+    wall_clock = time.perf_counter() - started
+
+    batch_report_path = os.path.join(batch_directory, consts.BATCH_REPORT_NAME)
+    _write_batch_report(batch_report_path, results, wall_clock)
+    return batch_report_path
+
+
+def main_run_batch_version(batch_config, log_directory=None):
+    """Runs a batch without any prompts, using log_directory or the configured log location."""
+    batch_config = batch_config or {}
+    log_directory = log_directory or batch_config.get('log_location', {}).get('where_are_your_logs_located')
+    use_temp_file = batch_config.get('file_handling', {}).get('use_temp_file', True)
+    report_directory = batch_config.get('file_handling', {}).get('report_directory')
+    analysis_workers = batch_config.get('performance', {}).get('analysis_workers', 0)
+
+    if not log_directory:
+        print(consts.NO_LOG_DIRECTORY_MESSAGE)
+        sys.exit(2)
+
+    report_root = tempfile.gettempdir() if use_temp_file or not report_directory else report_directory
+    if not os.path.exists(report_root):
+        os.makedirs(report_root)
+
+    pattern_profiles.load_profiles(batch_config)
+    batch_report_path = run_batch(log_directory, report_root, analysis_workers, batch_config)
+    print(consts.BATCH_REPORT_WRITTEN_MESSAGE.format(batch_report_path))
+    return batch_report_path
+
+
+if __name__ == "__main__":
+    try:
+        with open('config.yaml', 'r') as file:
+            config = yaml.safe_load(file)
+    except FileNotFoundError:
+        config = None
+
+    main_run_batch_version(config, sys.argv[1] if len(sys.argv) > 1 else None)
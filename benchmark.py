@@ -0,0 +1,527 @@
+# Benchmarks the failure scanner and the report lexer against their previous implementations
+###########################################
+
+import sys
+import json  # For the baseline file
+import platform  # For describing the machine in the baseline
+import argparse  # For command line options
+import multiprocessing  # For measuring every benchmark in a fresh process
+from concurrent.futures import ProcessPoolExecutor  # For running a benchmark in a fresh process
+import filecmp  # For comparing the produced reports
+import gzip  # For the compressed benchmark
+import lzma  # For the compressed benchmark
+import shutil  # For copying decompressed streams
+import subprocess  # For timing cold starts
+import mmap  # For memory-mapped file objects
+import os  # For file and directory operations
+import re  # For the legacy reason pattern
+import tempfile  # For the synthetic logs and reports
+import time  # For timing
+import consts
+import log_analysis
+import utilities as utils
+import pattern_profiles  # For the Jest profile of the boundary check
+from log_analysis import LogAnalysis, LogFollower
+from analysis_result import AnalysisResult, FailureBlock, render_text, write_report
+from log_generator import generate_karma_log
+from compressed_log import CompressedLog, zstandard
+
+from instrumentation import peak_rss_mb  # For the memory high-water mark of each benchmark
+
+MEGABYTE = 1024 * 1024
+DEFAULT_SIZES_MB = [10, 100, 1024]
+# Suite defaults, small enough to run on every change
+SUITE_SIZES_MB = [10, 100]
+SUITE_DIRECTORY_FILES = 5000
+SUITE_LEXER_LINES = 100000
+# Entry points whose cold start is timed, python itself being the floor
+STARTUP_MODULES = ["headless_cli", "batch_analysis", "main"]
+# Slow imports only the GUI, parallel scans or JUnit reports need, which no entry point should load up front
+DEFERRED_MODULES = ["PyQt5", "ruamel.yaml", "concurrent.futures.process", "xml.sax.saxutils", "sqlite3"]
+# A benchmark regresses when it is this much slower, or uses this much more memory, than the baseline
+DEFAULT_TOLERANCE = 0.15
+# Timings shorter than this are too noisy to call a regression
+MIN_COMPARED_SECONDS = 0.01
+BASELINE_VERSION = 1
+
+
+def legacy_extract_failed_test_cases(mm, temp_file_path):
+    """The original readline loop, kept as the reference the scanner must match byte for byte."""
+    failed_pattern = log_analysis._get_failed_pattern()
+    reason_pattern = re.compile(consts.REASON_PATTERN)
+    end_reason_pattern = log_analysis._get_end_of_reason_pattern()
+    seen_fail_counts = set()
+    with open(temp_file_path, 'w') as temp:
+        mm.seek(0)
+        for line in iter(mm.readline, b""):
+            failed_match = failed_pattern.search(line)
+            if failed_match:
+                fail_count = int(failed_match.group(1))
+                if fail_count not in seen_fail_counts:
+                    reason_lines = []
+                    found_start = False
+                    for reason_line in iter(mm.readline, b""):
+                        line_str = reason_line.decode('utf-8')
+                        if not found_start:
+                            start_match = reason_pattern.match(reason_line)
+                            if start_match:
+                                reason_lines.append(start_match.group(1).decode('utf-8'))
+                                found_start = True
+                            continue
+                        if end_reason_pattern.match(reason_line):
+                            break
+                        reason_lines.append(line_str)
+                        if len(reason_lines) == 20:
+                            break
+                    utils.insert_line_separator_in_file(temp, True, 2)
+                    temp.write(f"{fail_count}{consts.FAILED_MESSAGE}\n")
+                    for reason in reason_lines:
+                        temp.write(f"{consts.TAB_INDENT}{reason}\n")
+                    seen_fail_counts.add(fail_count)
+        if not seen_fail_counts:
+            utils.write_no_errors_message_to_file(temp)
+        mm.close()
+
+
+def _time_extraction(extract, log_path, report_path, *args):
+    """Runs one extraction over a fresh mapping of log_path and returns the elapsed seconds."""
+    with open(log_path, 'r') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    started = time.perf_counter()
+    extract(mm, report_path, *args)
+    return time.perf_counter() - started
+
+
+def run_scanner_benchmark(sizes_mb, work_dir, workers):
+    """Times the implementations on synthetic logs of each size and checks the reports are identical."""
+    print(f"{'size':>8} {'legacy s':>10} {'scanner s':>10} {'parallel s':>11} "
+          f"{'legacy MB/s':>12} {'scanner MB/s':>13} {'parallel MB/s':>14}")
+    for size_mb in sizes_mb:
+        log_path = os.path.join(work_dir, f"karma-{size_mb}mb.log")
+        generate_karma_log(log_path, size_mb * MEGABYTE)
+        legacy_report = os.path.join(work_dir, f"legacy-{size_mb}mb.txt")
+        scanner_report = os.path.join(work_dir, f"scanner-{size_mb}mb.txt")
+        parallel_report = os.path.join(work_dir, f"parallel-{size_mb}mb.txt")
+
+        legacy_seconds = _time_extraction(legacy_extract_failed_test_cases, log_path, legacy_report)
+        scanner_seconds = _time_extraction(LogAnalysis.extract_failed_test_cases, log_path, scanner_report)
+        parallel_seconds = _time_extraction(LogAnalysis.extract_failed_test_cases, log_path, parallel_report,
+                                            log_path, workers)
+        for report in (scanner_report, parallel_report):
+            if not filecmp.cmp(legacy_report, report, shallow=False):
+                raise AssertionError(f"{os.path.basename(report)} differs from the legacy report")
+
+        print(f"{size_mb:>6}MB {legacy_seconds:>10.3f} {scanner_seconds:>10.3f} {parallel_seconds:>11.3f} "
+              f"{size_mb / legacy_seconds:>12.1f} {size_mb / scanner_seconds:>13.1f} "
+              f"{size_mb / parallel_seconds:>14.1f}")
+        os.remove(log_path)
+
+
+def _compress_log(log_path, compressed_path, compression):
+    """Writes a compressed copy of the log."""
+    with open(log_path, 'rb') as source:
+        if compression == "gzip":
+            with gzip.open(compressed_path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+        elif compression == "xz":
+            with lzma.open(compressed_path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+        else:
+            with open(compressed_path, 'wb') as target:
+                zstandard.ZstdCompressor().copy_stream(source, target)
+
+
+def _decompress_then_extract(compressed_log, report_path):
+    """The old workflow: decompress the whole log to disk, then memory-map and analyze it."""
+    with tempfile.NamedTemporaryFile(delete=False) as decompressed:
+        with compressed_log.open_stream() as (stream, _):
+            shutil.copyfileobj(stream, decompressed)
+    try:
+        with open(decompressed.name, 'r') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        LogAnalysis.extract_failed_test_cases(mm, report_path)
+    finally:
+        os.remove(decompressed.name)
+
+
+def run_compressed_benchmark(sizes_mb, work_dir, compression):
+    """Times streaming a compressed log against decompressing it to disk first, checking the reports match."""
+    print(f"{'size':>8} {'compressed MB':>14} {'decompress s':>13} {'stream s':>10}")
+    for size_mb in sizes_mb:
+        log_path = os.path.join(work_dir, f"karma-{size_mb}mb.log")
+        compressed_path = log_path + {"gzip": ".gz", "xz": ".xz", "zstd": ".zst"}[compression]
+        generate_karma_log(log_path, size_mb * MEGABYTE)
+        _compress_log(log_path, compressed_path, compression)
+        os.remove(log_path)
+        compressed_log = CompressedLog(compressed_path, compression)
+        decompress_report = os.path.join(work_dir, f"decompress-{size_mb}mb.txt")
+        stream_report = os.path.join(work_dir, f"stream-{size_mb}mb.txt")
+
+        started = time.perf_counter()
+        _decompress_then_extract(compressed_log, decompress_report)
+        decompress_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        LogAnalysis.extract_failed_test_cases(compressed_log, stream_report)
+        stream_seconds = time.perf_counter() - started
+        if not filecmp.cmp(decompress_report, stream_report, shallow=False):
+            raise AssertionError(f"{os.path.basename(stream_report)} differs from the decompressed report")
+
+        print(f"{size_mb:>6}MB {len(compressed_log) / MEGABYTE:>14.1f} {decompress_seconds:>13.3f} "
+              f"{stream_seconds:>10.3f}")
+        os.remove(compressed_path)
+
+
+def _jest_boundary_log(window_bytes):
+    """
+    Returns a Jest log of two failures whose first header line starts right where a scan window of window_bytes
+    ends, so the line before it, which the Jest failed pattern matches, is the last line of the window.
+    """
+    failure = ("\n  \u25cf Suite \u203a test {}\n\n    expect(received).toBe(expected)\n\n"
+               "      at Object.<anonymous> (src/app.spec.ts:{}:5)\n")
+    head = "FAIL src/app.spec.ts\n"
+    filler = "x" * (window_bytes - len(head) - len("\n") * 2) + "\n"
+    return (head + filler + failure.format(1, 3) + "console.log\n" * 20 + failure.format(2, 9) +
+            "Test Suites: 1 failed, 1 total\n").encode('utf-8')
+
+
+def run_boundary_check(work_dir, window_sizes=(64, 128, 4096)):
+    """
+    Checks that failures whose failed line ends a scan window, a stream read or a follow poll are still found, for
+    the Jest profile whose failed pattern looks ahead to the next line. Windows are shrunk to make that cheap.
+    """
+    profile = pattern_profiles.get_profile("jest")
+    scan_window_bytes, stream_read_bytes = consts.SCAN_WINDOW_BYTES, consts.STREAM_READ_BYTES
+    try:
+        for window_bytes in window_sizes:
+            consts.SCAN_WINDOW_BYTES = consts.STREAM_READ_BYTES = window_bytes
+            data = _jest_boundary_log(window_bytes)
+            log_path = os.path.join(work_dir, f"jest-{window_bytes}.log")
+            with open(log_path, 'wb') as log:
+                log.write(data)
+            with gzip.open(log_path + ".gz", 'wb') as log:
+                log.write(data)
+            found = {}
+            for name, path in (("serial", log_path), ("stream", log_path + ".gz")):
+                mm = LogAnalysis.open_log(path)
+                try:
+                    found[name] = sum(1 for _ in LogAnalysis.iter_failures(mm, profile=profile))
+                finally:
+                    mm.close()
+
+            # Follow a log that is written line by line, so the header arrives in the poll after its failed line
+            follow_path = os.path.join(work_dir, f"jest-follow-{window_bytes}.log")
+            open(follow_path, 'wb').close()
+            follower = LogFollower(follow_path, os.path.join(work_dir, f"jest-follow-{window_bytes}.txt"))
+            follower.profile_name = profile.name
+            for line in data.splitlines(True):
+                with open(follow_path, 'ab') as log:
+                    log.write(line)
+                follower.poll()
+            follower.finish()
+            found["follow"] = follower.failure_count
+
+            print(f"{window_bytes:>8}B " + " ".join(f"{name} {count}" for name, count in found.items()))
+            for name, count in found.items():
+                if count != 2:
+                    raise AssertionError(f"The {name} scan found {count} of 2 failures across a {window_bytes} "
+                                         f"byte window")
+    finally:
+        consts.SCAN_WINDOW_BYTES, consts.STREAM_READ_BYTES = scan_window_bytes, stream_read_bytes
+
+
+def _build_report_text(line_count):
+    """Renders a text report of roughly line_count lines from a synthetic log's failure blocks."""
+    reason_lines = ["Expected undefined to be truthy.\n", "TypeError: Cannot read property 'x' of undefined\n",
+                    "    at UserContext.<anonymous> (http://localhost:9876/_karma_webpack_/main.js:10:17)\n",
+                    "    at ZoneDelegate.invoke (http://localhost:9876/_karma_webpack_/polyfills.js:20:26)\n",
+                    "Error: Timeout - Async callback was not invoked\n", "plain context line\n"]
+    result = AnalysisResult()
+    fail_count = 0
+    while len(result.blocks) * (len(reason_lines) * 2 + 4) < line_count:
+        fail_count += 1
+        result.blocks.append(FailureBlock(fail_count, [f"Spec {fail_count} FAILED"] + reason_lines))
+    return render_text(result)
+
+
+def run_lexer_benchmark(line_count):
+    """Times styling a report of line_count lines with the legacy and the current CustomLogLexer (needs PyQt5)."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.Qsci import QsciScintilla
+    from custom_log_lexer import CustomLogLexer
+
+    class LegacyLogLexer(CustomLogLexer):
+        """The original decode, split and substring chain styling, kept as the reference."""
+
+        def styleText(self, start, end):
+            editor = self.editor()
+            source = self.getSourceText(editor, start, end)
+            self.startStyling(start)
+            position = start
+            for line in source.decode('utf-8').split('\n'):
+                length = len(line)
+                if position + length <= end:
+                    self.applyStyling(line, length)
+                    position += length
+                    if position < end:
+                        self.setStyling(1, self._styles["default"])
+                        position += 1
+
+        def applyStyling(self, line, length):
+            if "FAILED" in line:
+                self.setStyling(length, self._styles["error"])
+            elif re.search(r'\bat\b', line):
+                self.setStyling(length, self._styles["orange"])
+            elif "Expected" in line or "TypeError" in line:
+                self.setStyling(length, self._styles["green"])
+            elif line.strip() == "=" * 79:
+                self.setStyling(length, self._styles["cyan"])
+            elif any(keyword in line for keyword in ["at ", "Error: ", "Usage: "]):
+                self.setStyling(length, self._styles["trace"])
+            else:
+                self.setStyling(length, self._styles["default"])
+
+    app = QApplication.instance() or QApplication([])
+    text = _build_report_text(line_count)
+    print(f"{'lexer':>8} {'first s':>10} {'restyle s':>10}")
+    for name, lexer_class in (("legacy", LegacyLogLexer), ("current", CustomLogLexer)):
+        editor = QsciScintilla()
+        lexer = lexer_class(editor)
+        editor.setLexer(lexer)
+        editor.setText(text)
+        length = editor.SendScintilla(editor.SCI_GETLENGTH)
+        timings = []
+        # The second pass shows what scrolling back over already seen lines costs
+        for _ in range(2):
+            started = time.perf_counter()
+            lexer.styleText(0, length)
+            timings.append(time.perf_counter() - started)
+        print(f"{name:>8} {timings[0]:>10.3f} {timings[1]:>10.3f}")
+    app.processEvents()
+
+
+def _import_in_fresh_interpreter(module):
+    """Imports module in a new interpreter and returns the seconds it took and the deferred modules it loaded."""
+    code = "import sys\n"
+    if module:
+        code += f"import {module}\n"
+    code += f"print(' '.join(name for name in {DEFERRED_MODULES!r} if name in sys.modules))"
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return time.perf_counter() - started, output.split()
+
+
+def run_startup_benchmark(repeat):
+    """Times a cold start of every entry point, best of repeat, and lists the deferred modules each one loads."""
+    print(f"{'entry point':<16} {'seconds':>9} {'imports':>9}  deferred modules loaded")
+    floor = None
+    for module in [None] + STARTUP_MODULES:
+        try:
+            timings = [_import_in_fresh_interpreter(module) for _ in range(repeat)]
+        except subprocess.CalledProcessError as e:
+            # An entry point that cannot even be imported, like one needing a GUI library that is not installed
+            print(f"{module:<16} {'fails':>9} {'':>9}  {e.stderr.strip().splitlines()[-1]}")
+            continue
+        seconds = min(seconds for seconds, _ in timings)
+        floor = seconds if floor is None else floor
+        print(f"{module or 'python':<16} {seconds:>9.3f} {seconds - floor:>9.3f}  {' '.join(timings[0][1]) or '-'}")
+
+
+def _bench_extract(log_path, report_path, workers):
+    return _time_extraction(LogAnalysis.extract_failed_test_cases, log_path, report_path, log_path, workers)
+
+
+def _bench_startup(module):
+    return _import_in_fresh_interpreter(module)[0]
+
+
+def _bench_list_directory(directory):
+    started = time.perf_counter()
+    LogAnalysis.get_files_from_dir(directory, False)
+    return time.perf_counter() - started
+
+
+def _bench_write_report(log_path, report_path, report_format):
+    mm = LogAnalysis.open_log(log_path)
+    result = LogAnalysis.analyze(mm, log_path)
+    mm.close()
+    # Decode the reasons first so only the writing is timed
+    for block in result.blocks:
+        block.reason_lines
+    started = time.perf_counter()
+    write_report(result, report_path, report_format)
+    return time.perf_counter() - started
+
+
+def _bench_lexer(line_count):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.Qsci import QsciScintilla
+    from custom_log_lexer import CustomLogLexer
+
+    app = QApplication.instance() or QApplication([])
+    editor = QsciScintilla()
+    lexer = CustomLogLexer(editor)
+    editor.setLexer(lexer)
+    editor.setText(_build_report_text(line_count))
+    started = time.perf_counter()
+    lexer.styleText(0, editor.SendScintilla(editor.SCI_GETLENGTH))
+    seconds = time.perf_counter() - started
+    app.processEvents()
+    return seconds
+
+
+def _run_measured(bench, args):
+    """Runs one benchmark and returns its seconds and the peak RSS of the process that ran it."""
+    seconds = bench(*args)
+    return seconds, peak_rss_mb()
+
+
+def _measure(bench, args, repeat):
+    """
+    Runs the benchmark repeat times, each in a freshly spawned process so its peak RSS is its own, and returns
+    the best seconds and peak RSS.
+    """
+    timings = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            timings.append(executor.submit(_run_measured, bench, args).result())
+    peaks = [peak for _, peak in timings if peak is not None]
+    return min(seconds for seconds, _ in timings), min(peaks) if peaks else None
+
+
+def run_suite(sizes_mb, work_dir, workers=0, repeat=1, directory_files=SUITE_DIRECTORY_FILES,
+              lexer_lines=SUITE_LEXER_LINES, failure_every=500, reason_length=6, line_length=None):
+    """
+    Times extraction (serial and parallel), listing a directory, writing each report format, styling a report
+    and the cold start of every entry point, and returns {name: {'seconds', 'throughput', 'unit', 'peak_rss_mb'}}.
+    The lexer is skipped when PyQt5 is not installed.
+    """
+    benchmarks = []
+    for size_mb in sizes_mb:
+        log_path = os.path.join(work_dir, f"karma-{size_mb}mb.log")
+        failures = generate_karma_log(log_path, size_mb * MEGABYTE, failure_every, reason_length,
+                                      line_length=line_length)
+        report_path = os.path.join(work_dir, f"report-{size_mb}mb")
+        benchmarks.append((f"extract-{size_mb}mb", _bench_extract, (log_path, report_path, 1), size_mb, "MB/s"))
+        benchmarks.append((f"extract-parallel-{size_mb}mb", _bench_extract, (log_path, report_path, workers),
+                           size_mb, "MB/s"))
+        for report_format in consts.REPORT_FORMATS:
+            benchmarks.append((f"report-{report_format}-{size_mb}mb", _bench_write_report,
+                               (log_path, report_path, report_format), failures, "failures/s"))
+
+    directory = os.path.join(work_dir, "logs")
+    os.makedirs(directory)
+    for idx in range(directory_files):
+        open(os.path.join(directory, f"karma-{idx}.log"), 'w').close()
+    benchmarks.append((f"list-directory-{directory_files}", _bench_list_directory, (directory,),
+                       directory_files, "files/s"))
+    for module in STARTUP_MODULES:
+        benchmarks.append((f"startup-{module}", _bench_startup, (module,), 1, "starts/s"))
+    try:
+        import PyQt5.Qsci  # noqa: F401
+        benchmarks.append((f"lexer-{lexer_lines}", _bench_lexer, (lexer_lines,), lexer_lines, "lines/s"))
+    except ImportError:
+        print("Skipping the lexer benchmark, PyQt5 is not installed")
+
+    results = {}
+    print(f"{'benchmark':<28} {'seconds':>9} {'throughput':>21} {'peak RSS':>10}")
+    for name, bench, args, amount, unit in benchmarks:
+        seconds, peak_rss_mb = _measure(bench, args, repeat)
+        results[name] = {'seconds': seconds, 'throughput': amount / seconds if seconds else None, 'unit': unit,
+                         'peak_rss_mb': peak_rss_mb}
+        peak = f"{peak_rss_mb:.1f}MB" if peak_rss_mb is not None else "n/a"
+        print(f"{name:<28} {seconds:>9.3f} {results[name]['throughput']:>10.1f} {unit:<10} {peak:>10}")
+    return results
+
+
+def save_baseline(path, results):
+    """Writes the suite results with a description of the machine they were measured on."""
+    with open(path, 'w') as file:
+        json.dump({'version': BASELINE_VERSION, 'python': platform.python_version(), 'machine': platform.platform(),
+                   'cpus': os.cpu_count(), 'results': results}, file, indent=2, sort_keys=True)
+
+
+def compare_with_baseline(path, results, tolerance=DEFAULT_TOLERANCE):
+    """
+    Prints the change of every benchmark against the baseline file and returns the names of the ones that are
+    more than tolerance slower or use more than tolerance more memory. Timings under MIN_COMPARED_SECONDS in
+    both runs are shown but never count as slower.
+    """
+    with open(path, 'r') as file:
+        baseline = json.load(file)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError(f"{path} is not a version {BASELINE_VERSION} baseline")
+
+    regressions = []
+    print(f"{'benchmark':<28} {'baseline s':>11} {'now s':>9} {'time':>8} {'RSS':>8}")
+    for name, result in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            print(f"{name:<28} {'new':>11} {result['seconds']:>9.3f}")
+            continue
+        time_change = result['seconds'] / previous['seconds'] - 1 if previous['seconds'] else 0
+        rss_change = None
+        if result['peak_rss_mb'] and previous.get('peak_rss_mb'):
+            rss_change = result['peak_rss_mb'] / previous['peak_rss_mb'] - 1
+        compared = max(result['seconds'], previous['seconds']) >= MIN_COMPARED_SECONDS
+        regressed = (compared and time_change > tolerance) or (rss_change is not None and rss_change > tolerance)
+        if regressed:
+            regressions.append(name)
+        rss = f"{rss_change:>+8.0%}" if rss_change is not None else f"{'n/a':>8}"
+        print(f"{name:<28} {previous['seconds']:>11.3f} {result['seconds']:>9.3f} {time_change:>+8.0%} {rss}"
+              f"{'  REGRESSION' if regressed else ''}")
+    if baseline.get('machine') != platform.platform():
+        print(f"The baseline was measured on {baseline.get('machine')}, timings may not be comparable")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the log analysis on synthetic Karma logs.")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        help=f"Log sizes in MB, {DEFAULT_SIZES_MB} or {SUITE_SIZES_MB} for the suite")
+    parser.add_argument("--workers", type=int, default=0, help="Parallel workers, 0 for one per CPU core")
+    parser.add_argument("--lexer", action="store_true", help="Benchmark report styling instead (needs PyQt5)")
+    parser.add_argument("--compressed", choices=sorted(consts.COMPRESSION_MAGIC_NUMBERS),
+                        help="Benchmark streaming a compressed log against decompressing it first")
+    parser.add_argument("--lexer-lines", type=int, default=SUITE_LEXER_LINES, help="Lines in the styled report")
+    parser.add_argument("--check-boundaries", action="store_true",
+                        help="Check that Jest failures are found across scan window and follow poll boundaries")
+    parser.add_argument("--startup", action="store_true",
+                        help="Time the cold start of every entry point and the slow modules it imports")
+    parser.add_argument("--suite", action="store_true",
+                        help="Time extraction, directory listing, report writing and styling with peak RSS")
+    parser.add_argument("--baseline", help="Compare the suite with this baseline file, exiting 1 on regressions")
+    parser.add_argument("--save-baseline", help="Write the suite results to this baseline file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown or memory growth against the baseline, 0.15 is 15%%")
+    parser.add_argument("--repeat", type=int, default=3, help="Suite runs per benchmark, the best one counts")
+    parser.add_argument("--files", type=int, default=SUITE_DIRECTORY_FILES, help="Files in the listed directory")
+    parser.add_argument("--failure-every", type=int, default=500, help="One failing spec every this many specs")
+    parser.add_argument("--reason-length", type=int, default=6, help="Reason lines per failure")
+    parser.add_argument("--line-length", type=int, help="Length of every filler line")
+    args = parser.parse_args()
+
+    if args.suite or args.baseline or args.save_baseline:
+        with tempfile.TemporaryDirectory() as directory:
+            suite_results = run_suite(args.sizes or SUITE_SIZES_MB, directory, args.workers, args.repeat,
+                                      args.files, args.lexer_lines, args.failure_every, args.reason_length,
+                                      args.line_length)
+        if args.save_baseline:
+            save_baseline(args.save_baseline, suite_results)
+        if args.baseline and compare_with_baseline(args.baseline, suite_results, args.tolerance):
+            sys.exit(1)
+    elif args.check_boundaries:
+        with tempfile.TemporaryDirectory() as directory:
+            run_boundary_check(directory)
+    elif args.startup:
+        run_startup_benchmark(args.repeat)
+    elif args.lexer:
+        run_lexer_benchmark(args.lexer_lines)
+    elif args.compressed:
+        with tempfile.TemporaryDirectory() as directory:
+            run_compressed_benchmark(args.sizes or DEFAULT_SIZES_MB, directory, args.compressed)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            run_scanner_benchmark(args.sizes or DEFAULT_SIZES_MB, directory, args.workers)
@@ -0,0 +1,58 @@
+# Detects compressed logs and opens them as streams of decompressed bytes
+###########################################
+
+import os  # For file sizes
+import gzip  # For gzip compressed logs
+import lzma  # For xz compressed logs
+from contextlib import contextmanager  # For the stream context manager
+import consts  # For constants
+
+try:
+    # zstd support is optional
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def detect_compression(log_path: str):
+    """Returns the compression of the log ("gzip", "xz" or "zstd") from its magic number, or None."""
+    with open(log_path, 'rb') as log:
+        head = log.read(max(len(magic) for magic in consts.COMPRESSION_MAGIC_NUMBERS.values()))
+    for compression, magic in consts.COMPRESSION_MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+class CompressedLog:
+    """
+    Stands in for the memory-mapped object of a compressed log. Nothing is decompressed up front, every scan
+    opens a fresh decompressing stream. Its length is the compressed size, which is what progress is reported in.
+    """
+
+    def __init__(self, log_path: str, compression: str):
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError(consts.ZSTD_NOT_AVAILABLE_MESSAGE)
+        self.log_path = log_path
+        self.compression = compression
+        self.size = os.path.getsize(log_path)
+
+    def __len__(self):
+        return self.size
+
+    @contextmanager
+    def open_stream(self):
+        """Yields the decompressed stream together with the raw file, whose position is the compressed progress."""
+        with open(self.log_path, 'rb') as raw:
+            if self.compression == "gzip":
+                stream = gzip.GzipFile(fileobj=raw, mode='rb')
+            elif self.compression == "xz":
+                stream = lzma.LZMAFile(raw, mode='rb')
+            else:
+                stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            with stream:
+                yield stream, raw
+
+    def close(self):
+        # Streams are closed as soon as their scan ends, so there is nothing left open here
+        pass
@@ -5,6 +5,69 @@ FAILED_PATTERN = rb'\((\d+) FAILED\)'
 REASON_PATTERN = rb'(.*?FAILED)'
 END_OF_REASON_PATTERN = rb'HeadlessChrome \d+\.\d+\.\d'
 
+# Pattern profiles for other runners and browsers, in detection order. "detect" is searched for in the start of a
+# log to pick its profile. A "failed" pattern without a group counts every match as a new failure.
+DEFAULT_PATTERN_PROFILE = "karma-headlesschrome"
+PATTERN_PROFILES = {
+    DEFAULT_PATTERN_PROFILE: {
+        "detect": rb'HeadlessChrome \d+\.\d+\.\d',
+        "failed": FAILED_PATTERN,
+        "reason": REASON_PATTERN,
+        "end_of_reason": END_OF_REASON_PATTERN,
+    },
+    # Newer karma-chrome-launcher prints "Chrome Headless 120.0.6099.109 (Linux x86_64)"
+    "karma-chrome-headless": {
+        "detect": rb'Chrome Headless \d+\.\d+\.\d+',
+        "failed": FAILED_PATTERN,
+        "reason": REASON_PATTERN,
+        "end_of_reason": rb'Chrome Headless \d+\.\d+\.\d+',
+    },
+    "karma-firefox": {
+        "detect": rb'(?:Headless)?Firefox \d+\.\d+',
+        "failed": FAILED_PATTERN,
+        "reason": REASON_PATTERN,
+        "end_of_reason": rb'(?:Headless)?Firefox \d+\.\d+',
+    },
+    # Jest has no running fail count: every "\xe2\x97\x8f Suite \xe2\x80\xba test" header is a failure, matched
+    # on the line before it so the header itself starts the reason, which runs to the first stack frame. The
+    # scanners read one line past their windows for this lookahead.
+    "jest": {
+        "detect": rb'(?:PASS|FAIL) +\S+\.(?:test|spec)\.[jt]sx?\b',
+        "failed": rb'(?<![^\n])(?=[^\n]*\n[ \t]*\xe2\x97\x8f (?!Console))',
+        "reason": rb'([ \t]*\xe2\x97\x8f .*)',
+        "end_of_reason": rb'\s+at |\s*(?:PASS|FAIL) |Test Suites:',
+    },
+}
+# How much of the start of a log is searched to detect its profile
+PROFILE_SNIFF_BYTES = 4 * 1024
+AUTO_PATTERN_PROFILE = "auto"
+UNKNOWN_PATTERN_PROFILE_MESSAGE = "Unknown pattern profile: {}"
+
+# Report formats and the file suffix of each
+REPORT_FORMATS = {
+    "text": ".txt",
+    "json": ".json",
+    "ndjson": ".ndjson",
+    "junit": ".xml"
+}
+
+# Reason capture limits per failure, 0 meaning no limit, and how undecodable bytes are rendered
+REASON_MAX_LINES = 20
+REASON_MAX_BYTES = 0
+REASON_DECODE_ERRORS = "replace"
+
+# The scanner checks for cancellation after every window of this many bytes
+SCAN_WINDOW_BYTES = 4 * 1024 * 1024
+
+# Newlines are counted in steps of this many bytes when numbering lines
+LINE_COUNT_STEP_BYTES = 16 * 1024 * 1024
+
+# Parallel analysis
+# Logs smaller than this are always scanned serially
+PARALLEL_MIN_FILE_SIZE = 32 * 1024 * 1024
+# Each worker gets several chunks so uneven failure density still balances out
+CHUNKS_PER_WORKER = 4
+
 # Messages and strings
 FAILED_MESSAGE = " FAILED:"
 TAB_INDENT = "\t"
@@ -38,6 +101,10 @@ EDIT_CONFIGURATIONS_DIALOG_TITLE = "Edit Configurations"
 LOG_LOCATION_LABEL = "Log Location:"
 USE_TEMPORARY_FILES_LABEL = "Use Temporary Files?:"
 REPORT_DIRECTORY_LABEL = "Report Directory:"
+CANCEL_ANALYSIS_MESSAGE = "Cancel"
+ANALYSIS_CANCELLED_MESSAGE = "Analysis cancelled."
+FAILURE_INDEX_ITEM = "{} FAILED"
+PAGE_LABEL = "Page {} / {}"
 INCREASE_FONT_SIZE = "Font Size +"
 DECREASE_FONT_SIZE = "DECREASE Size -"
 
@@ -47,6 +114,189 @@ LATEST_LOG_FILE_PROMPT = "Select Directory"
 CHOOSE_FILE_NUMBER_PROMPT = "Please choose a file by number"
 REFRESH_OPTION = "r"
 
+# Strings used in batch mode
+BATCH_DIRECTORY_PREFIX = "batch-at-time-"
+BATCH_REPORT_NAME = "batch-report.txt"
+BATCH_FILE_REPORT_SUFFIX = ".report.txt"
+BATCH_SUMMARY_HEADER = "BATCH SUMMARY"
+BATCH_TOTALS_MESSAGE = "Files: {} | Files with failures: {} | Failures: {} | Errors: {} | Wall clock: {:.3f}s"
+BATCH_FILE_LINE = "{:<60} failures: {:>5}  time: {:>8.3f}s{}"
+BATCH_FILE_ERROR = "  error: {}"
+BATCH_FILE_HEADER = "FILE: {}"
+BATCH_REPORT_WRITTEN_MESSAGE = "Batch report written to {}"
+
+# Headless command line
+HEADLESS_OUTPUT_FORMATS = ("text", "json", "junit")
+# Exit codes: no failures, failures found, and logs that could not be analyzed (or bad arguments)
+HEADLESS_EXIT_OK = 0
+HEADLESS_EXIT_FAILURES = 1
+HEADLESS_EXIT_ERROR = 2
+# The reader of the output went away, the status a shell gives a process killed by SIGPIPE
+HEADLESS_EXIT_BROKEN_PIPE = 141
+HEADLESS_SUMMARY_MESSAGE = "Logs: {} | Logs with failures: {} | Failures: {} | Errors: {}"
+HEADLESS_NO_LOGS_MESSAGE = "No logs match {}"
+HEADLESS_LOG_ERROR_MESSAGE = "{}: {}"
+
+# Analysis daemon
+DAEMON_DEFAULT_HOST = "127.0.0.1"
+DAEMON_DEFAULT_PORT = 8765
+# Analyses running at once, each in its own worker process
+DAEMON_DEFAULT_MAX_CONCURRENT = 2
+# Analyses waiting for a worker before new ones are turned away with 503
+DAEMON_DEFAULT_MAX_QUEUE = 16
+DAEMON_DEFAULT_MAX_UPLOAD_MB = 512
+# Results kept in memory so repeated requests for an unchanged log skip even the disk cache
+DAEMON_MEMORY_CACHE_ENTRIES = 64
+DAEMON_MAX_HEADER_BYTES = 64 * 1024
+DAEMON_RETRY_AFTER_SECONDS = 1
+DAEMON_UPLOAD_PREFIX = "testcaseanalyzer-upload-"
+DAEMON_LISTENING_MESSAGE = "Analysis daemon listening on {} ({} workers, queue of {}). Press Ctrl+C to stop."
+DAEMON_STOPPED_MESSAGE = "Analysis daemon stopped after {} requests"
+DAEMON_REQUEST_LINE = "{} {} {} {:.3f}s"
+NO_LOG_DIRECTORY_MESSAGE = "No log directory given. Pass one as an argument or set where_are_your_logs_located."
+
+# Result cache
+RESULT_CACHE_DIRECTORY_NAME = "testcaseanalyzer-cache"
+RESULT_CACHE_DEFAULT_SIZE_MB = 256
+# How much of the start and end of a log the optional content hash reads
+RESULT_CACHE_HASH_SAMPLE_BYTES = 64 * 1024
+# Bump when the cached result format changes so old entries are never read
+RESULT_CACHE_FORMAT_VERSION = "2"
+RESULT_CACHE_STATS_MESSAGE = "Result cache: {hits} hits / {misses} misses"
+
+# Compressed logs, detected by their magic numbers
+COMPRESSION_MAGIC_NUMBERS = {
+    "gzip": b"\x1f\x8b",
+    "xz": b"\xfd7zXZ\x00",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+# How much decompressed data is read into the scan window at a time
+STREAM_READ_BYTES = 1024 * 1024
+ZSTD_NOT_AVAILABLE_MESSAGE = "Reading zstd compressed logs needs the zstandard package: pip install zstandard"
+
+# Cross-run failure index
+FAILURE_INDEX_DIRECTORY_NAME = ".testcaseanalyzer"
+FAILURE_INDEX_FILE_NAME = "failure-index.sqlite3"
+# Applied in order to the spec and message lines of a failure so the same failure gets the same signature in
+# every run: browser prefixes, timestamps, durations, fail counts and line:column numbers are stripped
+SIGNATURE_NORMALIZERS = [
+    (r'^\s*\S+ \d+(?:\.\d+)+ \([^)]*\)[: ]*', ''),
+    (r'\d{2,4}[-/.]\d{1,2}[-/.]\d{1,4}[ T]\d{1,2}:\d{2}(?::\d{2})?(?:[.,]\d+)?Z?', '<time>'),
+    (r'\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b', '<time>'),
+    (r'\b\d+(?:\.\d+)? ?(?:ms|secs?|seconds?)\b', '<duration>'),
+    (r'\(\d+ FAILED\)', '(<count> FAILED)'),
+    (r'\bExecuted \d+ of \d+', 'Executed <count> of <count>'),
+    (r'(\.\w+):\d+(?::\d+)?', r'\1:<line>'),
+    (r'\s+', ' '),
+]
+FAILURE_INDEX_TOP_HEADER = "{:>7} {:>6} {:>7}  {:<19} {:<19}  {}"
+FAILURE_INDEX_TOP_LINE = "{:>7} {:>6} {:>6.0%}  {:<19} {:<19}  {}"
+FAILURE_INDEX_INGESTED_MESSAGE = "Ingested {} new logs into {}"
+FAILURE_INDEX_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Failure grouping: "stack" hashes every captured reason line, "message" only the spec and its first message line
+GROUP_SIGNATURES = ("stack", "message")
+DEFAULT_GROUP_SIGNATURE = "stack"
+UNKNOWN_GROUP_SIGNATURE_MESSAGE = "Unknown failure grouping signature: {}"
+GROUP_OCCURRENCES_MESSAGE = "Seen {} times, first at line {}, last at line {} ({} FAILED)"
+
+# Run to run diff, by default failures match when their spec and message agree
+DEFAULT_DIFF_SIGNATURE = "message"
+DIFF_OUTPUT_FORMATS = ("text", "json")
+DIFF_HEADER = "Comparing {} (base) with {} (head) by {} signature"
+DIFF_SUMMARY_MESSAGE = "New: {} | Fixed: {} | Still failing: {}"
+DIFF_SECTION_HEADERS = {
+    "new": "NEW FAILURES ({})",
+    "fixed": "FIXED ({})",
+    "persisting": "STILL FAILING ({})",
+}
+DIFF_COUNTS_MESSAGE = "Base: {} | Head: {}"
+DIFF_OPTION = "d"
+COMPARE_SELECTED_FILES_MESSAGE = "Compare Selected Files"
+SELECT_BASELINE_MESSAGE = "Select a baseline log or stored JSON result"
+SELECT_ONE_OR_TWO_FILES_MESSAGE = "Select the log to compare, or the base and the head log"
+DIFF_NEEDS_ONE_LOG_MESSAGE = "--diff compares exactly one log with the base"
+DIFF_OUTPUT_FORMAT_MESSAGE = "--diff writes {}"
+
+# Instrumentation
+INSTRUMENTATION_TOTAL_LINE = "Analysis took {:.3f}s"
+INSTRUMENTATION_STAGE_LINE = "  {:<8} {:>9.3f}s {:>5.0%}  ({} calls)"
+INSTRUMENTATION_COUNTERS_LINE = "  {:.1f}MB scanned at {:.1f}MB/s, {} failures, {} reason bytes"
+INSTRUMENTATION_MEMORY_LINE = "  Peak RSS {:.1f}MB (+{:.1f}MB during the analysis)"
+INSTRUMENTATION_EXPORTED_MESSAGE = "Instrumentation written to {}"
+
+# Directory index
+DIRECTORY_INDEX_DIRECTORY_NAME = "testcaseanalyzer-index"
+
+# Line index and search of the raw log
+LINE_INDEX_DIRECTORY_NAME = "testcaseanalyzer-line-index"
+# Every this many lines the start offset is indexed, 1 indexes every line
+LINE_INDEX_STRIDE = 64
+# Lines of the raw log shown before a failure, and after its reason block, when jumping to its origin
+LOG_REGION_CONTEXT_LINES = 20
+SEARCH_MAX_RESULTS = 10000
+# Search results are sent to the window in batches of this many, or as often as this, whichever comes first
+SEARCH_BATCH_SIZE = 200
+SEARCH_BATCH_SECONDS = 0.1
+SEARCH_PLACEHOLDER = "Search the selected log"
+SEARCH_MESSAGE = "Search"
+SEARCH_REGEX_LABEL = "Regex"
+SEARCH_IGNORE_CASE_LABEL = "Ignore case"
+SEARCH_RESULT_ITEM = "{}: {}"
+SEARCH_FINISHED_MESSAGE = "{} matching lines"
+SEARCH_LIMIT_MESSAGE = "Stopped at {} matching lines"
+INVALID_SEARCH_MESSAGE = "Invalid search: {}"
+LOG_REGION_TITLE = "{} lines {}-{}"
+LOG_REGION_LINE = "{:>8} {} {}"
+LOG_REGION_MARKER = ">"
+NO_ORIGIN_MESSAGE = "Double-click a failure of an analyzed log to open where it was found"
+
+# Spec-level parsing of failure blocks and the failure filter
+# The spec line of a failure without the Karma browser prefix, the Jest bullet and the trailing FAILED
+SPEC_TITLE_PATTERN = r'^\s*(?:[\u25cf\u2715\u00d7]\s*)?(?:[A-Za-z][\w ]*? \d+(?:\.\d+)+ \([^)]*\):?\s+)?' \
+                     r'(?P<title>.*?)\s*(?:FAILED)?\s*$'
+# Karma's progress line ends in "(1 FAILED" too, but names no spec
+SPEC_PROGRESS_PATTERN = r'^Executed \d+ of \d+'
+# What separates describe blocks from each other and from the spec, Karma only separates them by spaces
+SPEC_SUITE_SEPARATOR_PATTERN = r'\s+[\u203a>]\s+'
+# V8 frames "at fn (file:line:col)" or "at file:line:col", and Firefox and Safari frames "fn@file:line:col"
+STACK_FRAME_PATTERNS = [
+    r'^\s*at (?:(?P<function>.*?) \()?(?P<file>[^()\s]+?):(?P<line>\d+):(?P<column>\d+)\)?\s*$',
+    r'^\s*(?P<function>[^@\s]*)@(?P<file>\S+?):(?P<line>\d+):(?P<column>\d+)\s*$',
+]
+# Error classes (TypeError, AssertionError...) and failed expectations of Jasmine and Jest
+ERROR_TYPE_PATTERN = r'^\s*(?:Uncaught )?' \
+                     r'(?:(?P<error>(?:[A-Za-z_$][\w$.]*)?(?:Error|Exception))\b|(?P<expected>Expected\b|expect\())'
+EXPECTATION_ERROR_TYPE = "Expected"
+# Jest's excerpt of the failing source ("> 5 | expect(...)" and "  | ^") is not part of the message
+SOURCE_EXCERPT_PATTERN = r'^\s*(?:>?\s*\d+\s*\||\|)'
+# Served bundles and webpack URLs are shortened to the path of the file within the project
+SOURCE_FILE_PREFIX_PATTERN = r'^(?:\w+://[^/]*)?/?(?:_karma_webpack_/)?(?:webpack:/*)?(?:\./)?'
+# Fields a failure can be filtered by, as "field:value"; values without a field match any of them
+SPEC_INDEX_FIELDS = ("suite", "spec", "error", "file", "message")
+FAILURE_FILTER_PLACEHOLDER = "Filter failures: suite:Login error:TypeError file:app.component -spec:flaky"
+FAILURE_FILTER_MESSAGE = "{} of {} failures match {}"
+
+# Source maps
+SOURCE_MAP_SUFFIX = ".map"
+SOURCE_MAPPING_URL_MARKER = b"sourceMappingURL="
+SOURCE_MAP_BASE64_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+# Parsed source maps kept in memory, vendor bundles can have maps of tens of MB
+SOURCE_MAP_CACHE_ENTRIES = 32
+SOURCE_POSITION = "{}:{}:{}"
+INDEX_SOURCE_MAP_MESSAGE = "Index source maps with sections are not supported"
+NO_INLINE_SOURCE_MAP_MESSAGE = "{} has no inline source map"
+
+# Follow mode
+FOLLOW_STATE_DIRECTORY_NAME = "testcaseanalyzer-follow"
+FOLLOW_POLL_INTERVAL_SECONDS = 1.0
+# How often the GUI restats the log directory, since rewriting a log does not notify the directory watcher
+DIRECTORY_POLL_INTERVAL_SECONDS = 5.0
+FOLLOW_OPTION = "f"
+FOLLOWING_MESSAGE = "Following {} (report: {}). Press Ctrl+C to stop."
+FOLLOW_SELECTED_FILE_MESSAGE = "Follow Selected File"
+STOP_FOLLOWING_MESSAGE = "Stop Following"
+
 # Lexer
 # Styles used in the CustomLogLexer
 STYLES = {
@@ -58,6 +308,16 @@ STYLES = {
     "green": 5
 }
 
+# Report viewer
+# Reports larger than this are memory-mapped and shown one page at a time
+VIEWER_PAGED_THRESHOLD_BYTES = 4 * 1024 * 1024
+VIEWER_PAGE_BYTES = 512 * 1024
+# Lines of the neighbouring pages shown around a page
+VIEWER_OVERLAP_LINES = 20
+
+# How many distinct lines the CustomLogLexer remembers the style of
+LEXER_STYLE_CACHE_SIZE = 65536
+
 # Colors used in the CustomLogLexer
 COLORS = {
     "default": (255, 255, 255),  # White
@@ -1,9 +1,28 @@
+from functools import lru_cache
 from PyQt5.Qsci import QsciLexerCustom
 from PyQt5.QtGui import QColor
 from PyQt5.QtCore import Qt
 import re
 import consts
 
+# One pattern classifies a whole line. The alternatives are tried in order at the start of the line, so the first
+# lookahead that matches decides the style, with the same priority as the original chain of checks:
+# FAILED, a whole word "at", Expected/TypeError, a separator line, then "at "/"Error: "/"Usage: ".
+LINE_CLASSIFIER = re.compile(
+    rb'(?P<error>(?=.*FAILED))'
+    rb'|(?P<orange>(?=.*\bat\b))'
+    rb'|(?P<green>(?=.*(?:Expected|TypeError)))'
+    rb'|(?P<cyan>(?=\s*={79}\s*$))'
+    rb'|(?P<trace>(?=.*(?:at |Error: |Usage: )))'
+)
+
+
+@lru_cache(maxsize=consts.LEXER_STYLE_CACHE_SIZE)
+def classify_line(line: bytes) -> int:
+    """Returns the style of a line (without its newline), cached by line content."""
+    match = LINE_CLASSIFIER.match(line)
+    return consts.STYLES[match.lastgroup] if match else consts.STYLES["default"]
+
 
 class CustomLogLexer(QsciLexerCustom):
     def __init__(self, parent=None):
@@ -27,43 +46,43 @@ class CustomLogLexer(QsciLexerCustom):
                 return desc.capitalize()
         return ""
 
-    import re
-
     def styleText(self, start, end):
+        """
+        Styles only the lines Scintilla asks for, which are the dirty ones up to the visible end. Work is done on
+        the raw bytes so style lengths are byte lengths, and consecutive lines sharing a style are styled with a
+        single call, newlines included.
+        """
         editor = self.editor()
         if editor is None:
             return
 
-        source = self.getSourceText(editor, start, end)
+        # Always restyle whole lines
+        start = editor.SendScintilla(editor.SCI_POSITIONFROMLINE, editor.SendScintilla(editor.SCI_LINEFROMPOSITION,
+                                                                                       start))
+        if start >= end:
+            return
+        source = bytes(self.getSourceText(editor, start, end))
         self.startStyling(start)
-        text = source.decode('utf-8')
-        lines = text.split('\n')
 
-        position = start
-        for line in lines:
-            length = len(line)
-            if position + length <= end:
-                self.applyStyling(line, length, position, end)
-                position += length
-                if position < end:
-                    self.setStyling(1, self._styles["default"])  # for newline character
-                    position += 1
+        run_style = None
+        run_length = 0
+        for line in source.split(b'\n'):
+            style = classify_line(line)
+            # The newline, if any, takes the style of its line
+            length = len(line) + 1
+            if style == run_style:
+                run_length += length
+            else:
+                if run_length:
+                    self.setStyling(run_length, run_style)
+                run_style = style
+                run_length = length
+        # The last line has no newline of its own inside the range
+        run_length -= 1
+        if run_length > 0:
+            self.setStyling(run_length, run_style)
 
     def getSourceText(self, editor, start, end):
         source = bytearray(end - start)
         editor.SendScintilla(editor.SCI_GETTEXTRANGE, start, end, source)
         return source
-
-    def applyStyling(self, line, length, position, end):
-        if "FAILED" in line:
-            self.setStyling(length, self._styles["error"])
-        elif re.search(r'\bat\b', line):
-            self.setStyling(length, self._styles["orange"])
-        elif "Expected" in line or "TypeError" in line:
-            self.setStyling(length, self._styles["green"])
-        elif line.strip() == "=" * 79:
-            self.setStyling(length, self._styles["cyan"])
-        elif any(keyword in line for keyword in ["at ", "Error: ", "Usage: "]):
-            self.setStyling(length, self._styles["trace"])
-        else:
-            self.setStyling(length, self._styles["default"])
@@ -0,0 +1,72 @@
+# Cached, persisted listing of a log directory so reloads do not relist and stat every file
+###########################################
+
+import os  # For file and directory operations
+import json  # For persisting the index
+import hashlib  # For naming index files
+import tempfile  # For the index location
+import consts  # For constants
+
+
+class DirectoryIndex:
+    """
+    Keeps the files of a log directory with their modification times, built from os.scandir results and
+    persisted between runs. Every refresh restats the files, since rewriting or appending to a log does not
+    change the directory's own mtime, and reports which files were added or removed.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_path = self.get_index_path(directory)
+        # File name -> modification time in nanoseconds
+        self.entries = {}
+        self._sorted = None
+        self._load()
+
+    @staticmethod
+    def get_index_path(directory: str) -> str:
+        """Returns where the index of the directory is persisted."""
+        index_directory = os.path.join(tempfile.gettempdir(), consts.DIRECTORY_INDEX_DIRECTORY_NAME)
+        os.makedirs(index_directory, exist_ok=True)
+        key = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()
+        return os.path.join(index_directory, key + ".json")
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return
+        self.entries = state['entries']
+
+    def _save(self):
+        with open(self.index_path, 'w') as file:
+            json.dump({'entries': self.entries}, file)
+
+    def refresh(self):
+        """
+        Brings the index up to date and returns the (added, removed) file names. Files whose mtime changed keep
+        their name but move in the order, so the latest log is always the one written last.
+        """
+        entries = {}
+        with os.scandir(self.directory) as scan:
+            for dir_entry in scan:
+                # Skip macOS system files so the index matches what is shown
+                if dir_entry.name in consts.MACOS_SYSTEM_FILES or not dir_entry.is_file():
+                    continue
+                # The scandir stat is cheap, and on Windows it comes with the listing
+                entries[dir_entry.name] = dir_entry.stat().st_mtime_ns
+
+        added = [name for name in entries if name not in self.entries]
+        removed = [name for name in self.entries if name not in entries]
+        if entries != self.entries:
+            self._sorted = None
+            self.entries = entries
+            self._save()
+        return added, removed
+
+    def get_files(self, is_reversed: bool):
+        """Returns the file names sorted by modification time, newest last unless is_reversed."""
+        if self._sorted is None:
+            self._sorted = sorted(self.entries, key=self.entries.get)
+        return self._sorted[::-1] if is_reversed else list(self._sorted)
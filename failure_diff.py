@@ -0,0 +1,171 @@
+# Compares the failures of two runs: which are new, which were fixed and which still fail
+###########################################
+
+import io  # For rendering into strings
+import json  # For stored baselines and the json output
+import consts  # For constants
+import utilities as utils  # For utils
+from log_analysis import LogAnalysis, ReasonLimits  # Log analysis tools
+from analysis_result import AnalysisResult, FailureBlock  # For the analyzed runs
+from failure_groups import failure_signature  # For matching failures across runs
+import pattern_profiles  # For the configured pattern profiles
+
+
+class DiffEntry:
+    """One failure signature of a diff: the block it was first seen as and how often each run had it."""
+    __slots__ = ('signature', 'block', 'base_count', 'head_count')
+
+    def __init__(self, signature: str, block: FailureBlock, base_count: int = 0, head_count: int = 0):
+        self.signature = signature
+        self.block = block
+        self.base_count = base_count
+        self.head_count = head_count
+
+    def to_dict(self):
+        return {'signature': self.signature, 'base_count': self.base_count, 'head_count': self.head_count,
+                'failure': self.block.to_dict()}
+
+
+def signature_counts(result: AnalysisResult, signature: str = consts.DEFAULT_DIFF_SIGNATURE):
+    """
+    Returns {signature hash: [first block, occurrences]} of a result in file order. Grouped results count every
+    occurrence of their groups, others every reported block.
+    """
+    counts = {}
+    groups = result.groups if result.groups is not None else [None] * len(result.blocks)
+    for block, group in zip(result.blocks, groups):
+        signature_hash = failure_signature(block.reason_lines, signature)
+        occurrences = group.count if group is not None else 1
+        if signature_hash in counts:
+            counts[signature_hash][1] += occurrences
+        else:
+            counts[signature_hash] = [block, occurrences]
+    return counts
+
+
+class FailureDiff:
+    """
+    The failures of a head run compared with a base run by normalized signature: new ones only fail in the head,
+    fixed ones only failed in the base and persisting ones fail in both. Built from one pass over each run's
+    signatures, so the cost is linear in the failures found.
+    """
+    __slots__ = ('base_path', 'head_path', 'signature', 'new', 'fixed', 'persisting')
+
+    def __init__(self, base_path=None, head_path=None, signature=consts.DEFAULT_DIFF_SIGNATURE, new=None, fixed=None,
+                 persisting=None):
+        self.base_path = base_path
+        self.head_path = head_path
+        self.signature = signature
+        self.new = new if new is not None else []
+        self.fixed = fixed if fixed is not None else []
+        self.persisting = persisting if persisting is not None else []
+
+    @classmethod
+    def from_results(cls, base: AnalysisResult, head: AnalysisResult, signature: str = consts.DEFAULT_DIFF_SIGNATURE):
+        base_counts = signature_counts(base, signature)
+        head_counts = signature_counts(head, signature)
+        diff = cls(base.log_path, head.log_path, signature)
+        # New and persisting failures in head order, fixed ones in base order
+        for signature_hash, (block, head_count) in head_counts.items():
+            if signature_hash in base_counts:
+                diff.persisting.append(DiffEntry(signature_hash, block, base_counts[signature_hash][1], head_count))
+            else:
+                diff.new.append(DiffEntry(signature_hash, block, 0, head_count))
+        for signature_hash, (block, base_count) in base_counts.items():
+            if signature_hash not in head_counts:
+                diff.fixed.append(DiffEntry(signature_hash, block, base_count, 0))
+        return diff
+
+    def sections(self):
+        """Returns (name, entries) of every section in report order."""
+        return (("new", self.new), ("fixed", self.fixed), ("persisting", self.persisting))
+
+    def to_dict(self):
+        result = {'base_path': self.base_path, 'head_path': self.head_path, 'signature': self.signature}
+        for name, entries in self.sections():
+            result[f"{name}_count"] = len(entries)
+        for name, entries in self.sections():
+            result[name] = [entry.to_dict() for entry in entries]
+        return result
+
+    def format_summary(self) -> str:
+        return consts.DIFF_SUMMARY_MESSAGE.format(len(self.new), len(self.fixed), len(self.persisting))
+
+
+def write_diff_text(diff: FailureDiff, file):
+    """Writes the diff as text: a summary, then every new, fixed and persisting failure with its counts."""
+    utils.insert_line_separator_in_file(file, True, 1)
+    file.write(consts.DIFF_HEADER.format(diff.base_path, diff.head_path, diff.signature) + "\n")
+    file.write(diff.format_summary() + "\n")
+    for name, entries in diff.sections():
+        if not entries:
+            continue
+        file.write("\n")
+        utils.insert_line_separator_in_file(file, True, 1)
+        file.write(consts.DIFF_SECTION_HEADERS[name].format(len(entries)) + "\n")
+        for entry in entries:
+            utils.insert_line_separator_in_file(file, True, 1)
+            file.write(consts.DIFF_COUNTS_MESSAGE.format(entry.base_count, entry.head_count) + "\n")
+            for reason in entry.block.reason_lines:
+                file.write(f"{consts.TAB_INDENT}{reason}\n")
+
+
+def render_diff_text(diff: FailureDiff) -> str:
+    """Returns the diff as text."""
+    buffer = io.StringIO()
+    write_diff_text(diff, buffer)
+    return buffer.getvalue()
+
+
+def write_diff_json(diff: FailureDiff, file):
+    json.dump(diff.to_dict(), file)
+    file.write("\n")
+
+
+def is_stored_baseline(path: str) -> bool:
+    """Stored baselines are JSON results, as written by the json report format or the headless json output."""
+    return path.endswith(consts.REPORT_FORMATS["json"])
+
+
+def load_baseline(path: str) -> AnalysisResult:
+    """Reads a stored baseline, whose first line holds the result (headless json output has one per log)."""
+    with open(path, 'r') as file:
+        return AnalysisResult.from_dict(json.loads(file.readline()))
+
+
+def analyze_for_diff(path: str, reason_limits: ReasonLimits = None, group_by: str = None) -> AnalysisResult:
+    """Returns the result of a stored baseline or of analyzing a log."""
+    if is_stored_baseline(path):
+        return load_baseline(path)
+    mm = LogAnalysis.open_log(path)
+    try:
+        return LogAnalysis.analyze(mm, path, 1, reason_limits, group_by)
+    finally:
+        mm.close()
+
+
+def _analyze_for_diff_in_worker(path: str, reason_limits: ReasonLimits, group_by: str):
+    return analyze_for_diff(path, reason_limits, group_by).to_dict()
+
+
+def diff_logs(base_path: str, head_path: str, reason_limits: ReasonLimits = None, group_by: str = None,
+              signature: str = consts.DEFAULT_DIFF_SIGNATURE, config=None) -> FailureDiff:
+    """
+    Compares two logs, or a stored baseline and a log. Two logs are scanned at the same time in their own
+    processes, so the diff takes about as long as analyzing the larger one. With group_by every failure block is
+    captured and counted instead of the first one per fail count.
+    """
+    if is_stored_baseline(base_path) or is_stored_baseline(head_path):
+        base = analyze_for_diff(base_path, reason_limits, group_by)
+        head = analyze_for_diff(head_path, reason_limits, group_by)
+    else:
+        # Imported here so importing this module does not pay for multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # Workers compile the configured profiles once when they start
+        with ProcessPoolExecutor(max_workers=2, initializer=pattern_profiles.load_profiles,
+                                 initargs=(config,)) as executor:
+            base_future = executor.submit(_analyze_for_diff_in_worker, base_path, reason_limits, group_by)
+            head_future = executor.submit(_analyze_for_diff_in_worker, head_path, reason_limits, group_by)
+            base = AnalysisResult.from_dict(base_future.result())
+            head = AnalysisResult.from_dict(head_future.result())
+    return FailureDiff.from_results(base, head, signature)
@@ -0,0 +1,119 @@
+# Groups every failure block of a log by a normalized signature of its stack trace or message
+###########################################
+
+import re  # For normalizing failure signatures
+import hashlib  # For the signature hashes
+import consts  # For constants
+
+_NORMALIZERS = [(re.compile(pattern), replacement) for pattern, replacement in consts.SIGNATURE_NORMALIZERS]
+
+
+def _normalize_line(line: str) -> str:
+    for pattern, replacement in _NORMALIZERS:
+        line = pattern.sub(replacement, line)
+    return line.strip()
+
+
+def normalize_failure_signature(reason_lines):
+    """
+    Returns the (hash, spec, message) signature of a failure block's reason lines. The spec is the first reason
+    line and the message the first non-empty line after it, both with counts, timestamps, durations and line
+    numbers stripped, so the same failure has the same hash in every run.
+    """
+    spec = _normalize_line(reason_lines[0]) if reason_lines else ""
+    message = next((normalized for normalized in map(_normalize_line, reason_lines[1:]) if normalized), "")
+    signature_hash = hashlib.sha1(f"{spec}\n{message}".encode('utf-8')).hexdigest()
+    return signature_hash, spec, message
+
+
+def stack_signature(reason_lines) -> str:
+    """
+    Returns the hash of every normalized reason line, so two failures only share it when their spec, message
+    and whole captured stack agree. Lines are hashed one at a time, nothing is joined.
+    """
+    digest = hashlib.sha1()
+    for line in reason_lines:
+        normalized = _normalize_line(line)
+        if normalized:
+            digest.update(normalized.encode('utf-8') + b"\n")
+    return digest.hexdigest()
+
+
+def failure_signature(reason_lines, signature: str = consts.DEFAULT_GROUP_SIGNATURE) -> str:
+    """Returns the "stack" or "message" signature hash of a failure block's reason lines."""
+    if signature == "message":
+        return normalize_failure_signature(reason_lines)[0]
+    return stack_signature(reason_lines)
+
+
+def group_by_from_config(config):
+    """Returns the signature failures are grouped by from the failure_grouping section, or None when disabled."""
+    grouping_config = (config or {}).get('failure_grouping', {}) or {}
+    if not grouping_config.get('enabled', False):
+        return None
+    return grouping_config.get('signature') or consts.DEFAULT_GROUP_SIGNATURE
+
+
+class FailureGroup:
+    """
+    Every failure block of a log sharing one signature: the first block, kept whole, plus how many blocks there
+    were and where the last one was found.
+    """
+    __slots__ = ('signature', 'block', 'count', 'last_offset', 'last_line_number', 'last_fail_count')
+    # What to_dict and from_dict carry, the block is stored with the other failures
+    FIELDS = ('signature', 'count', 'last_offset', 'last_line_number', 'last_fail_count')
+
+    def __init__(self, signature, block, count=1, last_offset=None, last_line_number=None, last_fail_count=None):
+        self.signature = signature
+        self.block = block
+        self.count = count
+        self.last_offset = block.offset if last_offset is None else last_offset
+        self.last_line_number = block.line_number if last_line_number is None else last_line_number
+        self.last_fail_count = block.fail_count if last_fail_count is None else last_fail_count
+
+    def add(self, block):
+        """Counts another occurrence, which only moves the last position."""
+        self.count += 1
+        self.last_offset = block.offset
+        self.last_line_number = block.line_number
+        self.last_fail_count = block.fail_count
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data, block):
+        return cls(block=block, **{field: data[field] for field in cls.FIELDS if field in data})
+
+
+class FailureGroups:
+    """
+    Groups failure blocks as they are found, in the order each signature first appears. Only the first block of
+    each group is kept, so memory grows with the number of distinct failures and not with the log.
+    """
+
+    def __init__(self, signature: str = consts.DEFAULT_GROUP_SIGNATURE):
+        if signature not in consts.GROUP_SIGNATURES:
+            raise ValueError(consts.UNKNOWN_GROUP_SIGNATURE_MESSAGE.format(signature))
+        self.signature = signature
+        self._groups = {}
+
+    def add(self, block):
+        """Adds a block and returns its group when the block started it, or None when it joined an existing one."""
+        signature_hash = failure_signature(block.reason_lines, self.signature)
+        group = self._groups.get(signature_hash)
+        if group is not None:
+            group.add(block)
+            return None
+        group = self._groups[signature_hash] = FailureGroup(signature_hash, block)
+        return group
+
+    @property
+    def occurrences(self) -> int:
+        return sum(group.count for group in self._groups.values())
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __iter__(self):
+        return iter(self._groups.values())
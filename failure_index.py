@@ -0,0 +1,288 @@
+# Persistent index of failures across runs, for finding recurring and flaky specs
+###########################################
+
+import os  # For file and directory operations
+import re  # For the family of a log
+import sys
+import time  # For ingestion times and formatting
+import sqlite3  # For the index itself
+import argparse  # For command line options
+from array import array  # For the sorted run times
+from bisect import bisect_left, insort  # For counting runs since a time
+import yaml  # For reading config file
+import consts  # For constants
+from log_analysis import LogAnalysis  # Log analysis tools
+import pattern_profiles  # For the configured pattern profiles
+from failure_groups import normalize_failure_signature  # For the signature of each failure
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    log_path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    run_time REAL NOT NULL,
+    failure_count INTEGER NOT NULL,
+    family TEXT,
+    UNIQUE (log_path, size, mtime_ns)
+);
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs (run_time);
+CREATE TABLE IF NOT EXISTS signatures (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    spec TEXT NOT NULL,
+    message TEXT NOT NULL,
+    occurrences INTEGER NOT NULL DEFAULT 0,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS signatures_by_occurrences ON signatures (occurrences DESC);
+CREATE INDEX IF NOT EXISTS signatures_by_last_seen ON signatures (last_seen DESC);
+CREATE TABLE IF NOT EXISTS occurrences (
+    signature_id INTEGER NOT NULL,
+    run_id INTEGER NOT NULL,
+    PRIMARY KEY (signature_id, run_id)
+) WITHOUT ROWID;
+"""
+
+# Digits in log names are run numbers, dates and times, which differ between the runs of one family
+_RUN_NUMBER_PATTERN = re.compile(r'\d+')
+
+
+def log_family(log_path: str) -> str:
+    """
+    Returns the family of a log: its directory and its name with every number replaced, so karma-1041.log and
+    karma-1042.log are runs of the same suite and api-2024-05-01.log is not.
+    """
+    log_path = os.path.abspath(log_path)
+    return os.path.join(os.path.dirname(log_path), _RUN_NUMBER_PATTERN.sub('#', os.path.basename(log_path)))
+
+
+class FailureIndex:
+    """
+    SQLite index of the failure signatures of every ingested log. Each log is a run keyed by its path, size and
+    mtime, so ingesting is incremental and idempotent. Per-signature counters and first/last seen times are kept
+    up to date on ingestion, so the queries only walk indexes. Flake rates only count the runs of the log
+    families (see log_family) a signature failed in, so other suites never dilute them.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.path.expanduser("~"), consts.FAILURE_INDEX_DIRECTORY_NAME,
+                                         consts.FAILURE_INDEX_FILE_NAME)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(_SCHEMA)
+        self._add_run_families()
+        # Sorted run times per log family, loaded on the first query that needs them
+        self._run_times = None
+
+    def _add_run_families(self):
+        """Indexes written before runs had a family get the column and the family of every run."""
+        with self.connection:
+            if 'family' not in {row['name'] for row in self.connection.execute("PRAGMA table_info(runs)")}:
+                self.connection.execute("ALTER TABLE runs ADD COLUMN family TEXT")
+            self.connection.executemany("UPDATE runs SET family = ? WHERE id = ?", [
+                (log_family(row['log_path']), row['id'])
+                for row in self.connection.execute("SELECT id, log_path FROM runs WHERE family IS NULL")])
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Opens the index described by the failure_index section of the config, or None when it is disabled, which
+        it is unless enabled is set.
+        """
+        index_config = (config or {}).get('failure_index', {}) or {}
+        if not index_config.get('enabled', False):
+            return None
+        return cls(index_config.get('path') or None)
+
+    @staticmethod
+    def _run_key(log_path: str):
+        stat = os.stat(log_path)
+        return os.path.abspath(log_path), stat.st_size, stat.st_mtime_ns
+
+    def is_ingested(self, log_path: str) -> bool:
+        """Returns whether the log, as it is on disk now, is already in the index."""
+        return self.connection.execute("SELECT 1 FROM runs WHERE log_path = ? AND size = ? AND mtime_ns = ?",
+                                       self._run_key(log_path)).fetchone() is not None
+
+    def ingest(self, result) -> bool:
+        """
+        Adds the failures of an AnalysisResult as one run, timed by the log's mtime. Returns False when the log
+        was already ingested.
+        """
+        log_path, size, mtime_ns = self._run_key(result.log_path)
+        run_time = mtime_ns / 1e9
+        family = log_family(log_path)
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO runs (log_path, size, mtime_ns, run_time, failure_count, family) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (log_path, size, mtime_ns, run_time, result.failure_count, family))
+            if not cursor.rowcount:
+                return False
+            run_id = cursor.lastrowid
+            if self._run_times is not None:
+                insort(self._run_times.setdefault(family, array('d')), run_time)
+
+            # A failure repeated within one run is counted once for that run
+            signatures = {}
+            for block in result.blocks:
+                signature_hash, spec, message = normalize_failure_signature(block.reason_lines)
+                signatures[signature_hash] = (spec, message)
+            for signature_hash, (spec, message) in signatures.items():
+                self.connection.execute(
+                    "INSERT INTO signatures (hash, spec, message, occurrences, first_seen, last_seen) "
+                    "VALUES (?, ?, ?, 1, ?, ?) ON CONFLICT (hash) DO UPDATE SET "
+                    "occurrences = occurrences + 1, first_seen = min(first_seen, excluded.first_seen), "
+                    "last_seen = max(last_seen, excluded.last_seen)",
+                    (signature_hash, spec, message, run_time, run_time))
+                self.connection.execute(
+                    "INSERT INTO occurrences (signature_id, run_id) SELECT id, ? FROM signatures WHERE hash = ?",
+                    (run_id, signature_hash))
+        return True
+
+    def ingest_directory(self, directory: str) -> int:
+        """Analyzes and ingests every log of the directory that is not in the index yet, returning how many."""
+        ingested = 0
+        for filename in LogAnalysis.get_files_from_dir(directory, False):
+            log_path = os.path.join(directory, filename)
+            if filename in consts.MACOS_SYSTEM_FILES or self.is_ingested(log_path):
+                continue
+            try:
+                mm = LogAnalysis.open_log(log_path)
+            except (OSError, ValueError):
+                # Empty or unreadable logs have nothing to ingest
+                continue
+            try:
+                result = LogAnalysis.analyze(mm, log_path)
+            finally:
+                mm.close()
+            ingested += self.ingest(result)
+        return ingested
+
+    def _runs_since(self, run_time: float, families) -> int:
+        """Returns how many runs of the log families happened at or after run_time."""
+        if self._run_times is None:
+            self._run_times = {}
+            for row in self.connection.execute("SELECT family, run_time FROM runs ORDER BY run_time"):
+                self._run_times.setdefault(row[0], array('d')).append(row[1])
+        runs = 0
+        for family in families:
+            run_times = self._run_times.get(family, ())
+            runs += len(run_times) - bisect_left(run_times, run_time)
+        return runs
+
+    def _with_flake_rate(self, rows):
+        """
+        Adds how many runs of the log families a signature failed in happened since it was first seen, and the
+        share of them it failed in.
+        """
+        signatures = []
+        for row in rows:
+            signature = dict(row)
+            families = [family for family, in self.connection.execute(
+                "SELECT DISTINCT runs.family FROM occurrences JOIN runs ON runs.id = occurrences.run_id "
+                "WHERE occurrences.signature_id = ?", (row['id'],))]
+            signature['runs_since_first_seen'] = self._runs_since(row['first_seen'], families)
+            signature['flake_rate'] = signature['occurrences'] / max(1, signature['runs_since_first_seen'])
+            signatures.append(signature)
+        return signatures
+
+    def top_recurring(self, limit: int = 20):
+        """Returns the signatures that failed in the most runs."""
+        return self._with_flake_rate(self.connection.execute(
+            "SELECT * FROM signatures ORDER BY occurrences DESC LIMIT ?", (limit,)))
+
+    def recent(self, limit: int = 20):
+        """Returns the signatures that failed most recently."""
+        return self._with_flake_rate(self.connection.execute(
+            "SELECT * FROM signatures ORDER BY last_seen DESC LIMIT ?", (limit,)))
+
+    def flaky(self, limit: int = 20, min_occurrences: int = 2, candidates: int = 500):
+        """
+        Returns recurring signatures that did not fail in every run since they first appeared, most flaky (closest
+        to failing half the time) first. Only the candidates most recurring signatures are considered.
+        """
+        signatures = [signature for signature in self.top_recurring(candidates)
+                      if signature['occurrences'] >= min_occurrences and signature['flake_rate'] < 1]
+        signatures.sort(key=lambda signature: abs(signature['flake_rate'] - 0.5))
+        return signatures[:limit]
+
+    def history(self, signature_hash: str):
+        """Returns the signature whose hash starts with signature_hash and the log paths of the runs it failed in."""
+        row = self.connection.execute("SELECT * FROM signatures WHERE hash >= ? AND hash < ? LIMIT 1",
+                                      (signature_hash, signature_hash + "g")).fetchone()
+        if row is None:
+            return None
+        signature = self._with_flake_rate([row])[0]
+        signature['runs'] = [run['log_path'] for run in self.connection.execute(
+            "SELECT runs.log_path FROM occurrences JOIN runs ON runs.id = occurrences.run_id "
+            "WHERE occurrences.signature_id = ? ORDER BY runs.run_time", (row['id'],))]
+        return signature
+
+    def close(self):
+        self.connection.close()
+
+
+def _format_time(seconds: float) -> str:
+    return time.strftime(consts.FAILURE_INDEX_TIME_FORMAT, time.localtime(seconds))
+
+
+def print_signatures(signatures):
+    """Prints signatures as a table, most relevant first."""
+    print(consts.FAILURE_INDEX_TOP_HEADER.format("hash", "runs", "rate", "first seen", "last seen", "spec"))
+    for signature in signatures:
+        print(consts.FAILURE_INDEX_TOP_LINE.format(signature['hash'][:7], signature['occurrences'],
+                                                   signature['flake_rate'], _format_time(signature['first_seen']),
+                                                   _format_time(signature['last_seen']), signature['spec']))
+
+
+def main_run_failure_index(index_config, argv=None):
+    """Ingests logs into the failure index or queries it, without any prompts."""
+    parser = argparse.ArgumentParser(description="Track failures across runs.")
+    parser.add_argument("--index", help="Path of the SQLite index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Ingest the logs of a directory not indexed yet")
+    ingest_parser.add_argument("directory", nargs="?", help="Log directory, the configured one by default")
+    for command in ("top", "recent", "flaky"):
+        query_parser = subparsers.add_parser(command, help=f"List the {command} failures")
+        query_parser.add_argument("-n", "--limit", type=int, default=20)
+    show_parser = subparsers.add_parser("show", help="Show one signature and the runs it failed in")
+    show_parser.add_argument("signature", help="Signature hash or its prefix")
+    args = parser.parse_args(argv)
+
+    index_config = index_config or {}
+    pattern_profiles.load_profiles(index_config)
+    failure_index = FailureIndex(args.index or index_config.get('failure_index', {}).get('path') or None)
+    try:
+        if args.command == "ingest":
+            directory = args.directory or index_config.get('log_location', {}).get('where_are_your_logs_located')
+            if not directory:
+                print(consts.NO_LOG_DIRECTORY_MESSAGE)
+                sys.exit(2)
+            print(consts.FAILURE_INDEX_INGESTED_MESSAGE.format(failure_index.ingest_directory(directory),
+                                                               failure_index.path))
+        elif args.command == "show":
+            signature = failure_index.history(args.signature)
+            if signature:
+                print_signatures([signature])
+                print(signature['message'])
+                for log_path in signature['runs']:
+                    print(f"{consts.TAB_INDENT}{log_path}")
+        else:
+            print_signatures(getattr(failure_index, {"top": "top_recurring"}.get(args.command, args.command))(
+                args.limit))
+    finally:
+        failure_index.close()
+
+
+if __name__ == "__main__":
+    try:
+        with open('config.yaml', 'r') as file:
+            config = yaml.safe_load(file)
+    except FileNotFoundError:
+        config = None
+
+    main_run_failure_index(config)
@@ -0,0 +1,201 @@
+# Splits failure blocks into suite, spec, error type, message and stack frames, and indexes them for filtering
+###########################################
+
+import re  # For parsing reason lines
+from bisect import bisect_left  # For prefix lookups in the index vocabulary
+import consts  # For constants
+
+_TITLE_PATTERN = re.compile(consts.SPEC_TITLE_PATTERN)
+_PROGRESS_PATTERN = re.compile(consts.SPEC_PROGRESS_PATTERN)
+_SUITE_SEPARATOR_PATTERN = re.compile(consts.SPEC_SUITE_SEPARATOR_PATTERN)
+_FRAME_PATTERNS = [re.compile(pattern) for pattern in consts.STACK_FRAME_PATTERNS]
+_ERROR_TYPE_PATTERN = re.compile(consts.ERROR_TYPE_PATTERN)
+_SOURCE_EXCERPT_PATTERN = re.compile(consts.SOURCE_EXCERPT_PATTERN)
+_SOURCE_FILE_PREFIX_PATTERN = re.compile(consts.SOURCE_FILE_PREFIX_PATTERN)
+_TOKEN_PATTERN = re.compile(r'[\w$]+')
+
+
+def _tokens(text: str):
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def clean_source_file(file: str) -> str:
+    """Returns a file without the server, the _karma_webpack_ directory, the webpack:// scheme and the query."""
+    return _SOURCE_FILE_PREFIX_PATTERN.sub('', file.split('?', 1)[0], count=1)
+
+
+class StackFrame:
+    """One "at ..." frame of a failure: the function, when named, and the file, line and column it points at."""
+    __slots__ = ('function', 'file', 'line', 'column')
+
+    def __init__(self, function: str, file: str, line: int, column: int):
+        self.function = function
+        self.file = file
+        self.line = line
+        self.column = column
+
+    @property
+    def source_file(self) -> str:
+        return clean_source_file(self.file)
+
+    @property
+    def location(self) -> str:
+        return f"{self.file}:{self.line}:{self.column}"
+
+    def to_dict(self):
+        return {'function': self.function, 'file': self.file, 'line': self.line, 'column': self.column}
+
+
+def match_stack_frame(line: str):
+    """Returns the match of a V8, Firefox or Safari stack trace line, with function, file, line and column groups."""
+    for pattern in _FRAME_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            return match
+    return None
+
+
+def parse_stack_frame(line: str):
+    """Returns the StackFrame of a stack trace line, or None when it is not one."""
+    match = match_stack_frame(line)
+    if match is None:
+        return None
+    return StackFrame(match.group('function') or "", match.group('file'), int(match.group('line')),
+                      int(match.group('column')))
+
+
+class FailureSpec:
+    """
+    A failure block split into the describe blocks it ran in, its spec name, the type of its error, the first
+    line of its message and its stack frames.
+    """
+    __slots__ = ('suite_path', 'spec_name', 'error_type', 'message', 'frames')
+
+    def __init__(self, suite_path=(), spec_name: str = "", error_type: str = "", message: str = "", frames=None):
+        self.suite_path = tuple(suite_path)
+        self.spec_name = spec_name
+        self.error_type = error_type
+        self.message = message
+        self.frames = frames if frames is not None else []
+
+    @property
+    def files(self):
+        """The source files of the frames in order, each once."""
+        return list(dict.fromkeys(frame.source_file for frame in self.frames))
+
+    def field_text(self, field: str) -> str:
+        """Returns the text of one of consts.SPEC_INDEX_FIELDS."""
+        if field == "suite":
+            return " ".join(self.suite_path)
+        if field == "spec":
+            return self.spec_name
+        if field == "error":
+            return self.error_type
+        if field == "file":
+            return " ".join(self.files)
+        return self.message
+
+    def to_dict(self):
+        return {'suite_path': list(self.suite_path), 'spec_name': self.spec_name, 'error_type': self.error_type,
+                'message': self.message, 'frames': [frame.to_dict() for frame in self.frames]}
+
+
+def parse_failure_spec(reason_lines) -> FailureSpec:
+    """
+    Parses the reason lines of a failure block. Jest and reporters that separate describe blocks with › or >
+    give the whole suite path; Karma joins them with spaces, so its first word is taken as the suite and the
+    rest as the spec. The error type is the class of the first error line (TypeError, Error...) or
+    "Expected" for a failed expectation.
+    """
+    title = _TITLE_PATTERN.match(reason_lines[0].strip()).group('title') if reason_lines else ""
+    if _PROGRESS_PATTERN.match(title):
+        title = ""
+    names = _SUITE_SEPARATOR_PATTERN.split(title) if title else []
+    if len(names) == 1:
+        names = names[0].split(" ", 1)
+    spec = FailureSpec(names[:-1], names[-1] if names else "")
+
+    for line in reason_lines[1:]:
+        if not line.strip():
+            continue
+        frame = parse_stack_frame(line)
+        if frame is not None:
+            spec.frames.append(frame)
+        elif not spec.frames and not _SOURCE_EXCERPT_PATTERN.match(line):
+            # The message and the error are only looked for before the stack trace starts
+            if not spec.message:
+                spec.message = line.strip()
+            if not spec.error_type:
+                match = _ERROR_TYPE_PATTERN.match(line)
+                if match:
+                    spec.error_type = match.group('error') or consts.EXPECTATION_ERROR_TYPE
+    return spec
+
+
+class FailureSpecIndex:
+    """
+    An inverted index from the lowercased words of every field of consts.SPEC_INDEX_FIELDS to the ordinals of
+    the failure blocks holding them. Each field keeps a sorted vocabulary, so a query word matches every word
+    starting with it through one binary search, and a query over thousands of failures only touches the
+    postings of its own words.
+    """
+
+    def __init__(self, blocks=()):
+        self.specs = []
+        self._postings = {field: {} for field in consts.SPEC_INDEX_FIELDS}
+        # Sorted words of each field, rebuilt on the first query after a block was added
+        self._vocabularies = {}
+        for block in blocks:
+            self.add(block)
+
+    def add(self, block):
+        """Indexes the next block, whose ordinal is the number of blocks added before it."""
+        ordinal = len(self.specs)
+        spec = block.spec
+        self.specs.append(spec)
+        for field, postings in self._postings.items():
+            for token in set(_tokens(spec.field_text(field))):
+                postings.setdefault(token, []).append(ordinal)
+        self._vocabularies.clear()
+
+    def __len__(self):
+        return len(self.specs)
+
+    def _matching(self, field: str, prefix: str) -> set:
+        vocabulary = self._vocabularies.get(field)
+        if vocabulary is None:
+            vocabulary = self._vocabularies[field] = sorted(self._postings[field])
+        postings = self._postings[field]
+        ordinals = set()
+        idx = bisect_left(vocabulary, prefix)
+        while idx < len(vocabulary) and vocabulary[idx].startswith(prefix):
+            ordinals.update(postings[vocabulary[idx]])
+            idx += 1
+        return ordinals
+
+    def search(self, query: str):
+        """
+        Returns the ordinals of the blocks matching every term of the query, in order. A term is field:value or a
+        value matched against every field, and a leading - excludes what it matches. Each word of a value matches
+        the words of the field starting with it.
+        """
+        included = None
+        excluded = set()
+        for term in query.split():
+            negated = term.startswith("-") and len(term) > 1
+            if negated:
+                term = term[1:]
+            field, separator, value = term.partition(":")
+            if separator and field in self._postings:
+                fields = (field,)
+            else:
+                fields, value = consts.SPEC_INDEX_FIELDS, term
+            for token in _tokens(value):
+                matches = set().union(*(self._matching(name, token) for name in fields))
+                if negated:
+                    excluded |= matches
+                else:
+                    included = matches if included is None else included & matches
+        if included is None:
+            included = range(len(self.specs))
+        return [ordinal for ordinal in sorted(included) if ordinal not in excluded]
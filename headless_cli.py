@@ -0,0 +1,302 @@
+# Headless command line for CI: analyzes logs without prompts or an editor and exits non-zero on failures
+###########################################
+
+import os  # For file and directory operations
+import sys
+import glob  # For glob inputs
+import json  # For the json output
+import argparse  # For command line options
+import yaml  # For reading config file
+import consts  # For constants
+from log_analysis import LogAnalysis, ReasonLimits  # Log analysis tools
+from analysis_result import (AnalysisResult, write_failure_block_text, write_junit_footer, write_junit_header,
+                             write_junit_testsuite, write_text_blocks)
+from failure_groups import group_by_from_config  # For grouping every failure block
+from failure_diff import diff_logs, write_diff_json, write_diff_text  # For comparing two runs
+from failure_specs import FailureSpecIndex  # For filtering failures by suite, spec, error or file
+from source_maps import SourceMapResolver  # For resolving bundled stack frames
+import pattern_profiles  # For the configured pattern profiles
+
+
+def expand_log_paths(inputs, recursive: bool = False):
+    """
+    Returns the logs named by inputs, which are files, glob patterns or directories (whose files are taken in
+    name order, recursively with recursive), in order and each once. Files that do not exist are kept so they are
+    reported as errors.
+    """
+    log_paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                for root, directories, files in os.walk(item):
+                    directories.sort()
+                    log_paths += [os.path.join(root, f) for f in sorted(files) if f not in consts.MACOS_SYSTEM_FILES]
+            else:
+                log_paths += [os.path.join(item, f) for f in sorted(os.listdir(item))
+                              if f not in consts.MACOS_SYSTEM_FILES and os.path.isfile(os.path.join(item, f))]
+        elif glob.has_magic(item):
+            log_paths += [path for path in sorted(glob.glob(item, recursive=True)) if os.path.isfile(path)]
+        else:
+            log_paths.append(item)
+    return list(dict.fromkeys(log_paths))
+
+
+def analyze_log_path(log_path: str, workers: int = 1, reason_limits: ReasonLimits = None, group_by: str = None,
+                     failure_callback=None, source_maps: SourceMapResolver = None) -> AnalysisResult:
+    """
+    Opens, analyzes and closes one log, calling failure_callback with every block as it is found. With
+    source_maps the stack frames of every reported block are resolved before it is passed on.
+    """
+    if source_maps is not None:
+        # The callback sees exactly the blocks of the result, also the first of each group when grouping
+        streamed_callback = failure_callback
+
+        def failure_callback(block):
+            source_maps.resolve_block(block)
+            if streamed_callback is not None:
+                streamed_callback(block)
+    mm = LogAnalysis.open_log(log_path)
+    try:
+        return LogAnalysis.analyze(mm, log_path, workers, reason_limits, group_by, failure_callback)
+    finally:
+        mm.close()
+
+
+def _analyze_in_worker(log_path: str, reason_limits: ReasonLimits, group_by: str,
+                       source_maps: SourceMapResolver = None):
+    """Worker entry point: returns the result as a dictionary and no error, or no result and the error."""
+    try:
+        return analyze_log_path(log_path, 1, reason_limits, group_by, source_maps=source_maps).to_dict(), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _write_result(output, output_format: str, result: AnalysisResult, error: str, streamed: bool):
+    """Writes one analyzed log, or its error, without repeating what was already streamed."""
+    if output_format == "junit":
+        write_junit_testsuite(result, output, error)
+    elif output_format == "json":
+        log_result = result.to_dict()
+        log_result['error'] = error
+        output.write(json.dumps(log_result) + "\n")
+    elif error:
+        if not streamed:
+            output.write(consts.BATCH_FILE_HEADER.format(result.log_path) + "\n")
+        output.write(consts.HEADLESS_LOG_ERROR_MESSAGE.format(result.log_path, error) + "\n")
+    elif not streamed:
+        output.write(consts.BATCH_FILE_HEADER.format(result.log_path) + "\n")
+        write_text_blocks(result.blocks, output, result.groups)
+    elif not result.blocks:
+        # Streamed text only learns that a log had no failures at its end
+        write_text_blocks([], output)
+    output.flush()
+
+
+def _failure_block_writer(stream_to):
+    """Returns a failure callback writing every block to stream_to as soon as it is found."""
+    def write_block(block):
+        write_failure_block_text(stream_to, block)
+        stream_to.flush()
+    return write_block
+
+
+def _iter_results(log_paths, jobs: int, workers: int, reason_limits: ReasonLimits, group_by: str, config,
+                  stream_to=None, source_maps: SourceMapResolver = None):
+    """
+    Yields (result, error, streamed) for every log in order. With one job the logs are analyzed here and, when
+    stream_to is given and nothing is grouped, every failure block is written to it as soon as it is found.
+    """
+    if jobs > 1 and len(log_paths) > 1:
+        # Imported here so analyzing a single log does not pay for importing multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # Workers compile the configured profiles once when they start
+        with ProcessPoolExecutor(max_workers=jobs, initializer=pattern_profiles.load_profiles,
+                                 initargs=(config,)) as executor:
+            for log_path, (result_dict, error) in zip(log_paths, executor.map(
+                    _analyze_in_worker, log_paths, [reason_limits] * len(log_paths),
+                    [group_by] * len(log_paths), [source_maps] * len(log_paths))):
+                result = AnalysisResult.from_dict(result_dict) if result_dict else AnalysisResult(log_path)
+                yield result, error, False
+        return
+
+    for log_path in log_paths:
+        streamed = stream_to is not None and not group_by
+        if streamed:
+            stream_to.write(consts.BATCH_FILE_HEADER.format(log_path) + "\n")
+            stream_to.flush()
+        failure_callback = _failure_block_writer(stream_to) if streamed else None
+        try:
+            yield analyze_log_path(log_path, workers, reason_limits, group_by, failure_callback,
+                                   source_maps), None, streamed
+        except Exception as e:
+            yield AnalysisResult(log_path), str(e), streamed
+
+
+def filter_result(result: AnalysisResult, failure_filter: str) -> AnalysisResult:
+    """Returns the result with only the failures matching a FailureSpecIndex query."""
+    return result.filtered(FailureSpecIndex(result.blocks).search(failure_filter))
+
+
+def run_headless(log_paths, output, output_format: str = "text", jobs: int = 1, workers: int = 1,
+                 reason_limits: ReasonLimits = None, group_by: str = None, config=None, failure_filter: str = None,
+                 source_maps: SourceMapResolver = None):
+    """
+    Analyzes every log and writes the results to the output file object as they complete. Returns the number of
+    logs with failures, the number of failures and the number of logs that could not be analyzed. With
+    failure_filter only the failures matching it are written and counted, and with source_maps stack frames
+    point into the original sources.
+    """
+    logs_with_failures = failure_count = errors = 0
+    if output_format == "junit":
+        write_junit_header(output)
+    # Filtered failures are only known once a whole log is analyzed, so they are not streamed
+    stream_to = output if output_format == "text" and not failure_filter else None
+    for result, error, streamed in _iter_results(log_paths, jobs, workers, reason_limits, group_by, config,
+                                                 stream_to, source_maps):
+        if failure_filter and not error:
+            result = filter_result(result, failure_filter)
+        _write_result(output, output_format, result, error, streamed)
+        errors += bool(error)
+        logs_with_failures += bool(result.failure_count)
+        failure_count += result.failure_count
+    if output_format == "junit":
+        write_junit_footer(output)
+    output.flush()
+    return logs_with_failures, failure_count, errors
+
+
+def run_headless_diff(base_path: str, head_path: str, output, output_format: str = "text",
+                      reason_limits: ReasonLimits = None, group_by: str = None,
+                      signature: str = consts.DEFAULT_DIFF_SIGNATURE, config=None):
+    """Writes the new, fixed and persisting failures of head_path compared with base_path and returns the diff."""
+    diff = diff_logs(base_path, head_path, reason_limits, group_by, signature, config)
+    write_headless_diff(diff, output, output_format)
+    return diff
+
+
+def write_headless_diff(diff, output, output_format: str = "text"):
+    """Writes a diff as text or JSON to the output file object."""
+    if output_format == "json":
+        write_diff_json(diff, output)
+    else:
+        write_diff_text(diff, output)
+    output.flush()
+
+
+def main_run_headless_version(headless_config, argv=None) -> int:
+    """Runs the headless command line and returns its exit code, it never prompts or opens an editor."""
+    parser = argparse.ArgumentParser(
+        description="Analyze test logs without prompts. Exits 0 without failures, 1 with failures and 2 when a log "
+                    "could not be analyzed.")
+    parser.add_argument("inputs", nargs="*", help="Log files, glob patterns or directories, the configured log "
+                                                  "directory by default")
+    parser.add_argument("-f", "--format", choices=consts.HEADLESS_OUTPUT_FORMATS, default="text",
+                        help="text, json (one object per log and line) or junit")
+    parser.add_argument("-o", "--output", default="-", help="Output file, - for stdout")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Also analyze logs in subdirectories")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Logs analyzed at the same time, 0 for one per CPU")
+    parser.add_argument("--workers", type=int, help="Processes scanning each large log, analysis_workers by default")
+    parser.add_argument("--profile", help="Pattern profile to use instead of the configured one")
+    parser.add_argument("--group-by", choices=consts.GROUP_SIGNATURES, help="Report every failure block grouped "
+                                                                            "by this signature")
+    parser.add_argument("--max-lines", type=int, help="Reason lines captured per failure, 0 for no limit")
+    parser.add_argument("--filter", metavar="QUERY", help="Only report and count the failures matching QUERY, "
+                                                          "e.g. 'error:TypeError file:app.component -suite:Legacy'")
+    parser.add_argument("--source-maps", metavar="DIRECTORY", action="append",
+                        help="Resolve bundled stack frames through the source maps of DIRECTORY, can be repeated")
+    parser.add_argument("--exit-zero", action="store_true", help="Exit 0 even when failures are found")
+    parser.add_argument("--diff", metavar="BASE", help="Compare the one input with BASE, a log or a stored JSON "
+                                                       "result, and exit 1 only when it has new failures")
+    parser.add_argument("--diff-by", choices=consts.GROUP_SIGNATURES, default=consts.DEFAULT_DIFF_SIGNATURE,
+                        help="Signature failures are matched by when comparing")
+    args = parser.parse_args(argv)
+
+    headless_config = dict(headless_config or {})
+    if args.profile:
+        headless_config['pattern_profiles'] = dict(headless_config.get('pattern_profiles') or {},
+                                                   profile=args.profile)
+    if args.source_maps:
+        headless_config['source_maps'] = dict(headless_config.get('source_maps') or {}, enabled=True,
+                                              directories=args.source_maps)
+    if args.max_lines is not None:
+        headless_config['reason_extraction'] = dict(headless_config.get('reason_extraction') or {},
+                                                    max_lines=args.max_lines)
+    try:
+        pattern_profiles.load_profiles(headless_config)
+    except ValueError as e:
+        parser.error(str(e))
+    reason_limits = ReasonLimits.from_config(headless_config)
+    group_by = args.group_by or group_by_from_config(headless_config)
+    workers = args.workers if args.workers is not None else \
+        headless_config.get('performance', {}).get('analysis_workers', 1)
+    jobs = args.jobs or os.cpu_count() or 1
+
+    inputs = args.inputs or [headless_config.get('log_location', {}).get('where_are_your_logs_located')]
+    if not inputs[0]:
+        parser.error(consts.NO_LOG_DIRECTORY_MESSAGE)
+    log_paths = expand_log_paths(inputs, args.recursive)
+    if not log_paths:
+        print(consts.HEADLESS_NO_LOGS_MESSAGE.format(" ".join(inputs)), file=sys.stderr)
+        return consts.HEADLESS_EXIT_ERROR
+
+    if args.diff:
+        if len(log_paths) != 1:
+            parser.error(consts.DIFF_NEEDS_ONE_LOG_MESSAGE)
+        if args.format not in consts.DIFF_OUTPUT_FORMATS:
+            parser.error(consts.DIFF_OUTPUT_FORMAT_MESSAGE.format(", ".join(consts.DIFF_OUTPUT_FORMATS)))
+        return _main_run_diff(args, log_paths[0], reason_limits, group_by, headless_config)
+
+    output = sys.stdout if args.output == "-" else open(args.output, 'w')
+    try:
+        logs_with_failures, failure_count, errors = run_headless(log_paths, output, args.format, jobs, workers,
+                                                                 reason_limits, group_by, headless_config,
+                                                                 args.filter,
+                                                                 SourceMapResolver.from_config(headless_config))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    # The summary goes to stderr so stdout stays parseable
+    print(consts.HEADLESS_SUMMARY_MESSAGE.format(len(log_paths), logs_with_failures, failure_count, errors),
+          file=sys.stderr)
+    if errors:
+        return consts.HEADLESS_EXIT_ERROR
+    if failure_count and not args.exit_zero:
+        return consts.HEADLESS_EXIT_FAILURES
+    return consts.HEADLESS_EXIT_OK
+
+
+def _main_run_diff(args, head_path: str, reason_limits: ReasonLimits, group_by: str, headless_config) -> int:
+    try:
+        diff = diff_logs(args.diff, head_path, reason_limits, group_by, args.diff_by, headless_config)
+    except Exception as e:
+        print(consts.AN_ERROR_OCCURRED_MESSAGE.format(e), file=sys.stderr)
+        return consts.HEADLESS_EXIT_ERROR
+
+    # Only analysis errors are reported above, a reader going away while the diff is written is not one
+    output = sys.stdout if args.output == "-" else open(args.output, 'w')
+    try:
+        write_headless_diff(diff, output, args.format)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(diff.format_summary(), file=sys.stderr)
+    if diff.new and not args.exit_zero:
+        return consts.HEADLESS_EXIT_FAILURES
+    return consts.HEADLESS_EXIT_OK
+
+
+if __name__ == "__main__":
+    try:
+        with open('config.yaml', 'r') as file:
+            config = yaml.safe_load(file)
+    except FileNotFoundError:
+        config = None
+
+    try:
+        sys.exit(main_run_headless_version(config))
+    except BrokenPipeError:
+        # The reader (head, less) went away, which is not worth a traceback
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(consts.HEADLESS_EXIT_BROKEN_PIPE)
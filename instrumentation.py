@@ -0,0 +1,181 @@
+# Opt-in timing breakdown of one analysis, with JSON and cProfile exports
+###########################################
+
+import os  # For file and directory operations
+import sys
+import json  # For the exported timings
+import time  # For timing the stages
+import cProfile  # For the optional profile of a run
+from contextlib import contextmanager, nullcontext  # For timing stages
+import consts  # For constants
+import utilities as utils  # For unique export names
+
+try:
+    # Memory high-water marks are only known where the resource module exists
+    import resource
+except ImportError:
+    resource = None
+
+MEGABYTE = 1024 * 1024
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process and its children in MB, or None when unknown."""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # macOS reports bytes, Linux kilobytes
+    return peak / MEGABYTE if sys.platform == "darwin" else peak / 1024
+
+
+def timed(instrumentation, stage_name: str):
+    """Times the with block as a stage of instrumentation, or does nothing when instrumentation is None."""
+    return nullcontext() if instrumentation is None else instrumentation.stage(stage_name)
+
+
+class Instrumentation:
+    """
+    Records where one analysis spends its time: seconds and calls per stage (open, cache, scan, decode, group,
+    resolve, report, index, render), bytes scanned, failures and reason bytes found, and the memory high-water
+    mark. Stages are timed around the scanner, never inside its loop, so the split between regex matching and
+    walking reason lines is left to the optional cProfile profile.
+    """
+
+    def __init__(self, profile: bool = False, export_directory: str = None):
+        self.stages = {}
+        self.counters = {}
+        self.export_directory = export_directory
+        self.profiler = cProfile.Profile() if profile else None
+        self.log_path = None
+        self.started = None
+        self.stopped = False
+        self.seconds = 0.0
+        self.peak_rss_mb = None
+        self._rss_before_mb = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Returns a fresh Instrumentation as described by the instrumentation section, or None when disabled."""
+        instrumentation_config = (config or {}).get('instrumentation', {}) or {}
+        if not instrumentation_config.get('enabled', False):
+            return None
+        return cls(instrumentation_config.get('profile', False),
+                   instrumentation_config.get('export_directory') or None)
+
+    def start(self, log_path: str = None):
+        """Starts the run, and the profiler of the calling thread when profiling."""
+        self.log_path = log_path
+        self._rss_before_mb = peak_rss_mb()
+        self.started = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self):
+        """Ends the run, which is how long the analysis took and how much the memory high-water mark grew."""
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.started is not None:
+            self.seconds += time.perf_counter() - self.started
+            self.started = None
+        self.stopped = True
+        self.peak_rss_mb = peak_rss_mb()
+
+    @contextmanager
+    def stage(self, stage_name: str):
+        """Adds the time spent in the with block to the stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage_name, time.perf_counter() - started)
+
+    def add_time(self, stage_name: str, seconds: float, calls: int = 1):
+        stage = self.stages.setdefault(stage_name, {'seconds': 0.0, 'calls': 0})
+        stage['seconds'] += seconds
+        stage['calls'] += calls
+        # Stages timed after the run stopped, like rendering the report in the GUI, extend it
+        if self.stopped:
+            self.seconds += seconds
+
+    def count(self, counter_name: str, amount: int = 1):
+        self.counters[counter_name] = self.counters.get(counter_name, 0) + amount
+
+    def timed_blocks(self, blocks, scanned_bytes: int = None):
+        """
+        Yields the blocks of a failure block iterator, timing how long each took to be found as the scan stage
+        and decoding its reasons as the decode stage, and counting failures and reason bytes.
+        """
+        if scanned_bytes is not None:
+            self.count('bytes_scanned', scanned_bytes)
+        scan_seconds = decode_seconds = 0.0
+        block_count = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    block = next(blocks)
+                except StopIteration:
+                    scan_seconds += time.perf_counter() - started
+                    return
+                decoded = time.perf_counter()
+                # Decoding would happen later anyway, doing it here attributes its time
+                block.reason_lines
+                decode_seconds += time.perf_counter() - decoded
+                scan_seconds += decoded - started
+                block_count += 1
+                if block.reason_offset >= 0:
+                    self.count('reason_bytes', block.reason_end_offset - block.reason_offset)
+                yield block
+        finally:
+            blocks.close()
+            self.add_time('scan', scan_seconds)
+            self.add_time('decode', decode_seconds, block_count)
+            self.count('failures_found', block_count)
+
+    def to_dict(self):
+        return {
+            'log_path': self.log_path,
+            'seconds': self.seconds,
+            'stages': self.stages,
+            'counters': self.counters,
+            'peak_rss_mb': self.peak_rss_mb,
+            'peak_rss_growth_mb': (self.peak_rss_mb - self._rss_before_mb
+                                   if self.peak_rss_mb is not None and self._rss_before_mb is not None else None),
+        }
+
+    def format_summary(self) -> str:
+        """Returns the breakdown as a few lines of text, slowest stage first."""
+        lines = [consts.INSTRUMENTATION_TOTAL_LINE.format(self.seconds)]
+        for stage_name, stage in sorted(self.stages.items(), key=lambda item: -item[1]['seconds']):
+            share = stage['seconds'] / self.seconds if self.seconds else 0
+            lines.append(consts.INSTRUMENTATION_STAGE_LINE.format(stage_name, stage['seconds'], share,
+                                                                  stage['calls']))
+        scanned = self.counters.get('bytes_scanned', 0)
+        scan_seconds = self.stages.get('scan', {}).get('seconds', 0)
+        lines.append(consts.INSTRUMENTATION_COUNTERS_LINE.format(
+            scanned / MEGABYTE, scanned / MEGABYTE / scan_seconds if scan_seconds else 0,
+            self.counters.get('failures_found', 0), self.counters.get('reason_bytes', 0)))
+        if self.peak_rss_mb is not None:
+            lines.append(consts.INSTRUMENTATION_MEMORY_LINE.format(self.peak_rss_mb,
+                                                                   self.to_dict()['peak_rss_growth_mb']))
+        return "\n".join(lines)
+
+    def export(self, directory: str = None):
+        """
+        Writes the breakdown as JSON, plus the cProfile profile when profiling, to directory (the configured
+        export directory by default) and returns the written paths.
+        """
+        directory = directory or self.export_directory
+        if not directory:
+            return []
+        os.makedirs(directory, exist_ok=True)
+        paths = [utils.create_unique_filename(directory, prefix=f"{os.path.basename(self.log_path or 'analysis')}-",
+                                              suffix=".json")]
+        with open(paths[0], 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+        if self.profiler is not None:
+            # Named after the JSON file so the two stay paired
+            paths.append(paths[0][:-len(".json")] + ".prof")
+            self.profiler.dump_stats(paths[1])
+        return paths
@@ -0,0 +1,214 @@
+# Line-start offset index of a raw log, for jumping from a failure to its origin and searching the log
+###########################################
+
+import os  # For file and directory operations
+import re  # For finding line starts and searching
+import struct  # For the sidecar header
+import hashlib  # For naming sidecar files
+import tempfile  # For the sidecar location
+from array import array  # For the compact offset index
+from bisect import bisect_right  # For finding the line of an offset
+import consts  # For constants
+from compressed_log import CompressedLog  # For reading compressed logs as streams
+
+# Magic, log size, log mtime, stride and line count
+_SIDECAR_HEADER = struct.Struct("<8sQQQQ")
+_SIDECAR_MAGIC = b"TCALIDX1"
+# Newlines are counted in slices of this size so no large copy is ever made
+_COUNT_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def _count_newlines(mm, start: int, end: int) -> int:
+    count = 0
+    for chunk_start in range(start, end, _COUNT_CHUNK_BYTES):
+        count += mm[chunk_start:min(end, chunk_start + _COUNT_CHUNK_BYTES)].count(b"\n")
+    return count
+
+
+class LineIndex:
+    """
+    The start offset of every stride-th line of a log as an array('Q'), so any line is found with one lookup and
+    at most stride - 1 newline searches. With the default stride of 64 it takes 1/8 byte per line and is built in
+    one regex pass over the mmap. It is persisted in a sidecar file keyed by the log path, and is reused as long
+    as the log keeps its size and mtime.
+    """
+
+    def __init__(self, checkpoints: array, stride: int, line_count: int, size: int = 0, mtime_ns: int = 0):
+        # checkpoints[k] is where line k * stride + 1 (1-based) starts
+        self.checkpoints = checkpoints
+        self.stride = stride
+        self.line_count = line_count
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    def build(cls, mm, stride: int = consts.LINE_INDEX_STRIDE, size: int = 0, mtime_ns: int = 0):
+        """Indexes a memory-mapped log."""
+        stride = max(1, stride)
+        checkpoints = array('Q', [0])
+        # Every match ends right after stride newlines, which is the start of the next checkpoint line
+        checkpoints.extend(match.end() for match in re.finditer(rb"(?:[^\n]*\n){%d}" % stride, mm))
+        last = checkpoints[-1]
+        if last == len(mm):
+            # The log ends with a newline, so the last checkpoint is not a line
+            checkpoints.pop()
+            line_count = len(checkpoints) * stride
+        else:
+            line_count = (len(checkpoints) - 1) * stride + _count_newlines(mm, last, len(mm)) + 1
+            if mm[len(mm) - 1:len(mm)] == b"\n":
+                line_count -= 1
+        return cls(checkpoints, stride, line_count if len(mm) else 0, size, mtime_ns)
+
+    @classmethod
+    def for_log(cls, log_path: str, mm=None, stride: int = consts.LINE_INDEX_STRIDE):
+        """
+        Returns the index of a log from its sidecar, or builds it from mm (mapped here when not given) and saves
+        it. Compressed logs have no random access, so they have no index and None is returned.
+        """
+        if isinstance(mm, CompressedLog):
+            return None
+        stat = os.stat(log_path)
+        sidecar_path = cls.get_sidecar_path(log_path)
+        index = cls.load(sidecar_path, stat.st_size, stat.st_mtime_ns, stride)
+        if index is not None:
+            return index
+        if mm is None:
+            from log_analysis import LogAnalysis
+            mm = LogAnalysis.open_log(log_path)
+            if isinstance(mm, CompressedLog):
+                return None
+            try:
+                index = cls.build(mm, stride, stat.st_size, stat.st_mtime_ns)
+            finally:
+                mm.close()
+        else:
+            index = cls.build(mm, stride, stat.st_size, stat.st_mtime_ns)
+        try:
+            index.save(sidecar_path)
+        except OSError:
+            # A read-only temp directory only costs rebuilding the index next time
+            pass
+        return index
+
+    @staticmethod
+    def get_sidecar_path(log_path: str) -> str:
+        """Returns where the index of log_path is persisted."""
+        directory = os.path.join(tempfile.gettempdir(), consts.LINE_INDEX_DIRECTORY_NAME)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, hashlib.sha1(os.path.abspath(log_path).encode('utf-8')).hexdigest() + ".idx")
+
+    @classmethod
+    def load(cls, sidecar_path: str, size: int, mtime_ns: int, stride: int = consts.LINE_INDEX_STRIDE):
+        """Returns the persisted index when it was built with stride for a log of this size and mtime, or None."""
+        try:
+            with open(sidecar_path, 'rb') as file:
+                magic, indexed_size, indexed_mtime_ns, indexed_stride, line_count = \
+                    _SIDECAR_HEADER.unpack(file.read(_SIDECAR_HEADER.size))
+                if (magic, indexed_size, indexed_mtime_ns, indexed_stride) != (_SIDECAR_MAGIC, size, mtime_ns,
+                                                                                stride):
+                    return None
+                checkpoints = array('Q')
+                checkpoints.frombytes(file.read())
+        except (OSError, struct.error, ValueError):
+            return None
+        return cls(checkpoints, stride, line_count, size, mtime_ns)
+
+    def save(self, sidecar_path: str):
+        # Write to a temporary name first so readers never see half written indexes
+        with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(sidecar_path), suffix=".tmp",
+                                         delete=False) as file:
+            file.write(_SIDECAR_HEADER.pack(_SIDECAR_MAGIC, self.size, self.mtime_ns, self.stride, self.line_count))
+            self.checkpoints.tofile(file)
+        os.replace(file.name, sidecar_path)
+
+    def line_offset(self, mm, line_number: int) -> int:
+        """Returns where the 1-based line starts, clamped to the first and last line."""
+        line_number = min(max(1, line_number), max(1, self.line_count))
+        checkpoint, lines_after = divmod(line_number - 1, self.stride)
+        offset = self.checkpoints[checkpoint]
+        for _ in range(lines_after):
+            offset = mm.find(b"\n", offset) + 1
+        return offset
+
+    def line_of_offset(self, mm, offset: int) -> int:
+        """Returns the 1-based line holding the byte offset."""
+        checkpoint = bisect_right(self.checkpoints, offset) - 1
+        return checkpoint * self.stride + _count_newlines(mm, self.checkpoints[checkpoint], offset) + 1
+
+
+def read_log_lines(mm, first_line: int, last_line: int, line_index: LineIndex = None):
+    """
+    Returns the decoded lines first_line to last_line (1-based, inclusive) of a log without reading what comes
+    before them when an index is given. Compressed logs are streamed up to the last line.
+    """
+    first_line = max(1, first_line)
+    if isinstance(mm, CompressedLog):
+        lines = []
+        with mm.open_stream() as (stream, _):
+            for line_number, line in enumerate(stream, 1):
+                if line_number > last_line:
+                    break
+                if line_number >= first_line:
+                    lines.append(line.decode('utf-8', errors='replace').rstrip("\r\n"))
+        return lines
+    if line_index is None:
+        line_index = LineIndex.build(mm)
+    start = line_index.line_offset(mm, first_line)
+    end = start
+    for _ in range(max(0, last_line - first_line + 1)):
+        newline = mm.find(b"\n", end)
+        if newline == -1:
+            end = len(mm)
+            break
+        end = newline + 1
+    text = mm[start:end].decode('utf-8', errors='replace')
+    return [line.rstrip("\r") for line in text.split("\n")[:last_line - first_line + 1]] if text else []
+
+
+def compile_search_pattern(query: str, regex: bool = False, ignore_case: bool = True):
+    """Returns the bytes pattern of a search, the query being taken literally unless regex is set."""
+    pattern = query.encode('utf-8') if regex else re.escape(query.encode('utf-8'))
+    return re.compile(pattern, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+
+def iter_log_matches(mm, pattern, cancel_event=None, max_results: int = None):
+    """
+    Yields (line number, line start offset, line text) of every line of a log matching the compiled bytes
+    pattern, in file order and as soon as each is found. Nothing but the matching lines is decoded, and
+    lines are numbered by counting newlines between consecutive matches. Compressed logs are streamed line by line.
+    """
+    found = 0
+    if isinstance(mm, CompressedLog):
+        with mm.open_stream() as (stream, _):
+            offset = 0
+            for line_number, line in enumerate(stream, 1):
+                if pattern.search(line):
+                    yield line_number, offset, line.decode('utf-8', errors='replace').rstrip("\r\n")
+                    found += 1
+                    if found == max_results or (cancel_event is not None and cancel_event.is_set()):
+                        return
+                offset += len(line)
+        return
+
+    line_number = 1
+    # Always the start of line line_number
+    counted_to = 0
+    position = 0
+    while position <= len(mm):
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        match = pattern.search(mm, position)
+        if match is None:
+            return
+        line_start = mm.rfind(b"\n", counted_to, match.start()) + 1 or counted_to
+        line_number += _count_newlines(mm, counted_to, line_start)
+        counted_to = line_start
+        line_end = mm.find(b"\n", match.start())
+        if line_end == -1:
+            line_end = len(mm)
+        yield line_number, line_start, mm[line_start:line_end].decode('utf-8', errors='replace').rstrip("\r")
+        found += 1
+        if found == max_results:
+            return
+        # One result per line, the next search starts on the following line
+        position = line_end + 1
@@ -1,10 +1,18 @@
 import os
 import re
+import io
+import json  # For persisting follow state
+import hashlib  # For naming follow state files
 import tempfile
 import utilities as utils
 import mmap  # For memory-mapped file objects
 from typing import Dict, List, Set  # For type annotations
 import consts
+from compressed_log import CompressedLog, detect_compression  # For scanning compressed logs as streams
+import pattern_profiles  # For the patterns of each runner and browser
+from analysis_result import AnalysisResult, FailureBlock, write_failure_block_text, write_report, write_text_blocks
+from failure_groups import FailureGroups  # For grouping every failure block by signature
+from instrumentation import timed  # For the optional timing breakdown
 
 
 def _write_to_temp_file(results: Dict[int, List[str]]) -> str:
@@ -25,62 +33,468 @@ def _write_to_temp_file(results: Dict[int, List[str]]) -> str:
 
 
 def _get_failed_pattern():
-    return re.compile(consts.FAILED_PATTERN)
+    # Profiles are compiled once, these return the default profile's patterns
+    return pattern_profiles.get_profile().failed_pattern
 
 
 def _get_reason_pattern():
-    return re.compile(consts.REASON_PATTERN)
+    return pattern_profiles.get_profile().reason_pattern
 
 
 def _get_end_of_reason_pattern():
-    return re.compile(consts.END_OF_REASON_PATTERN)
-
-
-def _extract_reasons(lines: iter, start_pattern: re.Pattern, end_pattern: re.Pattern):
-    """Extracts reason lines from an iterator of lines using start and end patterns."""
-    # Create an empty list to store the reason lines
-    reason_lines = []
-    # Initialize a flag to indicate whether the start pattern is found or not
-    found_start = False
-
-    # Iterate over each line in the iterator
-    for line in lines:
-        # Decode bytes to string
-        line_str = line.decode('utf-8')
-        if not found_start:
-            # Search for a match with the start pattern at the beginning of the line
-            start_match = start_pattern.match(line)
-            if start_match:
-                # Append the matched group to the reason lines list after decoding bytes to string
-                reason_lines.append(start_match.group(1).decode('utf-8'))
-                # Set the flag to True
-                found_start = True
-            continue
-
-        # Search for a match with the end pattern at the beginning of the line
-        if end_pattern.match(line):
-            break
+    return pattern_profiles.get_profile().end_of_reason_pattern
+
+
+def _read_head(mm) -> bytes:
+    """Returns the start of the log that profiles are detected from."""
+    if isinstance(mm, CompressedLog):
+        with mm.open_stream() as (stream, _):
+            return stream.read(consts.PROFILE_SNIFF_BYTES)
+    return mm[:consts.PROFILE_SNIFF_BYTES]
+
+
+def _next_line_start(mm, pos: int) -> int:
+    """Returns the offset of the line following the one containing pos, or the end of the buffer."""
+    newline = mm.find(b"\n", pos)
+    return len(mm) if newline == -1 else newline + 1
+
+
+class ReasonLimits:
+    """
+    How much of each reason block is captured: at most max_lines lines (the start line included) and about
+    max_bytes bytes, where 0 means no limit, and how bytes that are not UTF-8 are decoded.
+    """
+    __slots__ = ('max_lines', 'max_bytes', 'decode_errors')
+
+    def __init__(self, max_lines: int = consts.REASON_MAX_LINES, max_bytes: int = consts.REASON_MAX_BYTES,
+                 decode_errors: str = consts.REASON_DECODE_ERRORS):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.decode_errors = decode_errors
+
+    @classmethod
+    def from_config(cls, config):
+        """Reads the reason_extraction section of the config."""
+        limits_config = (config or {}).get('reason_extraction', {}) or {}
+        return cls(limits_config.get('max_lines', consts.REASON_MAX_LINES) or 0,
+                   limits_config.get('max_bytes', consts.REASON_MAX_BYTES) or 0,
+                   limits_config.get('decode_errors') or consts.REASON_DECODE_ERRORS)
+
+    def __reduce__(self):
+        return ReasonLimits, (self.max_lines, self.max_bytes, self.decode_errors)
+
 
-        # Append the line to the reason_lines list
-        reason_lines.append(line_str)
+DEFAULT_REASON_LIMITS = ReasonLimits()
 
-        # If the reason_lines list has 20 elements, break the loop
-        # Remove this if you don't want a limit.
-        if len(reason_lines) == 20:
+
+def _extract_reasons(mm, pos: int, start_pattern: re.Pattern, end_pattern: re.Pattern,
+                     limits: ReasonLimits = DEFAULT_REASON_LIMITS):
+    """
+    Finds the reason block starting at or after pos without copying or decoding anything. Returns its range
+    (start, head end, body start, end), with a start of -1 when there is none, and the offset after the block.
+    """
+    # Search for the first line at or after pos that matches the start pattern
+    start_match = start_pattern.search(mm, pos)
+    if not start_match:
+        # Without a start line the reason block runs to the end of the log
+        return (-1, -1, -1, -1), len(mm)
+
+    # The matched group is the first reason line, the lines after it form the body
+    reason_start = start_match.start()
+    body_start = pos = _next_line_start(mm, start_match.end())
+    end = len(mm)
+    line_count = 1
+
+    # Walk the following lines until the end pattern matches at the beginning of a line
+    while pos < end:
+        # Stop at the configured line or byte limit
+        if (limits.max_lines and line_count >= limits.max_lines) or \
+                (limits.max_bytes and pos - reason_start >= limits.max_bytes):
             break
-    # Return the reason_lines list
-    return reason_lines
+        line_end = _next_line_start(mm, pos)
+        if end_pattern.match(mm, pos, line_end):
+            return (reason_start, start_match.end(1), body_start, pos), line_end
+
+        # The line (including its newline) is part of the block
+        pos = line_end
+        line_count += 1
+    # Return the reason range and where scanning should resume
+    return (reason_start, start_match.end(1), body_start, pos), pos
+
+
+def _iter_failure_blocks(mm, failed_pattern: re.Pattern, reason_pattern: re.Pattern,
+                         end_reason_pattern: re.Pattern, cancel_event=None, progress_callback=None,
+                         limits: ReasonLimits = DEFAULT_REASON_LIMITS, capture_all: bool = False):
+    """
+    Yields a FailureBlock for every first seen fail count by searching the whole buffer. The buffer is searched
+    in line-aligned windows so a set cancel_event stops the scan even when no failures are found, and
+    progress_callback is called with the bytes scanned so far after every window. When the failed pattern has
+    no count group every match is a new failure, numbered in order. With capture_all a block starts wherever
+    the fail count changes, so counts that restart (sharded or retried runs) are reported again.
+    """
+    # Create a set to store the seen fail counts, plus their raw digits for a cheap first check
+    seen_fail_counts: Set[int] = set()
+    seen_raw_counts: Set[bytes] = set()
+    # The raw count of the last block, which is all capture_all compares with
+    last_raw_count = None
+    block_count = 0
+    counted = failed_pattern.groups > 0
+    pos = 0
+    size = len(mm)
+    while pos < size:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        window_end = _next_line_start(mm, min(pos + consts.SCAN_WINDOW_BYTES, size) - 1)
+        # Jump straight from match to match instead of reading line by line. Each match swallows the rest
+        # of its line, so like the old per-line search only the first match on a line is considered. The
+        # search reads one line past the window for patterns that look ahead to the next line (Jest), and
+        # matches starting on that line are left to the next window.
+        for failed_match in failed_pattern.finditer(mm, pos, _next_line_start(mm, window_end)):
+            if failed_match.start() >= window_end:
+                pos = window_end
+                break
+            raw_count = failed_match.group(1) if counted else b"%d" % (block_count + 1)
+            if capture_all:
+                # Only a change of the fail count starts a block
+                if raw_count == last_raw_count:
+                    continue
+            elif raw_count in seen_raw_counts:
+                continue
+            else:
+                seen_raw_counts.add(raw_count)
+            fail_count = int(raw_count)
+
+            # If the fail count is not seen before, or changed when capturing all blocks
+            if capture_all or fail_count not in seen_fail_counts:
+                if not capture_all:
+                    seen_fail_counts.add(fail_count)
+                last_raw_count = raw_count
+                block_count += 1
+                reason_range, pos = _extract_reasons(mm, failed_match.end() + 1, reason_pattern,
+                                                     end_reason_pattern, limits)
+                block = FailureBlock(fail_count, offset=failed_match.start(), end_offset=pos)
+                block.capture_reasons(mm, reason_range, limits.decode_errors)
+                yield block
+                # Restart the search after the reason block that was just consumed
+                break
+        else:
+            pos = window_end
+        if progress_callback is not None:
+            progress_callback(min(pos, size))
+
+
+class _StreamWindow:
+    """
+    A bounded window of complete decompressed lines. Consumed lines are dropped from the front as new data is
+    read, while the absolute offset and line number of the window start are kept.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = bytearray()
+        # A partially read last line waits until its newline arrives
+        self._partial = b""
+        self.eof = False
+        # Absolute offset of buffer[0], and the line number at buffer[counted_to]
+        self.base = 0
+        self.counted_to = 0
+        self.line_number = 1
+
+    def fill(self):
+        """Appends the complete lines of the next read to the window, and the partial one at the end of stream."""
+        data = self._partial + self.stream.read(consts.STREAM_READ_BYTES)
+        if len(data) == len(self._partial):
+            self.eof = True
+            self.buffer += data
+            self._partial = b""
+            return
+        last_newline = data.rfind(b"\n") + 1
+        self.buffer += data[:last_newline]
+        self._partial = data[last_newline:]
+
+    def discard(self, pos: int):
+        """Drops the window before the local offset pos."""
+        self.line_of(pos)
+        del self.buffer[:pos]
+        self.base += pos
+        self.counted_to -= pos
+
+    def settled_end(self) -> int:
+        """
+        Returns the end of the lines whose next line has been read too: the start of the last line, or the end
+        of the window at the end of the stream.
+        """
+        if self.eof:
+            return len(self.buffer)
+        return self.buffer.rfind(b"\n", 0, len(self.buffer) - 1) + 1
+
+    def line_of(self, pos: int) -> int:
+        """Returns the line number of the local offset pos, which must not go backwards."""
+        self.line_number += self.buffer.count(b"\n", self.counted_to, pos)
+        self.counted_to = pos
+        return self.line_number
+
+
+def _extract_reasons_from_window(window: _StreamWindow, pos: int, start_pattern: re.Pattern,
+                                 end_pattern: re.Pattern, limits: ReasonLimits):
+    """
+    Runs _extract_reasons on the window, reading more of the stream whenever the block may continue past its end.
+    Returns the reason range and the offset after the block, both local to the window.
+    """
+    while True:
+        reason_range, next_pos = _extract_reasons(window.buffer, pos, start_pattern, end_pattern, limits)
+        if next_pos < len(window.buffer) or window.eof:
+            return reason_range, next_pos
+        # Keep the block from its first reason line, or nothing when the start has not been seen yet
+        reason_start = reason_range[0]
+        window.discard(len(window.buffer) if reason_start < 0 else reason_start)
+        pos = 0
+        window.fill()
+
+
+def _iter_failure_blocks_stream(compressed_log: CompressedLog, failed_pattern: re.Pattern,
+                                reason_pattern: re.Pattern, end_reason_pattern: re.Pattern, cancel_event=None,
+                                progress_callback=None, limits: ReasonLimits = DEFAULT_REASON_LIMITS,
+                                capture_all: bool = False):
+    """
+    Yields the same blocks as _iter_failure_blocks, line numbers included, from a decompressing stream. Only a
+    window of about consts.STREAM_READ_BYTES is held, and progress is reported in compressed bytes.
+    """
+    # Create a set to store the seen fail counts, plus their raw digits for a cheap first check
+    seen_fail_counts: Set[int] = set()
+    seen_raw_counts: Set[bytes] = set()
+    last_raw_count = None
+    block_count = 0
+    counted = failed_pattern.groups > 0
+    with compressed_log.open_stream() as (stream, raw):
+        window = _StreamWindow(stream)
+        pos = 0
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            # Failed patterns may look ahead to the next line (Jest), so the last line waits for the next read
+            settled_end = window.settled_end()
+            if pos >= settled_end:
+                if window.eof:
+                    return
+                window.discard(pos)
+                pos = 0
+                window.fill()
+                if progress_callback is not None:
+                    progress_callback(raw.tell())
+                continue
+
+            # The window only holds complete lines, so matches behave exactly like on the memory-mapped log
+            new_match = None
+            for failed_match in failed_pattern.finditer(window.buffer, pos):
+                if failed_match.start() >= settled_end:
+                    break
+                raw_count = failed_match.group(1) if counted else b"%d" % (block_count + 1)
+                if capture_all:
+                    if raw_count != last_raw_count:
+                        new_match = failed_match
+                        break
+                    continue
+                if raw_count in seen_raw_counts:
+                    continue
+                seen_raw_counts.add(raw_count)
+                # If the fail count is not seen before
+                if int(raw_count) not in seen_fail_counts:
+                    new_match = failed_match
+                    break
+            if new_match is None:
+                pos = settled_end
+                continue
+
+            # The match iterator is gone now, so the window can be resized while the reasons are read
+            last_raw_count = new_match.group(1) if counted else b"%d" % (block_count + 1)
+            block_count += 1
+            fail_count = int(last_raw_count)
+            if not capture_all:
+                seen_fail_counts.add(fail_count)
+            block = FailureBlock(fail_count, offset=window.base + new_match.start(),
+                                 line_number=window.line_of(new_match.start()))
+            reason_range, pos = _extract_reasons_from_window(window, new_match.end() + 1, reason_pattern,
+                                                             end_reason_pattern, limits)
+            # The window is copied from before it changes again
+            block.capture_reasons(window.buffer, reason_range, limits.decode_errors, window.base)
+            if reason_range[0] >= 0:
+                block.reason_line_number = window.line_of(reason_range[0])
+            block.end_offset = window.base + pos
+            # Restart the search after the reason block that was just consumed
+            yield block
+
+
+def _split_into_line_aligned_chunks(mm, chunk_count: int):
+    """Splits the buffer into roughly equal (start, end) ranges that begin and end on line boundaries."""
+    size = len(mm)
+    boundaries = [0]
+    for idx in range(1, chunk_count):
+        boundary = _next_line_start(mm, size * idx // chunk_count - 1)
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _scan_chunk(log_path: str, start: int, end: int, profile: pattern_profiles.PatternProfile,
+                limits: ReasonLimits):
+    """
+    Worker entry point: collects the runs of consecutive hits sharing a fail count between start and end.
+    Each run is [fail_count, first_hit, last_hit, reason_range, resume_pos] where the reason range is found
+    speculatively for the first hit, reading past the chunk end when the block crosses it. Only offsets are sent
+    back, the parent copies the reasons from its own mapping.
+    """
+    failed_pattern = profile.failed_pattern
+    reason_pattern = profile.reason_pattern
+    end_reason_pattern = profile.end_of_reason_pattern
+
+    runs = []
+    raw_count = None
+    with open(log_path, 'r') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for failed_match in failed_pattern.finditer(mm, start, end):
+            # Extend the current run while the fail count does not change
+            if failed_match.group(1) == raw_count:
+                runs[-1][2] = failed_match.start()
+                continue
+            raw_count = failed_match.group(1)
+            reason_range, resume_pos = _extract_reasons(mm, failed_match.end() + 1, reason_pattern,
+                                                        end_reason_pattern, limits)
+            runs.append([int(raw_count), failed_match.start(), failed_match.start(), reason_range, resume_pos])
+    return runs
+
+
+def _iter_failure_blocks_parallel(mm, log_path: str, workers: int, profile: pattern_profiles.PatternProfile,
+                                  cancel_event=None, progress_callback=None,
+                                  limits: ReasonLimits = DEFAULT_REASON_LIMITS, capture_all: bool = False):
+    """Yields the same blocks as _iter_failure_blocks, scanning line-aligned chunks in a process pool."""
+    failed_pattern = profile.failed_pattern
+    reason_pattern = profile.reason_pattern
+    end_reason_pattern = profile.end_of_reason_pattern
+    chunks = _split_into_line_aligned_chunks(mm, workers * consts.CHUNKS_PER_WORKER)
+
+    # Create a set to store the seen fail counts
+    seen_fail_counts: Set[int] = set()
+    last_fail_count = None
+    # Everything before pos has been consumed by a reason block
+    pos = 0
+    # Imported here since multiprocessing is slow to import and most logs are scanned serially
+    from concurrent.futures import ProcessPoolExecutor
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        chunk_results = executor.map(_scan_chunk, [log_path] * len(chunks), *zip(*chunks),
+                                     [profile] * len(chunks), [limits] * len(chunks))
+        # Replay the runs in file order, which keeps the serial first occurrence semantics
+        for (_, chunk_end), runs in zip(chunks, chunk_results):
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            for fail_count, first_hit, last_hit, reason_range, resume_pos in runs:
+                # Seen counts are skipped (only the count of the last block when capturing all), and so are runs
+                # swallowed whole by an earlier reason block. Runs never share a count with the run before them,
+                # except across a chunk boundary.
+                if (fail_count == last_fail_count if capture_all else fail_count in seen_fail_counts) \
+                        or last_hit < pos:
+                    continue
+                if first_hit < pos:
+                    # The run started inside an earlier reason block, so its first visible hit is after pos
+                    failed_match = failed_pattern.search(mm, pos)
+                    first_hit = failed_match.start()
+                    reason_range, resume_pos = _extract_reasons(mm, failed_match.end() + 1, reason_pattern,
+                                                                end_reason_pattern, limits)
+                if not capture_all:
+                    seen_fail_counts.add(fail_count)
+                last_fail_count = fail_count
+                pos = resume_pos
+                block = FailureBlock(fail_count, offset=first_hit, end_offset=resume_pos)
+                block.capture_reasons(mm, reason_range, limits.decode_errors)
+                yield block
+            if progress_callback is not None:
+                progress_callback(max(chunk_end, pos))
+    finally:
+        # Stopping early (cancelled or the consumer closed the generator) drops the chunks not started yet
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _number_lines(mm, blocks):
+    """Fills in the line numbers of blocks arriving in file order, counting newlines only once."""
+    line_number = 1
+    counted_to = 0
+    for block in blocks:
+        for offset_name, line_name in (('offset', 'line_number'), ('reason_offset', 'reason_line_number')):
+            offset = getattr(block, offset_name)
+            if offset < 0:
+                continue
+            # Count in bounded steps so no large slice of the log is ever copied at once
+            while counted_to < offset:
+                step_end = min(offset, counted_to + consts.LINE_COUNT_STEP_BYTES)
+                line_number += mm[counted_to:step_end].count(b"\n")
+                counted_to = step_end
+            setattr(block, line_name, line_number)
+        yield block
+
 
+def resolve_worker_count(workers) -> int:
+    """Maps the configured worker count to a usable one, where 0 or None means one per CPU core."""
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
 
-def _write_failure_found_in_file(file, mm, fail_count, reason_pattern, end_reason_pattern):
-    """Extract the reason lines from the memory-mapped object using a generator expression"""
-    reason_lines = _extract_reasons(iter(mm.readline, b""), reason_pattern, end_reason_pattern)
-    utils.insert_line_separator_in_file(file, True, 2)
-    # Write the fail count to the temporary file
-    file.write(f"{fail_count}{consts.FAILED_MESSAGE}\n")
-    # Write each reason line to the temporary file with a tab indentation
-    for reason in reason_lines:
-        file.write(f"{consts.TAB_INDENT}{reason}\n")
+
+def _iter_failures(mm, log_path: str = None, workers: int = 1, cancel_event=None, progress_callback=None,
+                   profile: pattern_profiles.PatternProfile = None, limits: ReasonLimits = None,
+                   capture_all: bool = False):
+    """
+    Yields the failure blocks of the memory-mapped log, scanned serially or in parallel, with line numbers.
+    Without a profile the configured one is used, or the one detected from the start of the log.
+    """
+    limits = limits or DEFAULT_REASON_LIMITS
+    # The patterns were compiled when the profiles were loaded
+    profile = profile or pattern_profiles.detect_profile(_read_head(mm))
+    failed_pattern = profile.failed_pattern
+    reason_pattern = profile.reason_pattern
+    end_reason_pattern = profile.end_of_reason_pattern
+
+    if isinstance(mm, CompressedLog):
+        # Compressed logs are decompressed as a stream, which can only be scanned serially
+        return _iter_failure_blocks_stream(mm, failed_pattern, reason_pattern, end_reason_pattern, cancel_event,
+                                           progress_callback, limits, capture_all)
+
+    workers = resolve_worker_count(workers)
+    # Chunks are merged by fail count, so only counted profiles can be split
+    if log_path and workers > 1 and profile.counted and len(mm) >= consts.PARALLEL_MIN_FILE_SIZE:
+        # Split large logs across a process pool
+        failure_blocks = _iter_failure_blocks_parallel(mm, log_path, workers, profile, cancel_event,
+                                                       progress_callback, limits, capture_all)
+    else:
+        # Scan the whole memory-mapped object in one pass, resolving lines only around matches
+        failure_blocks = _iter_failure_blocks(mm, failed_pattern, reason_pattern, end_reason_pattern, cancel_event,
+                                              progress_callback, limits, capture_all)
+    return _number_lines(mm, failure_blocks)
+
+
+def _collect_result(log_path: str, blocks, group_by: str = None, failure_callback=None,
+                    instrumentation=None) -> AnalysisResult:
+    """
+    Collects blocks into an AnalysisResult. With group_by ("stack" or "message") the blocks are grouped as they
+    arrive and only the first block of each group is kept and passed to failure_callback.
+    """
+    if not group_by:
+        result = AnalysisResult(log_path)
+        for block in blocks:
+            result.blocks.append(block)
+            if failure_callback is not None:
+                failure_callback(block)
+        return result
+
+    failure_groups = FailureGroups(group_by)
+    for block in blocks:
+        with timed(instrumentation, 'group'):
+            group = failure_groups.add(block)
+        if group is not None and failure_callback is not None:
+            failure_callback(block)
+    groups = list(failure_groups)
+    return AnalysisResult(log_path, [group.block for group in groups], groups=groups)
 
 
 #####################################################################################################################
@@ -90,42 +504,328 @@ class LogAnalysis:
     @staticmethod
     def get_files_from_dir(directory, is_reversed):
         """Get a list of files in the directory."""
-        files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-        files.sort(key=lambda x: os.path.getmtime(os.path.join(directory, x)), reverse=is_reversed)
-        return files
+        # One scandir pass gives the file type without a stat and the mtime with a single stat per file
+        with os.scandir(directory) as scan:
+            mtimes = {entry.name: entry.stat().st_mtime for entry in scan if entry.is_file()}
+        return sorted(mtimes, key=mtimes.get, reverse=is_reversed)
 
     @staticmethod
-    def extract_failed_test_cases(mm: mmap.mmap, temp_file_path: str):
+    def open_log(log_path: str):
         """
-        Extracts failed test cases from the logs and writes them to a temporary file.
-        The keys are the fail counts and the values are lists of reasons.
+        Returns a memory-mapped object of the log, or a CompressedLog for gzip, xz or zstd logs, which every
+        analysis method accepts in place of the memory-mapped object.
+        """
+        compression = detect_compression(log_path)
+        if compression:
+            return CompressedLog(log_path, compression)
+        with open(log_path, 'r') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def iter_failures(mm: mmap.mmap, log_path: str = None, workers: int = 1, cancel_event=None,
+                      max_failures: int = None, progress_callback=None, profile=None,
+                      reason_limits: ReasonLimits = None, capture_all: bool = False):
+        """
+        Yields each FailureBlock as soon as it is found, holding only the current block in memory.
+        Scanning stops once cancel_event (anything with is_set(), e.g. a threading.Event) is set, after
+        max_failures blocks, or when the caller stops iterating. progress_callback, if given, is called with the
+        number of bytes scanned so far. The memory-mapped object is left open.
+        When log_path is given and more than one worker is requested (0 means one per CPU core),
+        large logs are scanned in parallel. profile (a pattern_profiles.PatternProfile) overrides the configured or
+        detected one, and reason_limits bounds what is captured of each reason block (20 lines by default).
+        Only the first block of each fail count is yielded, unless capture_all is set, then every block is (one
+        wherever the fail count changes).
         """
-        # Compile regular expressions for matching failed test cases and reasons
-        failed_pattern = _get_failed_pattern()
-        reason_pattern = _get_reason_pattern()
-        end_reason_pattern = _get_end_of_reason_pattern()
+        failure_blocks = _iter_failures(mm, log_path, workers, cancel_event, progress_callback, profile,
+                                        reason_limits, capture_all)
+        try:
+            for yielded, block in enumerate(failure_blocks, 1):
+                yield block
+                if max_failures is not None and yielded >= max_failures:
+                    return
+        finally:
+            # Release a parallel scan right away instead of waiting for garbage collection
+            failure_blocks.close()
 
-        # Create a set to store the seen fail counts
-        seen_fail_counts: Set[int] = set()
+    @staticmethod
+    def analyze(mm: mmap.mmap, log_path: str = None, workers: int = 1, reason_limits: ReasonLimits = None,
+                group_by: str = None, failure_callback=None) -> AnalysisResult:
+        """
+        Extracts the failed test cases from the log into an AnalysisResult without writing anything. With group_by
+        every failure block is captured and grouped by its "stack" or "message" signature. failure_callback is
+        called with every block as it is found (the first of each group with group_by).
+        """
+        return _collect_result(log_path, LogAnalysis.iter_failures(mm, log_path, workers, reason_limits=reason_limits,
+                                                                   capture_all=bool(group_by)),
+                               group_by, failure_callback)
 
+    @staticmethod
+    def extract_failed_test_cases(mm: mmap.mmap, temp_file_path: str, log_path: str = None, workers: int = 1,
+                                  max_failures: int = None, reason_limits: ReasonLimits = None, group_by: str = None):
+        """
+        Extracts failed test cases from the logs and writes them to a temporary file.
+        Blocks are written as iter_failures yields them, or once every block is grouped with group_by.
+        Returns the number of failure blocks (or groups) written.
+        """
+        failure_blocks = LogAnalysis.iter_failures(mm, log_path, workers, max_failures=max_failures,
+                                                   reason_limits=reason_limits, capture_all=bool(group_by))
         # Open the temporary file in write mode
         with open(temp_file_path, 'w') as temp:
-            # Seek to the beginning of the memory-mapped object
-            mm.seek(0)
-            # Iterate over each line in the memory-mapped object
-            for line in iter(mm.readline, b""):
-                # Search for a match with the failed pattern
-                failed_match = failed_pattern.search(line)
-                if failed_match:
-                    # Get the fail count as an integer
-                    fail_count = int(failed_match.group(1))
+            if group_by:
+                result = _collect_result(log_path, failure_blocks, group_by)
+                failure_count = write_text_blocks(result.blocks, temp, result.groups)
+            else:
+                failure_count = write_text_blocks(failure_blocks, temp)
+        # Close the memory-mapped object
+        mm.close()
+        return failure_count
 
-                    # If the fail count is not seen before
-                    if fail_count not in seen_fail_counts:
-                        _write_failure_found_in_file(temp, mm, fail_count, reason_pattern, end_reason_pattern)
-                        seen_fail_counts.add(fail_count)
-            if not seen_fail_counts:
-                utils.write_no_errors_message_to_file(temp)
+    @staticmethod
+    def analyze_log(mm: mmap.mmap, log_path: str, create_report_path, workers: int = 1, result_cache=None,
+                    report_format: str = "text", cancel_event=None, progress_callback=None,
+                    failure_callback=None, reason_limits: ReasonLimits = None, group_by: str = None,
+                    instrumentation=None, source_maps=None):
+        """
+        Analyzes the log into a report in report_format and returns the result, whose report_path is set.
+        With a result cache an unchanged log reuses its previous report, or has one rendered from the cached
+        result, without being scanned again. failure_callback is called with every block as it is found (the
+        first of each group with group_by) and progress_callback with the bytes scanned. Returns None when
+        cancel_event is set before the scan ends. instrumentation (an instrumentation.Instrumentation) records
+        how long each stage took. source_maps (a source_maps.SourceMapResolver) rewrites the bundled stack frames
+        of the found failures to their original sources before the report is written.
+        """
+        if result_cache is not None:
+            with timed(instrumentation, 'cache'):
+                entry = result_cache.get(log_path)
+            if entry is not None:
+                mm.close()
+                result = AnalysisResult.from_dict(entry['result'], entry['report_path'])
+                report_suffix = consts.REPORT_FORMATS.get(report_format, consts.REPORT_FORMATS["text"])
+                if not (result.report_path and result.report_path.endswith(report_suffix)
+                        and os.path.exists(result.report_path)):
+                    with timed(instrumentation, 'report'):
+                        result.report_path = create_report_path()
+                        write_report(result, result.report_path, report_format)
+                    with timed(instrumentation, 'cache'):
+                        result_cache.put(log_path, result)
+                if progress_callback is not None:
+                    progress_callback(os.path.getsize(log_path))
+                return result
+
+        failure_blocks = LogAnalysis.iter_failures(mm, log_path, workers, cancel_event,
+                                                   progress_callback=progress_callback, reason_limits=reason_limits,
+                                                   capture_all=bool(group_by))
+        if instrumentation is not None:
+            failure_blocks = instrumentation.timed_blocks(failure_blocks, len(mm))
+        result = _collect_result(log_path, failure_blocks, group_by, failure_callback, instrumentation)
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+
+        if source_maps is not None:
+            with timed(instrumentation, 'resolve'):
+                source_maps.resolve_blocks(result.blocks)
+        with timed(instrumentation, 'report'):
+            result.report_path = create_report_path()
+            write_report(result, result.report_path, report_format)
+        if result_cache is not None:
+            with timed(instrumentation, 'cache'):
+                result_cache.put(log_path, result)
+        return result
+
+
+class LogFollower:
+    """
+    Incrementally analyzes a log that is still being written. Only bytes appended since the last poll are
+    scanned, and the offset plus parser state (seen fail counts and any half read reason block) are persisted
+    so following can resume after a restart without rescanning from byte 0.
+    """
+
+    def __init__(self, log_path: str, report_path: str, reason_limits: ReasonLimits = None):
+        self.log_path = os.path.abspath(log_path)
+        self.state_path = self.get_state_path(self.log_path)
+        self.reason_limits = reason_limits or DEFAULT_REASON_LIMITS
+
+        if not self._load_state():
+            self._reset_state(report_path)
+
+    def _use_profile(self, final=False) -> bool:
+        """
+        Picks the profile of the log once enough of it was written (or it is final), keeping the one it was
+        followed with. Returns whether a profile is known, nothing is scanned before that.
+        """
+        if self.profile_name is None:
+            if not final and os.path.getsize(self.log_path) < consts.PROFILE_SNIFF_BYTES:
+                return False
+            with open(self.log_path, 'rb') as log:
+                self.profile_name = pattern_profiles.detect_profile(log.read(consts.PROFILE_SNIFF_BYTES)).name
+        profile = pattern_profiles.get_profile(self.profile_name)
+        self.failed_pattern = profile.failed_pattern
+        self.reason_pattern = profile.reason_pattern
+        self.end_reason_pattern = profile.end_of_reason_pattern
+        return True
+
+    @staticmethod
+    def get_state_path(log_path: str) -> str:
+        """Returns where the follow state of log_path is persisted."""
+        directory = os.path.join(tempfile.gettempdir(), consts.FOLLOW_STATE_DIRECTORY_NAME)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, hashlib.sha1(log_path.encode('utf-8')).hexdigest() + ".json")
+
+    def _reset_state(self, report_path: str):
+        self.report_path = report_path
+        self.offset = 0
+        self.inode = None
+        self.failure_count = 0
+        self.seen_fail_counts: Set[int] = set()
+        # Detected from the first PROFILE_SNIFF_BYTES of the log, the default profile until those are written
+        self.profile_name = None
+        # The reason block being read: {'fail_count': int, 'reason_lines': [str], 'found_start': bool, ...}
+        self.pending = None
+        # Start with an empty report
+        open(self.report_path, 'w').close()
+
+    def _load_state(self) -> bool:
+        """Restores a persisted state whose report still exists, returning whether one was found."""
+        try:
+            with open(self.state_path, 'r') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if state.get('log_path') != self.log_path or not os.path.exists(state.get('report_path', '')):
+            return False
+        self.report_path = state['report_path']
+        self.offset = state['offset']
+        self.inode = state['inode']
+        self.failure_count = state['failure_count']
+        self.seen_fail_counts = set(state['seen_fail_counts'])
+        self.pending = state['pending']
+        self.profile_name = state.get('profile')
+        return True
+
+    def _save_state(self):
+        state = {
+            'log_path': self.log_path,
+            'report_path': self.report_path,
+            'offset': self.offset,
+            'inode': self.inode,
+            'failure_count': self.failure_count,
+            'seen_fail_counts': sorted(self.seen_fail_counts),
+            'pending': self.pending,
+            'profile': self.profile_name,
+        }
+        with open(self.state_path, 'w') as file:
+            json.dump(state, file)
+
+    def poll(self) -> str:
+        """Scans the bytes appended since the last poll, appends new failures to the report and returns them."""
+        stat = os.stat(self.log_path)
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            # The log was rotated or truncated, so start over
+            if self.inode is not None:
+                self._reset_state(self.report_path)
+            self.inode = stat.st_ino
+        if stat.st_size == self.offset or not self._use_profile():
+            return ""
+
+        with open(self.log_path, 'r') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Only complete lines are scanned, a partially written last line waits for the next poll
+            end = mm.rfind(b"\n", self.offset) + 1
+            blocks = self._scan(mm, end, at_eof=False) if end > self.offset else []
+        return self._append_blocks(blocks)
+
+    def finish(self) -> str:
+        """Treats the current end of the log as final, flushing the partial line and any pending block."""
+        blocks = []
+        if os.path.getsize(self.log_path) > self.offset and self._use_profile(final=True):
+            with open(self.log_path, 'r') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                blocks = self._scan(mm, len(mm), at_eof=True)
+        elif self.pending:
+            blocks = [self.pending]
+            self.pending = None
+        text = self._append_blocks(blocks, persist=False)
+        if not self.failure_count:
+            buffer = io.StringIO()
+            utils.write_no_errors_message_to_file(buffer)
+            with open(self.report_path, 'a') as report:
+                report.write(buffer.getvalue())
+            text += buffer.getvalue()
+        # A finished log has nothing left to resume
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return text
+
+    def _append_blocks(self, blocks, persist=True) -> str:
+        """Writes the finished blocks to the report, persists the state and returns the text that was added."""
+        buffer = io.StringIO()
+        for block in blocks:
+            write_failure_block_text(buffer, FailureBlock.from_dict(block))
+        self.failure_count += len(blocks)
+        text = buffer.getvalue()
+        if text:
+            with open(self.report_path, 'a') as report:
+                report.write(text)
+        if persist:
+            self._save_state()
+        return text
+
+    def _reason_limit_reached(self, pos: int) -> bool:
+        limits = self.reason_limits
+        return bool((limits.max_lines and len(self.pending['reason_lines']) >= limits.max_lines) or
+                    (limits.max_bytes and pos - self.pending['reason_offset'] >= limits.max_bytes))
+
+    def _scan(self, mm, end: int, at_eof: bool):
+        """Advances the parser from the saved offset to end and returns the reason blocks it completed."""
+        blocks = []
+        pos = self.offset
+        while pos < end:
+            if self.pending is None:
+                # Look for the next failed match, exactly like the full scan does. Failed patterns may look ahead
+                # to the next line (Jest), so before the end of the log a match on the last line waits for it.
+                settled_end = end if at_eof else max(pos, mm.rfind(b"\n", pos, end - 1) + 1)
+                failed_match = self.failed_pattern.search(mm, pos, end)
+                if not failed_match or failed_match.start() >= settled_end:
+                    pos = settled_end
+                    break
+                pos = min(failed_match.end() + 1, end)
+                if self.failed_pattern.groups:
+                    fail_count = int(failed_match.group(1))
+                else:
+                    # Uncounted profiles number their failures in order
+                    fail_count = len(self.seen_fail_counts) + 1
+                if fail_count not in self.seen_fail_counts:
+                    self.seen_fail_counts.add(fail_count)
+                    self.pending = {'fail_count': fail_count, 'reason_lines': [], 'found_start': False,
+                                    'offset': failed_match.start(), 'reason_offset': -1}
+            elif not self.pending['found_start']:
+                # Lines before the reason start are skipped, possibly across several polls
+                start_match = self.reason_pattern.search(mm, pos, end)
+                if not start_match:
+                    pos = end
+                    break
+                self.pending['reason_lines'].append(start_match.group(1).decode('utf-8',
+                                                                                 self.reason_limits.decode_errors))
+                self.pending['found_start'] = True
+                self.pending['reason_offset'] = start_match.start()
+                pos = min(_next_line_start(mm, start_match.end()), end)
+                self.pending['reason_end_offset'] = pos
+            elif self._reason_limit_reached(pos):
+                # Stop at the same line and byte limits as the full scan
+                blocks.append(self.pending)
+                self.pending = None
+            else:
+                line_end = min(_next_line_start(mm, pos), end)
+                if self.end_reason_pattern.match(mm, pos, line_end):
+                    blocks.append(self.pending)
+                    self.pending = None
+                else:
+                    self.pending['reason_lines'].append(mm[pos:line_end].decode('utf-8',
+                                                                                self.reason_limits.decode_errors))
+                    self.pending['reason_end_offset'] = line_end
+                pos = line_end
 
-            # Close the memory-mapped object
-            mm.close()
+        # At the end of the log an unfinished block is reported with what it has
+        if at_eof and self.pending is not None:
+            blocks.append(self.pending)
+            self.pending = None
+        self.offset = pos
+        return blocks
@@ -2,16 +2,42 @@ import sys
 
 from PyQt5.QtWidgets import QMainWindow, QApplication, QPushButton, QVBoxLayout, QHBoxLayout, QWidget, QListWidget, \
     QFileDialog, \
-    QMessageBox, QDialog, QDialogButtonBox, QLineEdit, QCheckBox, QLabel, QGridLayout, QSplitter
+    QMessageBox, QDialog, QDialogButtonBox, QLineEdit, QCheckBox, QLabel, QGridLayout, QSplitter, QProgressBar, \
+    QAbstractItemView, QListWidgetItem
+from PyQt5.QtCore import QFileSystemWatcher, QTimer, Qt
 from PyQt5.Qsci import QsciScintilla
 import os
+import re
+from bisect import bisect_left
+from array import array
 import consts
-import mmap
 import tempfile
 import utilities as utils
-import ruamel.yaml
-from log_analysis import LogAnalysis
+from log_analysis import LogAnalysis, LogFollower, ReasonLimits
+from failure_groups import group_by_from_config
+from compressed_log import detect_compression
+from analysis_result import render_text
 from custom_log_lexer import CustomLogLexer
+from analysis_worker import AnalysisWorker, DiffWorker, SearchWorker
+from line_index import LineIndex, compile_search_pattern, read_log_lines
+from failure_diff import render_diff_text
+from report_pager import ReportPager
+from result_cache import ResultCache
+from source_maps import SourceMapResolver
+from failure_index import FailureIndex
+import pattern_profiles
+from directory_index import DirectoryIndex
+from instrumentation import Instrumentation, timed
+
+
+# The "<count> FAILED:" header that starts every failure block of a text report
+_FAILURE_HEADER_PATTERN = re.compile(r'^\d+' + re.escape(consts.FAILED_MESSAGE) + r'\s*$')
+
+
+def _round_trip_yaml():
+    # ruamel keeps the comments of config.yaml, it is only imported once the settings are opened or saved
+    import ruamel.yaml
+    return ruamel.yaml.YAML()
 
 
 class LogFileApp(QMainWindow):
@@ -28,12 +54,37 @@ class LogFileApp(QMainWindow):
         # Main layout
         main_layout = QVBoxLayout()
 
+        # Search bar for the raw log
+        search_layout = QHBoxLayout()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText(consts.SEARCH_PLACEHOLDER)
+        self.search_edit.returnPressed.connect(self.start_search)
+        search_layout.addWidget(self.search_edit)
+        self.search_regex_checkbox = QCheckBox(consts.SEARCH_REGEX_LABEL)
+        search_layout.addWidget(self.search_regex_checkbox)
+        self.search_ignore_case_checkbox = QCheckBox(consts.SEARCH_IGNORE_CASE_LABEL)
+        self.search_ignore_case_checkbox.setChecked(True)
+        search_layout.addWidget(self.search_ignore_case_checkbox)
+        self.search_button = QPushButton(consts.SEARCH_MESSAGE)
+        self.search_button.clicked.connect(self.start_search)
+        self.search_button.setStyleSheet(stylesheet)
+        search_layout.addWidget(self.search_button)
+        main_layout.addLayout(search_layout)
+
+        # Filter over the failures of the shown analysis, applied as it is typed
+        self.failure_filter_edit = QLineEdit()
+        self.failure_filter_edit.setPlaceholderText(consts.FAILURE_FILTER_PLACEHOLDER)
+        self.failure_filter_edit.textChanged.connect(self.apply_failure_filter)
+        main_layout.addWidget(self.failure_filter_edit)
+
         # Create horizontal layout for log files list and output editor
         splitter = QSplitter()
 
         # Listbox for displaying log files
         self.log_files_listbox = QListWidget()
         self.log_files_listbox.itemDoubleClicked.connect(self.process_file)  # Add double-click event
+        # Two selected logs can be compared
+        self.log_files_listbox.setSelectionMode(QAbstractItemView.ExtendedSelection)
         splitter.addWidget(self.log_files_listbox)
 
         # QScintilla editor for output
@@ -41,11 +92,45 @@ class LogFileApp(QMainWindow):
         self.lexer = CustomLogLexer(self.output_text)  # Use custom lexer for log text
         self.output_text.setLexer(self.lexer)
         self.output_text.setWrapMode(QsciScintilla.SC_WRAP_WORD)  # Enable text wrapping
+        self.output_text.verticalScrollBar().valueChanged.connect(self.on_output_scrolled)
+        # Double-clicking a failure opens the region of the raw log it was found in
+        self.output_text.SCN_DOUBLECLICK.connect(self.on_output_double_clicked)
+        self.output_text.textChanged.connect(self.clear_header_checkpoints)
         splitter.addWidget(self.output_text)
 
+        # Failure index for large reports that are shown one page at a time
+        self.failure_index_listbox = QListWidget()
+        self.failure_index_listbox.itemClicked.connect(self.jump_to_failure)
+        self.failure_index_listbox.setVisible(False)
+        splitter.addWidget(self.failure_index_listbox)
+
+        # Lines of the raw log matching the search, filled in as they are found
+        self.search_results_listbox = QListWidget()
+        self.search_results_listbox.itemClicked.connect(self.open_search_result)
+        self.search_results_listbox.setVisible(False)
+        splitter.addWidget(self.search_results_listbox)
+
         # Add the splitter to the main layout
         main_layout.addWidget(splitter)
 
+        # Progress bar and Cancel button, only shown while an analysis runs
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        progress_layout.addWidget(self.progress_bar)
+        self.cancel_button = QPushButton(consts.CANCEL_ANALYSIS_MESSAGE)
+        self.cancel_button.clicked.connect(self.cancel_analysis)
+        self.cancel_button.setStyleSheet(stylesheet)
+        progress_layout.addWidget(self.cancel_button)
+        main_layout.addLayout(progress_layout)
+        self.set_analysis_running(False)
+
+        # Timing breakdown of the last analysis, only shown when instrumentation is enabled
+        self.instrumentation_label = QLabel()
+        self.instrumentation_label.setStyleSheet("font-family: monospace;")
+        self.instrumentation_label.setVisible(False)
+        main_layout.addWidget(self.instrumentation_label)
+
         # Create a horizontal layout for buttons
         button_layout = QHBoxLayout()
 
@@ -73,6 +158,18 @@ class LogFileApp(QMainWindow):
         self.process_button.setStyleSheet(stylesheet)
         button_layout.addWidget(self.process_button)
 
+        # Follow Selected File button
+        self.follow_button = QPushButton(consts.FOLLOW_SELECTED_FILE_MESSAGE)
+        self.follow_button.clicked.connect(self.toggle_follow)
+        self.follow_button.setStyleSheet(stylesheet)
+        button_layout.addWidget(self.follow_button)
+
+        # Compare Selected Files button
+        self.compare_button = QPushButton(consts.COMPARE_SELECTED_FILES_MESSAGE)
+        self.compare_button.clicked.connect(self.compare_files)
+        self.compare_button.setStyleSheet(stylesheet)
+        button_layout.addWidget(self.compare_button)
+
         # Open in VS Code button
         self.open_vscode_button = QPushButton(consts.OPEN_IN_VS_CODE_MESSAGE)
         self.open_vscode_button.clicked.connect(self.open_in_vscode)
@@ -99,8 +196,53 @@ class LogFileApp(QMainWindow):
         self.report_directory = None
         self.temp_file_path = None
         self.default_font_size = None
+        self.analysis_workers = 1
+        self.reason_limits = None
+        self.group_by = None
+        self.result_cache = None
+        self.failure_index = None
+        # Kept for the whole session so parsed source maps are reused by every analysis
+        self.source_maps = None
+        self.report_format = "text"
+        self.analysis_worker = None
+        self.diff_worker = None
+        self.search_worker = None
+        self.search_log_path = None
         self.files = []
 
+        # The shown analysis, whose failures link back to the log they were found in
+        self.current_result = None
+        self.current_log_path = None
+        self.current_line_index = None
+        self.spec_index = None
+        # Ordinals of the shown failures while the filter narrows them, None when all are shown
+        self.filtered_ordinals = None
+        # Failure headers above every LINE_INDEX_STRIDE-th editor line, built on the first double click
+        self.header_checkpoints = None
+
+        # Paged viewing of large reports
+        self.report_pager = None
+        self.current_page = 0
+        self.loading_page = False
+        # Overlap lines of the previous page shown above the current one
+        self.page_lines_before = 0
+        self.page_label = QLabel()
+        self.statusBar().addPermanentWidget(self.page_label)
+
+        # Follow mode re-scans only what was appended whenever the watched log changes
+        self.follower = None
+        self.file_watcher = QFileSystemWatcher()
+        self.file_watcher.fileChanged.connect(self.poll_followed_file)
+
+        # The log directory is indexed once and the file list updated only with what was added or removed.
+        # Rewritten logs only change their own mtime, which a timer picks up to keep the latest log on top.
+        self.directory_index = None
+        self.directory_watcher = QFileSystemWatcher()
+        self.directory_watcher.directoryChanged.connect(lambda _path: self.update_files_listbox())
+        self.directory_timer = QTimer(self)
+        self.directory_timer.setInterval(int(consts.DIRECTORY_POLL_INTERVAL_SECONDS * 1000))
+        self.directory_timer.timeout.connect(self.update_files_listbox)
+
     @staticmethod
     def load_stylesheet(filename):
         with open(filename, "r") as file:
@@ -127,7 +269,7 @@ class LogFileApp(QMainWindow):
 
     def reload_files(self):
         if self.log_directory:
-            self.populate_files_listbox()
+            self.update_files_listbox()
 
     def process_file(self):
         selected_item = self.log_files_listbox.currentItem()
@@ -135,25 +277,231 @@ class LogFileApp(QMainWindow):
             QMessageBox.information(self, consts.INFORMATION_MESSAGE, consts.PLEASE_SELECT_A_FILE_MESSAGE)
             return
 
+        if self.analysis_worker:
+            return
+
+        # Extract failed test cases on a worker thread so the window stays responsive
         choice = self.log_files_listbox.row(selected_item)
-        mm = self.read_latest_log_from_directory(choice)
-        if mm:
-            if self.use_temp_file:
-                # Create a temporary file
-                with tempfile.NamedTemporaryFile(mode='w+', suffix=".txt", delete=False) as temp_file:
-                    self.temp_file_path = temp_file.name
+        log_path = os.path.join(self.log_directory, self.files[choice])
+        self.output_text.clear()
+        self.analysis_worker = AnalysisWorker(log_path, self.create_report_path, self.analysis_workers,
+                                              self.result_cache, self.report_format, self.reason_limits,
+                                              self.group_by, Instrumentation.from_config(self.config),
+                                              self.source_maps, self)
+        self.analysis_worker.progress.connect(self.progress_bar.setValue)
+        self.analysis_worker.failure_found.connect(self.output_text.append)
+        self.analysis_worker.analysis_finished.connect(self.on_analysis_finished)
+        self.analysis_worker.analysis_cancelled.connect(self.on_analysis_cancelled)
+        self.analysis_worker.analysis_failed.connect(self.on_analysis_failed)
+        self.analysis_worker.finished.connect(self.on_analysis_worker_done)
+        self.set_analysis_running(True)
+        self.analysis_worker.start()
+
+    def compare_files(self):
+        """Compares the two selected logs, the older one being the base, or the selected log with a baseline."""
+        selected_items = self.log_files_listbox.selectedItems()
+        if self.diff_worker:
+            return
+        paths = [os.path.join(self.log_directory, self.files[self.log_files_listbox.row(item)])
+                 for item in selected_items]
+        if len(paths) == 2:
+            base_path, head_path = sorted(paths, key=os.path.getmtime)
+        elif len(paths) == 1:
+            head_path = paths[0]
+            base_path, _ = QFileDialog.getOpenFileName(self, consts.SELECT_BASELINE_MESSAGE, self.log_directory)
+            if not base_path:
+                return
+        else:
+            QMessageBox.information(self, consts.INFORMATION_MESSAGE, consts.SELECT_ONE_OR_TWO_FILES_MESSAGE)
+            return
+
+        self.diff_worker = DiffWorker(base_path, head_path, self.reason_limits, self.group_by, self.config, self)
+        self.diff_worker.diff_finished.connect(self.on_diff_finished)
+        self.diff_worker.diff_failed.connect(self.on_analysis_failed)
+        self.diff_worker.finished.connect(self.on_diff_worker_done)
+        self.compare_button.setEnabled(False)
+        self.statusBar().showMessage(consts.DIFF_HEADER.format(os.path.basename(base_path),
+                                                               os.path.basename(head_path),
+                                                               consts.DEFAULT_DIFF_SIGNATURE))
+        self.diff_worker.start()
+
+    def on_diff_finished(self, diff):
+        self.close_report_pager()
+        self.current_result = None
+        self.filtered_ordinals = None
+        self.output_text.setText(render_diff_text(diff))
+        self.statusBar().showMessage(diff.format_summary())
+
+    def on_diff_worker_done(self):
+        self.diff_worker = None
+        self.compare_button.setEnabled(True)
+
+    def cancel_analysis(self):
+        if self.analysis_worker:
+            self.analysis_worker.cancel()
+
+    def set_analysis_running(self, running):
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(running)
+        self.cancel_button.setVisible(running)
+        self.process_button.setEnabled(not running)
+
+    def on_analysis_finished(self, result):
+        self.temp_file_path = result.report_path
+        self.current_result = result
+        self.current_log_path = self.analysis_worker.log_path if self.analysis_worker else None
+        self.current_line_index = self.analysis_worker.line_index if self.analysis_worker else None
+        self.spec_index = self.analysis_worker.spec_index if self.analysis_worker else None
+        self.filtered_ordinals = None
+        if self.result_cache:
+            self.statusBar().showMessage(consts.RESULT_CACHE_STATS_MESSAGE.format(**self.result_cache.stats()))
+        if self.failure_index:
+            # Record the run for the cross-run history, a failing index never hides the report
+            try:
+                self.failure_index.ingest(result)
+            except Exception as e:
+                self.statusBar().showMessage(consts.AN_ERROR_OCCURRED_MESSAGE.format(e))
+        instrumentation = self.analysis_worker.instrumentation if self.analysis_worker else None
+        with timed(instrumentation, 'render'):
+            if self.failure_filter_edit.text().strip():
+                self.apply_failure_filter()
             else:
-                # Create a unique file in the specified temp_directory
-                if not os.path.exists(self.report_directory):
-                    os.makedirs(self.report_directory)
-                self.temp_file_path = utils.create_unique_filename(self.report_directory)
+                self.show_result(result)
+        if instrumentation is not None:
+            self.show_instrumentation(instrumentation)
+
+    def show_result(self, result):
+        # Large text reports are paged from disk, anything else is rendered straight from the result
+        if self.report_format == "text" and os.path.getsize(result.report_path) > consts.VIEWER_PAGED_THRESHOLD_BYTES:
+            self.display_file_content(result.report_path)
+        else:
+            self.display_result(result)
 
-            # Extract failed test cases and write them to the file
-            LogAnalysis.extract_failed_test_cases(mm, self.temp_file_path)
-            mm.close()
-            self.display_file_content(self.temp_file_path)
+    def apply_failure_filter(self):
+        """Shows the failures of the shown analysis matching the filter, or all of them once it is cleared."""
+        if self.current_result is None or self.spec_index is None:
+            return
+        query = self.failure_filter_edit.text().strip()
+        if not query:
+            if self.filtered_ordinals is not None:
+                self.filtered_ordinals = None
+                self.show_result(self.current_result)
+            return
+        # Only the index is queried, the log is not read again
+        self.filtered_ordinals = self.spec_index.search(query)
+        self.display_result(self.current_result.filtered(self.filtered_ordinals))
+        self.statusBar().showMessage(consts.FAILURE_FILTER_MESSAGE.format(len(self.filtered_ordinals),
+                                                                          len(self.spec_index), query))
+
+    def show_instrumentation(self, instrumentation):
+        """Shows the timing breakdown of the finished analysis and exports it when configured."""
+        self.instrumentation_label.setText(instrumentation.format_summary())
+        self.instrumentation_label.setVisible(True)
+        try:
+            paths = instrumentation.export()
+            if paths:
+                self.statusBar().showMessage(consts.INSTRUMENTATION_EXPORTED_MESSAGE.format(", ".join(paths)))
+        except OSError as e:
+            self.statusBar().showMessage(consts.AN_ERROR_OCCURRED_MESSAGE.format(e))
+
+    def on_analysis_cancelled(self):
+        self.statusBar().showMessage(consts.ANALYSIS_CANCELLED_MESSAGE)
+
+    def on_analysis_failed(self, message):
+        self.show_alert(consts.AN_ERROR_OCCURRED_MESSAGE.format(message))
+
+    def on_analysis_worker_done(self):
+        self.analysis_worker = None
+        self.set_analysis_running(False)
+
+    def closeEvent(self, event):
+        # Stop a running analysis before the window and its thread go away
+        if self.analysis_worker:
+            self.analysis_worker.cancel()
+            self.analysis_worker.wait()
+        if self.diff_worker:
+            self.diff_worker.wait()
+        if self.search_worker:
+            self.search_worker.cancel()
+            self.search_worker.wait()
+        super().closeEvent(event)
+
+    def create_report_path(self):
+        suffix = consts.REPORT_FORMATS.get(self.report_format, consts.REPORT_FORMATS["text"])
+        if self.use_temp_file:
+            # Create a temporary file
+            with tempfile.NamedTemporaryFile(mode='w+', suffix=suffix, delete=False) as temp_file:
+                return temp_file.name
+        # Create a unique file in the specified temp_directory
+        if not os.path.exists(self.report_directory):
+            os.makedirs(self.report_directory)
+        return utils.create_unique_filename(self.report_directory, suffix=suffix)
+
+    def toggle_follow(self):
+        if self.follower:
+            self.stop_following()
+        else:
+            self.start_following()
+
+    def start_following(self):
+        selected_item = self.log_files_listbox.currentItem()
+        if not selected_item:
+            QMessageBox.information(self, consts.INFORMATION_MESSAGE, consts.PLEASE_SELECT_A_FILE_MESSAGE)
+            return
+
+        log_path = os.path.join(self.log_directory, self.files[self.log_files_listbox.row(selected_item)])
+        # Compressed logs are finished archives, so they are analyzed instead of followed
+        if detect_compression(log_path):
+            self.process_file()
+            return
+        try:
+            self.follower = LogFollower(log_path, self.create_report_path(), self.reason_limits)
+        except Exception as e:
+            self.show_alert(consts.AN_ERROR_OCCURRED_MESSAGE.format(e))
+            return
+
+        # Followed reports grow past the blocks of the last analysis
+        self.current_result = None
+        self.filtered_ordinals = None
+        # Show what a resumed follow already reported, then catch up with the log
+        self.temp_file_path = self.follower.report_path
+        self.display_file_content(self.temp_file_path)
+        self.file_watcher.addPath(log_path)
+        self.follow_button.setText(consts.STOP_FOLLOWING_MESSAGE)
+        self.poll_followed_file()
+
+    def poll_followed_file(self):
+        if not self.follower:
+            return
+        try:
+            new_failures = self.follower.poll()
+        except Exception as e:
+            self.stop_following()
+            self.show_alert(consts.AN_ERROR_OCCURRED_MESSAGE.format(e))
+            return
+        if new_failures:
+            self.output_text.append(new_failures)
+        # Some writers replace the file, which drops it from the watcher
+        if self.follower.log_path not in self.file_watcher.files():
+            self.file_watcher.addPath(self.follower.log_path)
+
+    def stop_following(self):
+        follower, self.follower = self.follower, None
+        self.follow_button.setText(consts.FOLLOW_SELECTED_FILE_MESSAGE)
+        if self.file_watcher.files():
+            self.file_watcher.removePaths(self.file_watcher.files())
+        if follower:
+            self.output_text.append(follower.finish())
+
+    def display_result(self, result):
+        self.close_report_pager()
+        self.output_text.setText(render_text(result))  # Set the content in QsciScintilla widget
 
     def display_file_content(self, file_path):
+        self.close_report_pager()
+        if os.path.exists(file_path) and os.path.getsize(file_path) > consts.VIEWER_PAGED_THRESHOLD_BYTES:
+            self.open_paged_report(file_path)
+            return
         try:
             with open(file_path, 'r') as file:
                 content = file.read()
@@ -161,6 +509,196 @@ class LogFileApp(QMainWindow):
         except Exception as e:
             self.show_alert(consts.ERROR_READING_FILE_MESSAGE.format(e))
 
+    def open_paged_report(self, file_path):
+        try:
+            self.report_pager = ReportPager(file_path)
+        except Exception as e:
+            self.show_alert(consts.ERROR_READING_FILE_MESSAGE.format(e))
+            return
+        self.failure_index_listbox.clear()
+        for fail_count in self.report_pager.failure_counts:
+            self.failure_index_listbox.addItem(consts.FAILURE_INDEX_ITEM.format(fail_count))
+        self.failure_index_listbox.setVisible(True)
+        self.load_report_page(0)
+
+    def close_report_pager(self):
+        if self.report_pager:
+            self.report_pager.close()
+            self.report_pager = None
+        self.failure_index_listbox.clear()
+        self.failure_index_listbox.setVisible(False)
+        self.page_label.clear()
+
+    def load_report_page(self, page, first_line_in_page=0, at_bottom=False):
+        """Shows one page of the report with a few overlap lines so scrolling past its edges can be detected."""
+        self.loading_page = True
+        text, lines_before = self.report_pager.window_text(page)
+        self.output_text.setText(text)
+        self.current_page = page
+        self.page_lines_before = lines_before
+        if at_bottom:
+            page_lines = text.count("\n") - lines_before
+            self.output_text.ensureLineVisible(lines_before + page_lines)
+        else:
+            self.output_text.setFirstVisibleLine(lines_before + first_line_in_page)
+        self.page_label.setText(consts.PAGE_LABEL.format(page + 1, self.report_pager.page_count))
+        self.loading_page = False
+
+    def on_output_scrolled(self, value):
+        if not self.report_pager or self.loading_page:
+            return
+        scroll_bar = self.output_text.verticalScrollBar()
+        # Reaching either end of the window moves to the neighbouring page
+        if value >= scroll_bar.maximum() and self.current_page + 1 < self.report_pager.page_count:
+            self.load_report_page(self.current_page + 1)
+        elif value <= scroll_bar.minimum() and self.current_page > 0:
+            self.load_report_page(self.current_page - 1, at_bottom=True)
+
+    def jump_to_failure(self, item):
+        if not self.report_pager:
+            return
+        offset = self.report_pager.failure_offsets[self.failure_index_listbox.row(item)]
+        self.load_report_page(self.report_pager.page_of(offset), self.report_pager.line_in_page(offset))
+
+    def failure_block_at_line(self, line):
+        """Returns the failure block of the shown analysis that the editor line belongs to, or None."""
+        if self.current_result is None:
+            return None
+        header_line = next((editor_line for editor_line in range(line, -1, -1)
+                            if _FAILURE_HEADER_PATTERN.match(self.output_text.text(editor_line))), None)
+        if header_line is None:
+            return None
+        # Blocks are shown in result order, so the header's ordinal is the block's index
+        ordinal = self.headers_above(header_line)
+        if self.report_pager:
+            # Headers before the page, minus the ones repeated in the overlap above it
+            page_start = self.report_pager.page_starts[self.current_page]
+            ordinal += bisect_left(self.report_pager.failure_offsets, page_start) - self.headers_above(
+                min(self.page_lines_before, header_line + 1))
+        if self.filtered_ordinals is not None:
+            # A filtered view shows a subset of the blocks, in order
+            ordinal = self.filtered_ordinals[ordinal] if ordinal < len(self.filtered_ordinals) else -1
+        if 0 <= ordinal < len(self.current_result.blocks):
+            return self.current_result.blocks[ordinal]
+        return None
+
+    def headers_above(self, line):
+        """
+        Returns how many failure headers the editor shows above the line. Like a LineIndex, the count above every
+        LINE_INDEX_STRIDE-th line is kept, so only the lines after the nearest checkpoint are matched.
+        """
+        stride = consts.LINE_INDEX_STRIDE
+        if self.header_checkpoints is None:
+            # header_checkpoints[k] is the number of headers above editor line k * stride
+            self.header_checkpoints = array('Q')
+            headers = 0
+            for editor_line, text in enumerate(self.output_text.text().split("\n")):
+                if not editor_line % stride:
+                    self.header_checkpoints.append(headers)
+                if _FAILURE_HEADER_PATTERN.match(text):
+                    headers += 1
+        checkpoint = min(line // stride, len(self.header_checkpoints) - 1)
+        return self.header_checkpoints[checkpoint] + sum(
+            1 for editor_line in range(checkpoint * stride, line)
+            if _FAILURE_HEADER_PATTERN.match(self.output_text.text(editor_line)))
+
+    def clear_header_checkpoints(self):
+        self.header_checkpoints = None
+
+    def on_output_double_clicked(self, position, line, modifiers):
+        block = self.failure_block_at_line(line)
+        if block is None or not block.line_number or not self.current_log_path:
+            self.statusBar().showMessage(consts.NO_ORIGIN_MESSAGE)
+            return
+        last_line = block.line_number
+        if block.reason_line_number:
+            last_line = max(last_line, block.reason_line_number + len(block.reason_lines) - 1)
+        self.show_log_region(self.current_log_path, block.line_number, last_line)
+
+    def show_log_region(self, log_path, first_line, last_line):
+        """Opens the lines first_line to last_line of the raw log, with some context, in a window of their own."""
+        start = max(1, first_line - consts.LOG_REGION_CONTEXT_LINES)
+        end = last_line + consts.LOG_REGION_CONTEXT_LINES
+        try:
+            mm = LogAnalysis.open_log(log_path)
+            try:
+                line_index = self.current_line_index if log_path == self.current_log_path else None
+                if line_index is None:
+                    line_index = LineIndex.for_log(log_path, mm)
+                lines = read_log_lines(mm, start, end, line_index)
+            finally:
+                mm.close()
+        except Exception as e:
+            self.show_alert(consts.ERROR_READING_FILE_MESSAGE.format(e))
+            return
+
+        dialog = QDialog(self)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
+        dialog.setWindowTitle(consts.LOG_REGION_TITLE.format(os.path.basename(log_path), start,
+                                                             start + len(lines) - 1))
+        layout = QVBoxLayout(dialog)
+        editor = QsciScintilla()
+        editor.setLexer(CustomLogLexer(editor))
+        # The origin lines are marked so they stand out from their context
+        editor.setText("\n".join(
+            consts.LOG_REGION_LINE.format(line_number,
+                                          consts.LOG_REGION_MARKER if first_line <= line_number <= last_line else " ",
+                                          line)
+            for line_number, line in enumerate(lines, start)))
+        editor.setReadOnly(True)
+        editor.setFirstVisibleLine(max(0, first_line - start - 3))
+        layout.addWidget(editor)
+        dialog.resize(900, 600)
+        dialog.show()
+
+    def start_search(self):
+        """Searches the selected log, or the analyzed one, streaming matching lines into the results list."""
+        query = self.search_edit.text()
+        selected_item = self.log_files_listbox.currentItem()
+        if selected_item:
+            log_path = os.path.join(self.log_directory, self.files[self.log_files_listbox.row(selected_item)])
+        else:
+            log_path = self.current_log_path
+        if not query or not log_path:
+            return
+        try:
+            pattern = compile_search_pattern(query, self.search_regex_checkbox.isChecked(),
+                                             self.search_ignore_case_checkbox.isChecked())
+        except re.error as e:
+            self.show_alert(consts.INVALID_SEARCH_MESSAGE.format(e))
+            return
+
+        if self.search_worker:
+            self.search_worker.cancel()
+            self.search_worker.wait()
+        self.search_results_listbox.clear()
+        self.search_results_listbox.setVisible(True)
+        self.search_log_path = log_path
+        self.search_worker = SearchWorker(log_path, pattern, parent=self)
+        self.search_worker.matches_found.connect(self.on_search_matches)
+        self.search_worker.search_finished.connect(self.on_search_finished)
+        self.search_worker.search_failed.connect(self.on_analysis_failed)
+        self.search_worker.start()
+
+    def on_search_matches(self, matches):
+        # Batches of a cancelled search can still be queued
+        if self.sender() is not self.search_worker:
+            return
+        for line_number, text in matches:
+            item = QListWidgetItem(consts.SEARCH_RESULT_ITEM.format(line_number, text))
+            item.setData(Qt.UserRole, line_number)
+            self.search_results_listbox.addItem(item)
+
+    def on_search_finished(self, found, limited):
+        if self.sender() is not self.search_worker:
+            return
+        message = consts.SEARCH_LIMIT_MESSAGE if limited else consts.SEARCH_FINISHED_MESSAGE
+        self.statusBar().showMessage(message.format(found))
+
+    def open_search_result(self, item):
+        line_number = item.data(Qt.UserRole)
+        self.show_log_region(self.search_log_path, line_number, line_number)
+
     def open_in_vscode(self):
         if hasattr(self, 'temp_file_path') and self.temp_file_path:
             os.system(f"code \"{self.temp_file_path}\"")
@@ -170,20 +708,64 @@ class LogFileApp(QMainWindow):
     def read_latest_log_from_directory(self, choice):
         try:
             filename = os.path.join(self.log_directory, self.files[choice])
-            with open(filename, 'r') as f:
-                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-            return mm
+            # Compressed logs come back as a CompressedLog that is streamed when analyzed
+            return LogAnalysis.open_log(filename)
         except Exception as e:
             self.show_alert(f"An error occurred: {e}")
             return None
 
     def populate_files_listbox(self):
+        """Lists the log directory from its index and starts watching it for added or removed files."""
         self.log_files_listbox.clear()  # Clear the listbox
+        if self.directory_watcher.directories():
+            self.directory_watcher.removePaths(self.directory_watcher.directories())
+        self.directory_timer.stop()
+        self.directory_index = None
+        self.files = []
         if self.log_directory:
-            self.files = LogAnalysis.get_files_from_dir(self.log_directory, True)
-            for filename in self.files:
-                if filename not in consts.MACOS_SYSTEM_FILES:  # Skip macOS system files
-                    self.log_files_listbox.addItem(filename)
+            # The index already skips macOS system files, so rows and self.files stay aligned
+            self.directory_index = DirectoryIndex(self.log_directory)
+            self.update_files_listbox()
+            self.directory_watcher.addPath(self.log_directory)
+            self.directory_timer.start()
+
+    def update_files_listbox(self):
+        """Removes and inserts only the files that changed since the last listing, keeping the selection."""
+        if not self.directory_index:
+            return
+        try:
+            added, removed = self.directory_index.refresh()
+        except OSError as e:
+            # A directory that went away would otherwise raise the alert on every tick
+            self.directory_timer.stop()
+            self.show_alert(consts.AN_ERROR_OCCURRED_MESSAGE.format(e))
+            return
+        files = self.directory_index.get_files(True)
+        if files == self.files:
+            return
+
+        for filename in removed:
+            # The persisted index can report files removed since the last run, which were never listed here
+            if filename not in self.files:
+                continue
+            row = self.files.index(filename)
+            self.log_files_listbox.takeItem(row)
+            del self.files[row]
+        added = set(added)
+        for row, filename in enumerate(files):
+            if filename in added:
+                self.log_files_listbox.insertItem(row, filename)
+                self.files.insert(row, filename)
+
+        # Files whose mtime changed move in the order, rebuild the list then
+        if self.files != files:
+            current_item = self.log_files_listbox.currentItem()
+            current_name = current_item.text() if current_item else None
+            self.log_files_listbox.clear()
+            self.log_files_listbox.addItems(files)
+            self.files = files
+            if current_name in files:
+                self.log_files_listbox.setCurrentRow(files.index(current_name))
 
     @staticmethod
     def show_alert(message):
@@ -201,7 +783,18 @@ class LogFileApp(QMainWindow):
         self.log_directory = self.config.get('log_location', {}).get('where_are_your_logs_located', '')
         self.use_temp_file = self.config.get('file_handling', {}).get('use_temp_file', True)
         self.report_directory = self.config.get('file_handling', {}).get('report_directory', '')
+        self.report_format = self.config.get('file_handling', {}).get('report_format', 'text')
         self.default_font_size = self.config.get('ui_settings', {}).get('default_font_size', 16)
+        self.analysis_workers = self.config.get('performance', {}).get('analysis_workers', 1)
+        self.reason_limits = ReasonLimits.from_config(self.config)
+        self.group_by = group_by_from_config(self.config)
+        self.result_cache = ResultCache.from_config(self.config)
+        self.failure_index = FailureIndex.from_config(self.config)
+        self.source_maps = SourceMapResolver.from_config(self.config)
+        try:
+            pattern_profiles.load_profiles(self.config)
+        except (ValueError, KeyError, re.error) as e:
+            self.show_alert(consts.AN_ERROR_OCCURRED_MESSAGE.format(e))
 
         # Check if a log directory is specified and populate the listbox
         if self.log_directory:
@@ -268,7 +861,7 @@ class LogFileApp(QMainWindow):
         config_path = self.get_config_path()
         if os.path.exists(config_path):
             with open(config_path, 'r') as file:
-                yaml = ruamel.yaml.YAML()
+                yaml = _round_trip_yaml()
                 config = yaml.load(file)
             self.log_location_edit.setText(config.get('log_location', {}).get('where_are_your_logs_located', ''))
             self.use_temp_file_checkbox.setChecked(config.get('file_handling', {}).get('use_temp_file', False))
@@ -278,7 +871,7 @@ class LogFileApp(QMainWindow):
     def save_yaml_config_from_widgets(self):
         config_path = self.get_config_path()
         with open(config_path, 'r') as file:
-            yaml = ruamel.yaml.YAML()
+            yaml = _round_trip_yaml()
             config = yaml.load(file)
 
         # Update only the specific keys
@@ -0,0 +1,70 @@
+# Generates deterministic synthetic Karma logs for benchmarking the analysis
+###########################################
+
+import random  # For deterministic pseudo random content
+import argparse  # For command line options
+
+BROWSER = "HeadlessChrome 74.0.3729 (Mac OS X 10.14.4)"
+FILLER_LINES = [
+    "LOG: 'Angular is running in the development mode. Call enableProdMode() to enable the production mode.'",
+    "WARN: 'Spec has no expectations.'",
+    "LOG: Object{type: 'ROUTER_NAVIGATION', payload: Object{routerState: Object{url: '/dashboard'}}}",
+]
+REASON_LINES = [
+    "\tExpected undefined to be truthy.",
+    "\tTypeError: Cannot read property 'subscribe' of undefined",
+    "\t    at UserContext.<anonymous> (http://localhost:9876/_karma_webpack_/main.js:{}:17)",
+    "\t    at ZoneDelegate.invoke (http://localhost:9876/_karma_webpack_/polyfills.js:{}:26)",
+    "\t    at ProxyZoneSpec.onInvoke (http://localhost:9876/_karma_webpack_/vendor.js:{}:39)",
+]
+
+
+def _pad_line(line, line_length):
+    """Repeats the line up to exactly line_length characters, or cuts it there."""
+    return (line + " ") * (line_length // (len(line) + 1)) + line[:line_length % (len(line) + 1)]
+
+
+def generate_karma_log(path, size_bytes, failure_every=500, reason_length=6, seed=0, line_length=None):
+    """
+    Writes a Karma style log of roughly size_bytes to path and returns the number of failures written. Every
+    failure_every-th spec fails with reason_length reason lines, and line_length, when given, makes every
+    filler line exactly that long. The same arguments always write the same log.
+    """
+    rng = random.Random(seed)
+    filler_lines = FILLER_LINES if not line_length else [_pad_line(line, line_length) for line in FILLER_LINES]
+    executed = 0
+    failures = 0
+    written = 0
+    with open(path, 'w', encoding='utf-8', newline='\n') as log:
+        while written < size_bytes:
+            executed += 1
+            lines = [rng.choice(filler_lines)]
+            if executed % failure_every == 0:
+                failures += 1
+                lines.append(f"{BROWSER} Component{failures} should render the view FAILED")
+                for idx in range(reason_length):
+                    lines.append(REASON_LINES[idx % len(REASON_LINES)].format(rng.randint(1, 99999)))
+                lines.append(f"{BROWSER}: Executed {executed} of 1000000 ({failures} FAILED) (0 secs / 1.2 secs)")
+            elif failures:
+                lines.append(f"{BROWSER}: Executed {executed} of 1000000 ({failures} FAILED) (0 secs / 1.2 secs)")
+            else:
+                lines.append(f"{BROWSER}: Executed {executed} of 1000000 SUCCESS (0 secs / 1.2 secs)")
+            chunk = "\n".join(lines) + "\n"
+            log.write(chunk)
+            written += len(chunk)
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic Karma log.")
+    parser.add_argument("path", help="Where to write the log")
+    parser.add_argument("--size-mb", type=float, default=10, help="Approximate size in MB")
+    parser.add_argument("--failure-every", type=int, default=500, help="One failing spec every this many specs")
+    parser.add_argument("--reason-length", type=int, default=6, help="Reason lines per failure")
+    parser.add_argument("--line-length", type=int, help="Length of every filler line")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failures = generate_karma_log(args.path, int(args.size_mb * 1024 * 1024), args.failure_every,
+                                  args.reason_length, args.seed, args.line_length)
+    print(f"Wrote {args.path} with {failures} failures")
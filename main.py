@@ -2,21 +2,34 @@
 ###########################################
 
 import os  # For file and directory operations
-import mmap  # For memory-mapped file objects
 import tempfile  # For creating temporary files
 import consts  # For constants
 import utilities as utils  # For utils
 import yaml  # For reading config file
 import sys
-from PyQt5.QtWidgets import QApplication
-from log_analysis import LogAnalysis  # Log analysis tools
-from log_file_app import LogFileApp
-
-
-def read_latest_log_from_directory(directory: str):
-    """Reads the latest log file from a directory and returns its memory-mapped object."""
+import time  # For the follow mode polling interval
+from log_analysis import LogAnalysis, LogFollower, ReasonLimits  # Log analysis tools
+from result_cache import ResultCache  # For reusing results of unchanged logs
+from directory_index import DirectoryIndex  # For listing the log directory without rescanning it
+from compressed_log import detect_compression  # For telling compressed logs apart
+import pattern_profiles  # For the configured pattern profiles
+from failure_groups import group_by_from_config  # For grouping every failure block
+from instrumentation import Instrumentation, timed  # For the optional timing breakdown
+from failure_diff import diff_logs, write_diff_text  # For comparing two runs
+from source_maps import SourceMapResolver  # For resolving bundled stack frames
+
+
+def read_latest_log_from_directory(directory_index: DirectoryIndex, instrumentation=None):
+    """
+    Reads the latest log file from an indexed directory and returns its memory-mapped object, its path, whether
+    the user asked to follow it instead and, when the user asked to compare it, the path of the base log.
+    instrumentation, when given, is started once a log is chosen.
+    """
+    directory = directory_index.directory
     try:
-        files = LogAnalysis.get_files_from_dir(directory, False)
+        # Restats the directory so logs written since the last menu move to the end
+        directory_index.refresh()
+        files = directory_index.get_files(False)
 
         print_files_in_console(files)
 
@@ -27,25 +40,94 @@ def read_latest_log_from_directory(directory: str):
             utils.insert_console_separator()
             utils.print_refresh_message_in_console()
             utils.insert_console_separator()
-            return
-        else:
-            choice = len(files) if choice == "" else int(choice)
+            return None, None, False, None
+
+        # A leading 'd' compares a log with the latest one, or with a second chosen log
+        if choice.lower().startswith(consts.DIFF_OPTION):
+            numbers = [int(number) for number in choice[len(consts.DIFF_OPTION):].split()]
+            # Alone it compares the two latest logs
+            base = numbers[0] if numbers else len(files) - 1
+            head = numbers[1] if len(numbers) > 1 else len(files)
+            return None, os.path.join(directory, files[head - 1]), False, os.path.join(directory, files[base - 1])
+
+        # A leading 'f' follows the chosen file while it is still being written
+        follow = choice.lower().startswith(consts.FOLLOW_OPTION)
+        if follow:
+            choice = choice[len(consts.FOLLOW_OPTION):].strip()
+        choice = len(files) if choice == "" else int(choice)
+
+        # Compressed logs are finished archives, so they are analyzed instead of followed
+        if follow and not detect_compression(os.path.join(directory, files[choice - 1])):
+            return None, os.path.join(directory, files[choice - 1]), True, None
+        return return_file_chosen_as_memory_mapped_obj(choice, directory, files, instrumentation) + (False, None)
+
+    except Exception as e:
+        # Print the error message and return an empty result
+        print(consts.AN_ERROR_OCCURRED_MESSAGE.format(e))
+        return None, None, False, None
 
-        return return_file_chosen_as_memory_mapped_obj(choice, directory, files)
 
+def return_file_chosen_as_memory_mapped_obj(choice, directory, files, instrumentation=None):
+    log_path = os.path.join(directory, files[choice - 1])
+    if instrumentation is not None:
+        instrumentation.start(log_path)
+    # Memory-map the chosen file, or stream it when it is compressed
+    with timed(instrumentation, 'open'):
+        mm = LogAnalysis.open_log(log_path)
+    # Return the memory-mapped object with its path so workers can map it too
+    return mm, log_path
+
+
+def follow_log_in_console(log_path, report_path, reason_limits=None):
+    """Prints and reports new failures as they are appended to the log until Ctrl+C is pressed."""
+    follower = LogFollower(log_path, report_path, reason_limits)
+    print(consts.FOLLOWING_MESSAGE.format(log_path, follower.report_path))
+    try:
+        while True:
+            print(follower.poll(), end="", flush=True)
+            time.sleep(consts.FOLLOW_POLL_INTERVAL_SECONDS)
+    except KeyboardInterrupt:
+        print(follower.finish(), end="")
+    return follower.report_path
+
+
+def diff_logs_in_console(base_path, head_path, report_path, reason_limits=None, group_by=None, config=None):
+    """Compares two logs concurrently, prints the summary and writes the diff report."""
+    diff = diff_logs(base_path, head_path, reason_limits, group_by, config=config)
+    with open(report_path, 'w') as report:
+        write_diff_text(diff, report)
+    print(consts.DIFF_HEADER.format(base_path, head_path, diff.signature))
+    print(diff.format_summary())
+    return report_path
+
+
+def ingest_into_failure_index(failure_index, result):
+    """Records the analyzed run in the cross-run failure index, which never stops the analysis itself."""
+    try:
+        failure_index.ingest(result)
     except Exception as e:
-        # Print the error message and return an empty string
         print(consts.AN_ERROR_OCCURRED_MESSAGE.format(e))
-        return ""
 
 
-def return_file_chosen_as_memory_mapped_obj(choice, directory, files):
-    # Open the chosen file in read mode
-    with open(os.path.join(directory, files[choice - 1]), 'r') as f:
-        # Create a memory-mapped object from the file
-        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        # Return the memory-mapped object
-        return mm
+def print_instrumentation(instrumentation):
+    """Stops the run, prints its timing breakdown and exports it when an export directory is configured."""
+    instrumentation.stop()
+    print(instrumentation.format_summary())
+    for path in instrumentation.export():
+        print(consts.INSTRUMENTATION_EXPORTED_MESSAGE.format(path))
+
+
+def create_report_path(use_temp_file, report_directory, report_format="text"):
+    """Returns a new temporary report path or a unique one in the report directory."""
+    suffix = consts.REPORT_FORMATS.get(report_format, consts.REPORT_FORMATS["text"])
+    if use_temp_file:
+        # Create a temporary file
+        with tempfile.NamedTemporaryFile(mode='w+', suffix=suffix, delete=False) as temp_file:
+            return temp_file.name
+    # Create a unique file in the specified temp_directory
+    if not os.path.exists(report_directory):
+        os.makedirs(report_directory)
+    return utils.create_unique_filename(report_directory, suffix=suffix)
 
 
 def print_files_in_console(files):
@@ -57,6 +139,10 @@ def print_files_in_console(files):
 
 
 def main_run_gui_version(gui_config):
+    # Qt, QScintilla and ruamel are only imported for the GUI, so the CLI starts without them
+    from PyQt5.QtWidgets import QApplication
+    from log_file_app import LogFileApp
+
     app = QApplication(sys.argv)  # Create a new QApplication instance
     main_window = LogFileApp()  # Instantiate your LogFileApp
 
@@ -74,27 +160,58 @@ def main_run_cli_version(cli_config):
     log_directory = cli_config.get('log_location', {}).get('where_are_your_logs_located')
     use_temp_file = cli_config.get('file_handling', {}).get('use_temp_file')
     report_directory = cli_config.get('file_handling', {}).get('report_directory')
+    report_format = cli_config.get('file_handling', {}).get('report_format', 'text')
+    analysis_workers = cli_config.get('performance', {}).get('analysis_workers', 1)
+    reason_limits = ReasonLimits.from_config(cli_config)
+    group_by = group_by_from_config(cli_config)
+    result_cache = ResultCache.from_config(cli_config)
+    failure_index = None
+    if (cli_config.get('failure_index', {}) or {}).get('enabled', False):
+        # Imported here so the CLI does not load sqlite3 while the failure index is disabled
+        from failure_index import FailureIndex
+        failure_index = FailureIndex.from_config(cli_config)
+    source_maps = SourceMapResolver.from_config(cli_config)
 
     if not log_directory or use_temp_file is None or not report_directory:
         print(consts.CONFIGURATION_SAVED_MESSAGE)
         exit()
 
+    directory_index = DirectoryIndex(log_directory)
     while True:
-        mm = read_latest_log_from_directory(log_directory)
-        if mm:
-            if use_temp_file:
-                # Create a temporary file
-                with tempfile.NamedTemporaryFile(mode='w+', suffix=".txt", delete=False) as temp_file:
-                    temp_file_path = temp_file.name
-            else:
-                # Create a unique file in the specified temp_directory
-                if not os.path.exists(report_directory):
-                    os.makedirs(report_directory)
-                temp_file_path = utils.create_unique_filename(report_directory)
-
-            # Extract failed test cases and write them to the file
-            LogAnalysis.extract_failed_test_cases(mm, temp_file_path)
+        # A fresh breakdown for every analysis, when enabled
+        instrumentation = Instrumentation.from_config(cli_config)
+        mm, log_path, follow, diff_base_path = read_latest_log_from_directory(directory_index, instrumentation)
+        if diff_base_path:
+            try:
+                temp_file_path = diff_logs_in_console(diff_base_path, log_path,
+                                                      create_report_path(use_temp_file, report_directory),
+                                                      reason_limits, group_by, cli_config)
+            except Exception as e:
+                print(consts.AN_ERROR_OCCURRED_MESSAGE.format(e))
+                continue
+            os.system(f"code \"{temp_file_path}\"")
+            utils.insert_console_separator()
+        elif follow:
+            temp_file_path = follow_log_in_console(log_path, create_report_path(use_temp_file, report_directory),
+                                                   reason_limits)
+            os.system(f"code \"{temp_file_path}\"")
+            utils.insert_console_separator()
+        elif mm:
+            # Extract failed test cases and write them to the file, unless the cache already has this log
+            result = LogAnalysis.analyze_log(mm, log_path,
+                                             lambda: create_report_path(use_temp_file, report_directory,
+                                                                        report_format),
+                                             analysis_workers, result_cache, report_format,
+                                             reason_limits=reason_limits, group_by=group_by,
+                                             instrumentation=instrumentation, source_maps=source_maps)
+            temp_file_path = result.report_path
             mm.close()
+            if instrumentation:
+                print_instrumentation(instrumentation)
+            if result_cache:
+                print(consts.RESULT_CACHE_STATS_MESSAGE.format(**result_cache.stats()))
+            if failure_index:
+                ingest_into_failure_index(failure_index, result)
 
             # Open the file with Visual Studio Code
             os.system(f"code \"{temp_file_path}\"")
@@ -108,6 +225,9 @@ if __name__ == "__main__":
     except FileNotFoundError:
         config = None
 
+    # Compile the built-in and configured pattern profiles once
+    pattern_profiles.load_profiles(config)
+
     # Check for the use_gui_mode setting
     use_gui_mode = config.get('gui_mode', {}).get('use_gui_mode', False)
 
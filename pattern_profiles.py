@@ -0,0 +1,96 @@
+# Named sets of analysis patterns for different runners and browsers, compiled once and detected per log
+###########################################
+
+import re  # For compiling the patterns
+import hashlib  # For the fingerprint of the loaded profiles
+import consts  # For the built-in profiles
+
+
+class PatternProfile:
+    """The compiled failed, reason and end of reason patterns of one runner, plus the pattern that detects it."""
+    __slots__ = ('name', 'sources', 'detect_pattern', 'failed_pattern', 'reason_pattern', 'end_of_reason_pattern',
+                 'counted')
+
+    def __init__(self, name: str, detect: bytes, failed: bytes, reason: bytes, end_of_reason: bytes):
+        self.name = name
+        self.sources = (detect, failed, reason, end_of_reason)
+        self.detect_pattern = re.compile(detect)
+        # The trailing [^\n]* consumes the rest of the matched line
+        self.failed_pattern = re.compile(failed + rb'[^\n]*')
+        # Anchored to line starts so a single search over the buffer finds the next reason line
+        self.reason_pattern = re.compile(rb'^(?:' + reason + rb')', re.MULTILINE)
+        self.end_of_reason_pattern = re.compile(end_of_reason)
+        # Without a count group every failed match is a new failure
+        self.counted = self.failed_pattern.groups > 0
+
+    def __reduce__(self):
+        # Workers get the sources and compile them again, which is cheaper than pickling state
+        return PatternProfile, (self.name,) + self.sources
+
+
+def _as_bytes(pattern) -> bytes:
+    return pattern if isinstance(pattern, bytes) else pattern.encode('utf-8')
+
+
+# The loaded profiles in detection order, the selected profile name and the combined detector
+_profiles = {}
+_selected = consts.AUTO_PATTERN_PROFILE
+_detector = None
+
+
+def load_profiles(config=None):
+    """
+    Compiles the built-in profiles plus the ones in the pattern_profiles section of the config, which can add
+    profiles or override built-in ones, and selects the configured profile ("auto" detects it per log).
+    """
+    global _selected, _detector
+    profiles_config = (config or {}).get('pattern_profiles', {}) or {}
+    definitions = dict(consts.PATTERN_PROFILES)
+    definitions.update(profiles_config.get('profiles') or {})
+
+    _profiles.clear()
+    for name, definition in definitions.items():
+        _profiles[name] = PatternProfile(name, *(_as_bytes(definition[key])
+                                                 for key in ('detect', 'failed', 'reason', 'end_of_reason')))
+
+    _selected = profiles_config.get('profile') or consts.AUTO_PATTERN_PROFILE
+    if _selected != consts.AUTO_PATTERN_PROFILE and _selected not in _profiles:
+        raise ValueError(consts.UNKNOWN_PATTERN_PROFILE_MESSAGE.format(_selected))
+
+    # One alternation of every detect pattern finds the profile in a single search, the group that matched
+    # first in the log names it
+    _detector = re.compile(b'|'.join(b'(?P<p%d>%s)' % (idx, profile.sources[0])
+                                     for idx, profile in enumerate(_profiles.values())))
+
+
+def get_profile(name: str = None) -> PatternProfile:
+    """Returns the named profile, or the default one."""
+    if name is None:
+        name = consts.DEFAULT_PATTERN_PROFILE if consts.DEFAULT_PATTERN_PROFILE in _profiles else next(iter(_profiles))
+    if name not in _profiles:
+        raise ValueError(consts.UNKNOWN_PATTERN_PROFILE_MESSAGE.format(name))
+    return _profiles[name]
+
+
+def detect_profile(head: bytes) -> PatternProfile:
+    """
+    Returns the configured profile, or with "auto" the profile whose detect pattern matches first in head (the
+    start of a log), falling back to the default profile.
+    """
+    if _selected != consts.AUTO_PATTERN_PROFILE:
+        return _profiles[_selected]
+    detect_match = _detector.search(head)
+    if not detect_match:
+        return get_profile()
+    return list(_profiles.values())[int(detect_match.lastgroup[1:])]
+
+
+def fingerprint() -> bytes:
+    """Returns a digest of every loaded pattern and the selection, which changes whenever a result could."""
+    digest = hashlib.sha1(_selected.encode('utf-8'))
+    for profile in _profiles.values():
+        digest.update(profile.name.encode('utf-8') + b"\0" + b"\0".join(profile.sources) + b"\0")
+    return digest.digest()
+
+
+load_profiles()
@@ -0,0 +1,84 @@
+# Serves large text reports one page at a time so the viewer never loads them whole
+###########################################
+
+import re
+import mmap  # For memory-mapped file objects
+from array import array  # For compact offset indexes
+from bisect import bisect_right  # For finding the page of an offset
+import consts  # For constants
+
+# The "<count> FAILED:" header that starts every failure block of a text report
+FAILURE_HEADER_PATTERN = re.compile(rb'^(\d+)' + re.escape(consts.FAILED_MESSAGE.encode('utf-8')) + rb'\r?$',
+                                    re.MULTILINE)
+
+
+class ReportPager:
+    """
+    Memory-maps a text report and splits it into line-aligned pages of about page_bytes. Only the requested page
+    (plus a few overlap lines) is ever decoded, and an index of every failure header lets the viewer jump to a
+    failure without loading what comes before it.
+    """
+
+    def __init__(self, report_path: str, page_bytes: int = consts.VIEWER_PAGE_BYTES):
+        self.report_path = report_path
+        self._file = open(report_path, 'rb')
+        size = self._file.seek(0, 2)
+        # An empty file cannot be mapped, an empty bytes object behaves the same for reading
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        # Start offset of every page
+        self.page_starts = array('Q', [0])
+        while True:
+            newline = self.mm.find(b"\n", self.page_starts[-1] + page_bytes)
+            if newline == -1 or newline + 1 >= size:
+                break
+            self.page_starts.append(newline + 1)
+
+        # Offset and fail count of every failure header
+        self.failure_offsets = array('Q')
+        self.failure_counts = array('Q')
+        for header_match in FAILURE_HEADER_PATTERN.finditer(self.mm):
+            self.failure_offsets.append(header_match.start())
+            self.failure_counts.append(int(header_match.group(1)))
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_starts)
+
+    def page_range(self, page: int):
+        """Returns the (start, end) byte range of a page."""
+        end = self.page_starts[page + 1] if page + 1 < self.page_count else len(self.mm)
+        return self.page_starts[page], end
+
+    def page_of(self, offset: int) -> int:
+        """Returns the page holding the byte offset."""
+        return bisect_right(self.page_starts, offset) - 1
+
+    def line_in_page(self, offset: int) -> int:
+        """Returns the 0-based line of the byte offset within its page."""
+        return self.mm[self.page_starts[self.page_of(offset)]:offset].count(b"\n")
+
+    def window_text(self, page: int, overlap_lines: int = consts.VIEWER_OVERLAP_LINES):
+        """
+        Returns the page's text with up to overlap_lines lines of the neighbouring pages before and after it, plus
+        the number of lines that were prepended, so the viewer can scroll past either edge of the page.
+        """
+        start, end = self.page_range(page)
+        window_start = start
+        for _ in range(overlap_lines):
+            if window_start == 0:
+                break
+            window_start = self.mm.rfind(b"\n", 0, window_start - 1) + 1
+        window_end = end
+        for _ in range(overlap_lines):
+            if window_end >= len(self.mm):
+                break
+            newline = self.mm.find(b"\n", window_end)
+            window_end = len(self.mm) if newline == -1 else newline + 1
+        lines_before = self.mm[window_start:start].count(b"\n")
+        return self.mm[window_start:window_end].decode('utf-8', errors='replace'), lines_before
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self._file.close()
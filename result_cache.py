@@ -0,0 +1,128 @@
+# On-disk cache of analysis results so unchanged logs are not analyzed twice
+###########################################
+
+import os  # For file and directory operations
+import json  # For storing the parsed results
+import hashlib  # For the cache keys and content hashes
+import tempfile  # For the default cache location
+import consts  # For constants
+import pattern_profiles  # For the patterns that are part of every key
+
+
+class ResultCache:
+    """
+    Stores the analysis result of a log keyed by its path, size, mtime, the analysis patterns and
+    optionally a hash of the start and end of its content. Entries are JSON files whose mtime records the last
+    use, so the least recently used ones are evicted once the cache grows past its size budget.
+    """
+
+    def __init__(self, directory=None, max_size_mb=consts.RESULT_CACHE_DEFAULT_SIZE_MB, use_content_hash=False,
+                 key_salt=b""):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), consts.RESULT_CACHE_DIRECTORY_NAME)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.use_content_hash = use_content_hash
+        # Anything else that changes results, such as the reason extraction limits
+        self.key_salt = key_salt
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """Builds the cache described by the result_cache section of the config, or None when it is disabled."""
+        cache_config = (config or {}).get('result_cache', {}) or {}
+        if not cache_config.get('enabled', True):
+            return None
+        return cls(cache_config.get('directory') or None,
+                   cache_config.get('max_size_mb', consts.RESULT_CACHE_DEFAULT_SIZE_MB),
+                   cache_config.get('use_content_hash', False),
+                   json.dumps([(config or {}).get(section)
+                               for section in ('reason_extraction', 'failure_grouping', 'source_maps')],
+                              sort_keys=True).encode('utf-8'))
+
+    def key_for(self, log_path: str) -> str:
+        """Returns the cache key of the log as it is on disk right now."""
+        stat = os.stat(log_path)
+        key = hashlib.sha1(consts.RESULT_CACHE_FORMAT_VERSION.encode('utf-8') + b"\0")
+        for part in (os.path.abspath(log_path), str(stat.st_size), str(stat.st_mtime_ns)):
+            key.update(part.encode('utf-8') + b"\0")
+        # Changing a pattern or profile changes every result, so all loaded profiles are part of the key
+        key.update(pattern_profiles.fingerprint())
+        key.update(self.key_salt + b"\0")
+        if self.use_content_hash:
+            key.update(self._content_hash(log_path, stat.st_size))
+        return key.hexdigest()
+
+    @staticmethod
+    def _content_hash(log_path: str, size: int) -> bytes:
+        """Hashes the first and last blocks of the log, which catches rewrites that keep size and mtime."""
+        sample = consts.RESULT_CACHE_HASH_SAMPLE_BYTES
+        content_hash = hashlib.blake2b(digest_size=16)
+        with open(log_path, 'rb') as log:
+            content_hash.update(log.read(sample))
+            if size > sample:
+                log.seek(max(sample, size - sample))
+                content_hash.update(log.read(sample))
+        return content_hash.digest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, log_path: str):
+        """Returns the cached entry ({'result': AnalysisResult.to_dict(), 'report_path': str}) or None."""
+        entry_path = self._entry_path(self.key_for(log_path))
+        try:
+            with open(entry_path, 'r') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # Touch the entry so it counts as recently used
+        os.utime(entry_path)
+        self.hits += 1
+        return entry
+
+    def put(self, log_path: str, result):
+        """Stores the analysis result of the log and the report it was written to, then enforces the budget."""
+        entry = {
+            'log_path': os.path.abspath(log_path),
+            'result': result.to_dict(),
+            'report_path': result.report_path,
+        }
+        entry_path = self._entry_path(self.key_for(log_path))
+        # Write to a temporary name first so readers never see half written entries
+        with tempfile.NamedTemporaryFile('w', dir=self.directory, suffix=".tmp", delete=False) as file:
+            json.dump(entry, file)
+        os.replace(file.name, entry_path)
+        self.evict()
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits its size budget."""
+        entries = []
+        total_size = 0
+        with os.scandir(self.directory) as scan:
+            for dir_entry in scan:
+                if dir_entry.name.endswith(".json"):
+                    stat = dir_entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                    total_size += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        """Removes every cached entry."""
+        with os.scandir(self.directory) as scan:
+            for dir_entry in scan:
+                if dir_entry.name.endswith(".json"):
+                    os.remove(dir_entry.path)
+
+    def stats(self):
+        """Returns the hit and miss counters."""
+        return {'hits': self.hits, 'misses': self.misses}
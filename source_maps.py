@@ -0,0 +1,231 @@
+# Resolves the bundled stack frames of failures to their original sources through local source maps
+###########################################
+
+import os  # For finding source maps
+import json  # For reading source maps
+import mmap  # For finding the sourceMappingURL comment of bundles
+import base64  # For inline source maps
+from array import array  # For the decoded mappings
+from bisect import bisect_right  # For finding the segment of a column
+from collections import OrderedDict  # For the parsed source map cache
+import consts  # For constants
+from failure_specs import clean_source_file, match_stack_frame  # For finding frames in reason lines
+
+_BASE64_VALUES = {char: value for value, char in enumerate(consts.SOURCE_MAP_BASE64_ALPHABET)}
+
+
+def _decode_segment(segment: str):
+    fields = []
+    value = shift = 0
+    for char in segment:
+        digit = _BASE64_VALUES[char]
+        value += (digit & 31) << shift
+        if digit & 32:
+            shift += 5
+        else:
+            # The lowest bit is the sign
+            fields.append(-(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    return fields
+
+
+def _decode_mappings(mappings: str):
+    """
+    Decodes the Base64 VLQ mappings of a source map into flat arrays: where each generated line's segments start,
+    and the generated column, source index (-1 when the segment has no source), original line and original column
+    of every segment, all 0-based. Bundles repeat the same few segments a lot, so each is decoded once.
+    """
+    line_starts = array('i', [0])
+    generated_columns = array('i')
+    source_indexes = array('i')
+    original_lines = array('i')
+    original_columns = array('i')
+    decoded = {}
+    # Every field but the generated column is relative to the previous segment of the whole map
+    source_index = original_line = original_column = 0
+    for line in mappings.split(";"):
+        generated_column = 0
+        for segment in line.split(","):
+            if not segment:
+                continue
+            fields = decoded.get(segment)
+            if fields is None:
+                fields = decoded[segment] = _decode_segment(segment)
+            generated_column += fields[0]
+            generated_columns.append(generated_column)
+            if len(fields) >= 4:
+                source_index += fields[1]
+                original_line += fields[2]
+                original_column += fields[3]
+                source_indexes.append(source_index)
+                original_lines.append(original_line)
+                original_columns.append(original_column)
+            else:
+                source_indexes.append(-1)
+                original_lines.append(0)
+                original_columns.append(0)
+        line_starts.append(len(generated_columns))
+    return line_starts, generated_columns, source_indexes, original_lines, original_columns
+
+
+class SourceMap:
+    """
+    The decoded mappings of one source map (version 3), kept as flat arrays so a generated position is found with
+    one binary search over the segments of its line.
+    """
+    __slots__ = ('sources', 'line_starts', 'generated_columns', 'source_indexes', 'original_lines',
+                 'original_columns')
+
+    def __init__(self, data: dict):
+        if 'sections' in data:
+            raise ValueError(consts.INDEX_SOURCE_MAP_MESSAGE)
+        source_root = data.get('sourceRoot') or ""
+        if source_root and not source_root.endswith("/"):
+            source_root += "/"
+        self.sources = [clean_source_file(source_root + (source or "")) for source in data.get('sources', [])]
+        (self.line_starts, self.generated_columns, self.source_indexes, self.original_lines,
+         self.original_columns) = _decode_mappings(data.get('mappings', ""))
+
+    @classmethod
+    def load(cls, path: str):
+        """Reads a .map file, or the inline source map of a bundle whose sourceMappingURL is a data URL."""
+        if path.endswith(consts.SOURCE_MAP_SUFFIX):
+            with open(path, 'r', encoding='utf-8') as file:
+                return cls(json.load(file))
+        url = _source_mapping_url(path)
+        if not url or not url.startswith("data:"):
+            raise ValueError(consts.NO_INLINE_SOURCE_MAP_MESSAGE.format(path))
+        header, _, payload = url.partition(",")
+        text = base64.b64decode(payload).decode('utf-8') if header.endswith(";base64") else payload
+        return cls(json.loads(text))
+
+    def original_position(self, line: int, column: int):
+        """Returns the (source, line, column) a 1-based generated position comes from, or None when it is unmapped."""
+        if line < 1 or line >= len(self.line_starts):
+            return None
+        start, end = self.line_starts[line - 1], self.line_starts[line]
+        # The segment starting at or before the column covers it
+        segment = bisect_right(self.generated_columns, column - 1, start, end) - 1
+        if segment < start or self.source_indexes[segment] < 0 or \
+                self.source_indexes[segment] >= len(self.sources):
+            return None
+        return (self.sources[self.source_indexes[segment]], self.original_lines[segment] + 1,
+                self.original_columns[segment] + 1)
+
+
+def _source_mapping_url(bundle_path: str):
+    """Returns the URL of the last sourceMappingURL comment of a bundle, or None."""
+    with open(bundle_path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            marker = mm.rfind(consts.SOURCE_MAPPING_URL_MARKER)
+            if marker == -1:
+                return None
+            start = marker + len(consts.SOURCE_MAPPING_URL_MARKER)
+            end = mm.find(b"\n", start)
+            return mm[start:end if end != -1 else len(mm)].decode('utf-8', errors='replace').strip()
+
+
+class SourceMapResolver:
+    """
+    Rewrites the stack frames of failure blocks that point into bundles (main.js:62460:17) to the original
+    sources (src/app/app.component.ts:12:5). The map of a bundle is its .map file next to it in one of the
+    directories, or the one its sourceMappingURL comment names or holds. Parsed maps stay in an LRU cache of
+    cache_entries maps, checked against the size and mtime of their file, so they are decoded once for every
+    frame of every report.
+    """
+
+    def __init__(self, directories, cache_entries: int = consts.SOURCE_MAP_CACHE_ENTRIES):
+        self.directories = [os.path.abspath(os.path.expanduser(directory)) for directory in directories]
+        self.cache_entries = max(1, cache_entries)
+        # Map path: (size, mtime_ns, SourceMap or None when it could not be read)
+        self._maps = OrderedDict()
+        # Frame file: its SourceMap or None, for the blocks being resolved, so frames cost no stat
+        self._located = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """Builds the resolver described by the source_maps section of the config, or None when it is disabled."""
+        source_maps_config = (config or {}).get('source_maps', {}) or {}
+        directories = source_maps_config.get('directories') or []
+        if not source_maps_config.get('enabled', False) or not directories:
+            return None
+        return cls(directories, source_maps_config.get('cache_entries', consts.SOURCE_MAP_CACHE_ENTRIES))
+
+    def __reduce__(self):
+        # Workers get their own empty cache
+        return SourceMapResolver, (self.directories, self.cache_entries)
+
+    def _locate(self, file: str):
+        relative = clean_source_file(file)
+        if not relative:
+            return None
+        for directory in self.directories:
+            for candidate in dict.fromkeys((relative, os.path.basename(relative))):
+                bundle_path = os.path.join(directory, candidate)
+                if os.path.isfile(bundle_path + consts.SOURCE_MAP_SUFFIX):
+                    return bundle_path + consts.SOURCE_MAP_SUFFIX
+                if not os.path.isfile(bundle_path):
+                    continue
+                try:
+                    url = _source_mapping_url(bundle_path)
+                except (OSError, ValueError):
+                    continue
+                if url and url.startswith("data:"):
+                    return bundle_path
+                if url:
+                    map_path = os.path.join(os.path.dirname(bundle_path), url.split("?", 1)[0])
+                    if os.path.isfile(map_path):
+                        return map_path
+        return None
+
+    def _load(self, map_path: str):
+        try:
+            stat = os.stat(map_path)
+        except OSError:
+            return None
+        entry = self._maps.get(map_path)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            self._maps.move_to_end(map_path)
+            return entry[2]
+        try:
+            source_map = SourceMap.load(map_path)
+        except (OSError, ValueError, KeyError, TypeError):
+            # A broken map is remembered too, until its file changes
+            source_map = None
+        self._maps[map_path] = (stat.st_size, stat.st_mtime_ns, source_map)
+        if len(self._maps) > self.cache_entries:
+            self._maps.popitem(last=False)
+        return source_map
+
+    def resolve(self, file: str, line: int, column: int):
+        """Returns the original (source, line, column) of a 1-based position in a bundle, or None."""
+        source_map = self._located.get(file, False)
+        if source_map is False:
+            map_path = self._locate(file)
+            source_map = self._located[file] = self._load(map_path) if map_path is not None else None
+        return source_map.original_position(line, column) if source_map is not None else None
+
+    def resolve_line(self, line: str) -> str:
+        """Returns the reason line with the position of its stack frame replaced by the original one."""
+        match = match_stack_frame(line)
+        if match is None:
+            return line
+        position = self.resolve(match.group('file'), int(match.group('line')), int(match.group('column')))
+        if position is None:
+            return line
+        return line[:match.start('file')] + consts.SOURCE_POSITION.format(*position) + line[match.end('column'):]
+
+    def resolve_block(self, block):
+        """Rewrites the stack frames of a failure block's reason lines in place."""
+        reason_lines = block.reason_lines
+        resolved = [self.resolve_line(line) for line in reason_lines]
+        if resolved != reason_lines:
+            block.reason_lines = resolved
+
+    def resolve_blocks(self, blocks):
+        """Resolves every block, looking each bundle up once since bundles may have been rebuilt since last time."""
+        self._located.clear()
+        for block in blocks:
+            self.resolve_block(block)
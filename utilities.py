@@ -55,7 +55,10 @@ def print_files_header_in_console():
 def input_file_to_select():
     """input with input message in green"""
     return input(
-        "\033[32m Choose a log file by number\n - Enter to Select Latest \n - \'r\' to refresh:  \033[0m")
+        "\033[32m Choose a log file by number\n - Enter to Select Latest \n"
+        " - \'f\' + number to follow a log while it is written (\'f\' alone follows the latest) \n"
+        " - \'d\' + number to compare that log with the latest (\'d\' alone compares the two latest) \n"
+        " - \'r\' to refresh:  \033[0m")
 
 
 def create_unique_filename(directory, prefix="report-at-time-", suffix=".txt"):